@@ -2,31 +2,116 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import csv
+import itertools
 import json
-import dateutil.parser
-import babel
+import os
+import re
+from datetime import datetime, timedelta
+import click
 import sys
-from flask import Flask, render_template, request, Response, flash, redirect, url_for,abort
+import threading
+import time
+from flask import Flask, Blueprint, current_app, render_template, request, Response, flash, redirect, url_for,abort, jsonify, stream_with_context
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
-from flask_wtf import Form
-from sqlalchemy import func
-from forms import *
-from config import SQLALCHEMY_DATABASE_URI
-from flask_migrate import Migrate
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.local import LocalProxy
+import sqlalchemy as sa
+from sqlalchemy import func, case, and_, or_, tuple_, true
+from sqlalchemy.dialects.postgresql import TSVECTOR, ExcludeConstraint
+from suggest import PrefixIndex
+from schedule import Schedules, overlaps
+from geo import GridIndex, geocode
+from ranking import TopN
+from cache import FragmentCache, PageCache, conditional
+import importer
+import exporter
+import database
+from metrics import Metrics
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-# DONE: connect to a local postgresql database
-
-app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
-db = SQLAlchemy(app)
+# the extensions and the routes are bound to an app by create_app(), so
+# importing this module builds nothing and connects to nothing
+db = SQLAlchemy(session_options={'class_': database.RoutingSession})
+moment = Moment()
+metrics = Metrics()
+page_cache = PageCache()
+fragment_cache = FragmentCache()
+bp = Blueprint('main', __name__, cli_group=None)
+
+# the indexes, feeds, schedules and other state kept in process; create_app()
+# builds them for each app into app.extensions['fyyur'] from the factories
+# given to app_local(), so apps of one process, like those of the tests,
+# share none of them
+app_locals = {}
+
+def app_local(name, factory):
+  # a proxy to the factory(app) of the current app
+  app_locals[name] = factory
+  return LocalProxy(lambda: current_app.extensions['fyyur'][name])
+
+def create_app(config='config'):
+  app = Flask(__name__)
+  app.config.from_object(config)
+  # DONE: connect to a local postgresql database
+
+  app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database.engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+  replica_uri = app.config.get('SQLALCHEMY_DATABASE_REPLICA_URI')
+  if replica_uri:
+    app.config['SQLALCHEMY_BINDS'] = {'replica': dict(database.engine_options(replica_uri, app.config), url=replica_uri)}
+  db.init_app(app)
+  moment.init_app(app)
+  if replica_uri:
+    database.route_reads(app)
+  database.report_queries(app)
+  metrics.init_app(app)
+  with app.app_context():
+    for engine in db.engines.values():
+      database.instrument(engine, app.config)
+      database.dispose_after_fork(engine)
+  page_cache.init_app(app)
+  fragment_cache.init_app(app)
+  app.extensions['fyyur'] = {name: factory(app) for name, factory in app_locals.items()}
+
+  # templates are compiled once and the bytecode kept on disk, so a new
+  # worker loads them instead of compiling; flask compile-templates fills it
+  if app.config['TEMPLATE_CACHE_DIR']:
+    os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])
+  app.jinja_env.filters['datetime'] = format_datetime
+
+  # flask db needs Flask-Migrate, but alembic is the slowest import of all,
+  # so only the app built by the flask command gets it
+  if click.get_current_context(silent=True) is not None:
+    from flask_migrate import Migrate
+    Migrate(app, db)
+
+  app.register_blueprint(bp)
+
+  if not app.debug:
+    file_handler = FileHandler('error.log')
+    file_handler.setFormatter(
+      Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+    )
+    app.logger.setLevel(logging.INFO)
+    file_handler.setLevel(logging.INFO)
+    app.logger.addHandler(file_handler)
+    app.logger.info('errors')
+  return app
+
+def __getattr__(name):
+  # the app of `from app import app`, flask --app app and the scripts,
+  # built on first use; servers can call create_app() themselves instead
+  if name == 'app':
+    global app
+    app = create_app()
+    return app
+  raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
@@ -37,8 +122,24 @@ class Show(db.Model):
   artist_id = db.Column(db.Integer,db.ForeignKey('Artist.id'), nullable=False)
   venue_id = db.Column(db.Integer,db.ForeignKey('Venue.id'), nullable=False)
   start_time = db.Column(db.DateTime, nullable=False)
+  # the show has the venue from start_time until end_time, SHOW_DURATION_MINUTES unless given
+  end_time = db.Column(db.DateTime, nullable=False, default=lambda context: show_end_time(
+    context.get_current_parameters()['start_time']))
+  updated_at = db.Column(db.DateTime, nullable=False, index=True, default=datetime.now, onupdate=datetime.now)
+  # whether the show is counted as past in the venue and artist counters,
+  # set when it is listed and by the rollover command once it has begun
+  is_past = db.Column(db.Boolean, nullable=False, default=False, server_default=sa.false())
   venue = db.relationship("Venue", back_populates="venue_relation")
   artist = db.relationship("Artist", back_populates="artist_relation")
+  __table_args__ = (
+    db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+    db.Index('ix_Show_rollover', 'start_time', postgresql_where=sa.text('NOT is_past'), sqlite_where=sa.text('NOT is_past')),
+    # no two shows of a venue overlap; elsewhere venue_schedules checks it
+    ExcludeConstraint((venue_id, '='), (func.tsrange(start_time, end_time), '&&'),
+                      name='ex_Show_venue_booking', using='gist').ddl_if(dialect='postgresql'),
+  )
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
@@ -50,7 +151,24 @@ class Venue(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    # the centre of the city from the geocode table in geo.py, None for cities not in it
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    # bumped on every edit and whenever the page of the venue changes
+    updated_at = db.Column(db.DateTime, nullable=False, index=True, default=datetime.now, onupdate=datetime.now)
+    # kept current by the show handlers and the counters commands
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # generated from name, city and state on postgres, unused elsewhere
+    search_vector = db.deferred(db.Column(TSVECTOR().with_variant(db.Text(), 'sqlite'), server_default=db.FetchedValue()))
     venue_relation = db.relationship("Show", back_populates="venue")
+    # the gin indexes, like their migrations, exist on postgres only
+    __table_args__ = (
+        db.Index('ix_Venue_state_city', 'state', 'city'),
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        db.Index('ix_Venue_search_vector', 'search_vector', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
 
 # DONE: implement any missing fields, as a database migration using Flask-Migrate
 
@@ -61,14 +179,81 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    # the genres of ArtistGenre as a set literal, copied for the pages and search
+    genres = db.Column(db.Text)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    # bumped on every edit and whenever the page of the artist changes
+    updated_at = db.Column(db.DateTime, nullable=False, index=True, default=datetime.now, onupdate=datetime.now)
+    # kept current by the show handlers and the counters commands
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # generated from name, city, state and genres on postgres, unused elsewhere
+    search_vector = db.deferred(db.Column(TSVECTOR().with_variant(db.Text(), 'sqlite'), server_default=db.FetchedValue()))
     artist_relation = db.relationship("Show", back_populates="artist")
+    # the gin indexes, like their migrations, exist on postgres only
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        db.Index('ix_Artist_search_vector', 'search_vector', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
 
+# the genres artists pick from, the choices of ArtistForm.genres; spelled
+# out so that importing the app does not import the forms
+GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop', 'Heavy Metal',
+          'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul', 'Other']
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)
+
+# the genres of each artist, indexed both ways for the genre filters
+artist_genre = db.Table('ArtistGenre',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_ArtistGenre_genre_id_artist_id', 'genre_id', 'artist_id'),
+)
+
+def genres_literal(genres):
+  # the set literal postgres stores for a list of genres, e.g. {Jazz,"Rock n Roll"}
+  return '{' + ','.join('"{}"'.format(genre) if ' ' in genre else genre for genre in genres) + '}'
+
+def genres_list(genres):
+  # the list of genres in a stored set literal, the reverse of genres_literal
+  genres = (genres or '').strip('{}')
+  return next(csv.reader([genres])) if genres else []
+
+def canonical_genre(name):
+  # the GENRES entry matching name in any case, or None
+  for genre in GENRES:
+    if genre.casefold() == (name or '').casefold():
+      return genre
+  return None
 
+genre_ids = app_local('genre_ids', lambda app: {})
+
+def load_genre_ids():
+  # name -> id of GENRES, adding the ones the Genre table lacks
+  if len(genre_ids) < len(GENRES):
+    genre_ids.update(db.session.query(Genre.name, Genre.id).all())
+    missing = [genre for genre in GENRES if genre not in genre_ids]
+    if missing:
+      db.session.execute(Genre.__table__.insert(), [{'name': genre} for genre in missing])
+      genre_ids.update(db.session.query(Genre.name, Genre.id).filter(Genre.name.in_(missing)).all())
+  return genre_ids
+
+def set_genres(artists):
+  # replaces the ArtistGenre rows of each (artist_id, genres) pair
+  artists = list(artists)
+  if not artists:
+    return
+  ids = load_genre_ids()
+  db.session.execute(sa.delete(artist_genre).where(artist_genre.c.artist_id.in_([id for id, genres in artists])))
+  rows = [{'artist_id': id, 'genre_id': ids[genre]} for id, genres in artists for genre in set(genres) if genre in ids]
+  if rows:
+    db.session.execute(artist_genre.insert(), rows)
 
-migrate = Migrate(app, db)
 # DONE: implement any missing fields, as a database migration using Flask-Migrate
 # DONE Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
@@ -77,6 +262,8 @@ migrate = Migrate(app, db)
 #----------------------------------------------------------------------------#
 
 def format_datetime(value, format='medium'):
+  import babel.dates
+  import dateutil.parser
   date = dateutil.parser.parse(value)
   if format == 'full':
       format="EEEE MMMM, d, y 'at' h:mma"
@@ -84,87 +271,539 @@ def format_datetime(value, format='medium'):
       format="EE MM, dd, y h:mma"
   return babel.dates.format_datetime(date, format)
 
-app.jinja_env.filters['datetime'] = format_datetime
+#----------------------------------------------------------------------------#
+# Pagination.
+#----------------------------------------------------------------------------#
+
+def encode_cursor(start_time, id):
+  # cursors are the (start_time, id) keyset of a show, e.g. 2020-10-21T16:05:04_12
+  return '{}_{}'.format(start_time.isoformat(), id)
+
+def decode_cursor(cursor):
+  if not cursor:
+    return None
+  try:
+    start_time, id = cursor.rsplit('_', 1)
+    return datetime.fromisoformat(start_time), int(id)
+  except ValueError:
+    abort(400)
+
+def split_shows(query, past_before=None):
+  # returns the upcoming shows of a query, one page of its past shows (newest
+  # first) and the cursor of the next past page, or None on the last page;
+  # split by is_past like the upcoming and past counters, so a show moves to
+  # the past list when the rollover command counts it as past
+  per_page = current_app.config['PAST_SHOWS_PER_PAGE']
+  upcoming = query.filter(Show.is_past == False).order_by(Show.start_time, Show.id).all()
+  past = query.filter(Show.is_past == True)
+  if past_before:
+    past = past.filter(tuple_(Show.start_time, Show.id) < past_before)
+  past = past.order_by(Show.start_time.desc(), Show.id.desc()).limit(per_page + 1).all()
+  cursor = None
+  if len(past) > per_page:
+    past = past[:per_page]
+    cursor = encode_cursor(past[-1].start_time, past[-1].id)
+  return upcoming, past, cursor
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+# the columns of each kind of row the exports and the JSON API can select,
+# by name; show rows carry the names and images of their venue and artist
+COLUMNS = {
+  'venues': (Venue.id, Venue.name, Venue.city, Venue.state, Venue.address, Venue.phone,
+             Venue.image_link, Venue.facebook_link, Venue.upcoming_shows_count, Venue.past_shows_count),
+  'artists': (Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone, Artist.genres,
+              Artist.image_link, Artist.facebook_link, Artist.upcoming_shows_count, Artist.past_shows_count),
+  'shows': (Show.id, Show.start_time, Show.end_time, Show.venue_id, Venue.name.label('venue_name'),
+            Venue.image_link.label('venue_image_link'), Show.artist_id, Artist.name.label('artist_name'),
+            Artist.image_link.label('artist_image_link')),
+}
+FIELDS = {kind: {column.key: column for column in columns} for kind, columns in COLUMNS.items()}
+
+def select_rows(kind, columns):
+  # a query of just these columns, show rows joined to their venue and artist
+  query = db.session.query(*columns)
+  if kind == 'shows':
+    query = query.join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id)
+  return query
+
+def venue_shows(venue_id):
+  #join the artist columns each show tile needs instead of loading them per show
+  return db.session.query(Show.id, Show.start_time, Show.artist_id, Artist.name.label('artist_name'),
+                          Artist.image_link.label('artist_image_link')) \
+    .join(Artist, Artist.id == Show.artist_id) \
+    .filter(Show.venue_id == venue_id)
+
+def artist_shows(artist_id):
+  #join the venue columns each show tile needs instead of loading them per show
+  return db.session.query(Show.id, Show.start_time, Show.venue_id, Venue.name.label('venue_name'),
+                          Venue.image_link.label('venue_image_link')) \
+    .join(Venue, Venue.id == Show.venue_id) \
+    .filter(Show.artist_id == artist_id)
+
+def genre_match(*genres):
+  # whether an artist plays one of genres, through the ArtistGenre index
+  return Artist.id.in_(db.session.query(artist_genre.c.artist_id)
+                       .join(Genre, Genre.id == artist_genre.c.genre_id)
+                       .filter(Genre.name.in_([canonical_genre(genre) or genre for genre in genres])))
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+# columns searched on each model, with the weight a match adds to the rank
+# of a result when full-text search is not available
+SEARCH_FIELDS = {
+  Venue: ((Venue.name, 4), (Venue.city, 2), (Venue.state, 2)),
+  Artist: ((Artist.name, 4), (Artist.city, 2), (Artist.state, 2), (Artist.genres, 1)),
+}
+
+def search_terms(search_term):
+  return re.findall(r'\w+', search_term.lower())
+
+def search_match(model, search_term):
+  # returns a (filter, rank) pair of expressions matching every word of
+  # search_term as a prefix against the search fields of model, an empty
+  # search matches everything and has no rank
+  terms = search_terms(search_term)
+  if not terms:
+    return true(), None
+  if db.engine.dialect.name == 'postgresql':
+    query = func.to_tsquery('simple', ' & '.join(term + ':*' for term in terms))
+    return model.search_vector.op('@@')(query), func.ts_rank_cd(model.search_vector, query)
+
+  # sqlite fallback for local testing: substring match, ranked by field weight
+  match = and_(*[or_(*[column.ilike('%{}%'.format(term)) for column, weight in SEARCH_FIELDS[model]])
+                 for term in terms])
+  rank = sum(case((column.ilike('%{}%'.format(term)), weight), else_=0)
+             for term in terms for column, weight in SEARCH_FIELDS[model])
+  return match, rank
+
+def search_page(query, rank, key, page):
+  # orders query by rank, ties broken by key, and returns one page of rows,
+  # the total number of matches and whether there is a next page
+  per_page = current_app.config['SEARCH_RESULTS_PER_PAGE']
+  query = query.add_columns(func.count().over().label('total'))
+  if rank is not None:
+    query = query.order_by(rank.desc())
+  rows = query.order_by(key) \
+    .limit(per_page + 1).offset((page - 1) * per_page).all()
+  total = rows[0].total if rows else 0
+  return rows[:per_page], total, len(rows) > per_page
+
+# the time each in-process index was last checked and the table_version()
+# it was built from, the models of each and the rebuilds under way
+index_checks = app_local('index_checks', lambda app: {})
+index_models = app_local('index_models', lambda app: {})
+index_rebuilds = app_local('index_rebuilds', lambda app: {})
+
+def table_version(*models):
+  # a row that changes with every insert, edit and delete of the models
+  return tuple(db.session.query(*[db.session.query(aggregate).scalar_subquery() for model in models
+                                  for aggregate in (func.count(model.id), func.max(model.updated_at))]).one())
+
+def load_index(index, models, build):
+  # builds index on first use; after that checks the table_version() of
+  # models every INDEX_CHECK_SECONDS, and when other processes or the flask
+  # commands changed them, rebuilds it in a thread while requests keep using
+  # it as it is, so no request waits on a rebuild. No lock is held while the
+  # database is read: under asgi.py the requests calling this are coroutines
+  # of one thread, which a thread lock would leave waiting on each other.
+  index_models[index] = models
+  checked = index_checks.get(index)
+  if checked and time.monotonic() - checked[0] < current_app.config['INDEX_CHECK_SECONDS']:
+    return index
+  version = table_version(*models)
+  if not checked:
+    build()
+  elif checked[1] != version:
+    rebuild = index_rebuilds.get(index)
+    if rebuild is None or not rebuild.is_alive():
+      index_rebuilds[index] = rebuild = threading.Thread(
+        target=rebuild_index, args=(current_app._get_current_object(), index, build), daemon=True)
+      rebuild.start()
+    # checked again after INDEX_CHECK_SECONDS, by when it is rebuilt
+    version = checked[1]
+  index_checks[index] = (time.monotonic(), version)
+  return index
+
+def rebuild_index(app, index, build):
+  # the version is read first, so the index holds at least what it counts
+  with app.app_context():
+    version = table_version(*index_models[index])
+    build()
+    index_checks[index] = (time.monotonic(), version)
+
+def index_written(*indexes):
+  # after a write of this process, which the handler has applied to the
+  # indexes: takes the version it left as theirs, so the next check does not
+  # rebuild them for it. A write of another process committed in the moment
+  # between the two is missed until the tables change again.
+  for index in indexes:
+    if index in index_checks:
+      index_checks[index] = (time.monotonic(), table_version(*index_models[index]))
+
+# venue and artist names for search-as-you-type, filled on first use and
+# kept current by the create, edit and delete handlers and load_index()
+name_index = app_local('name_index', lambda app: PrefixIndex(('venue', 'artist')))
+
+def load_name_index():
+  def build():
+    venues = db.session.query(Venue.id, Venue.name).all()
+    artists = db.session.query(Artist.id, Artist.name).all()
+    name_index.build([('venue', id, name) for id, name in venues] +
+                     [('artist', id, name) for id, name in artists])
+  return load_index(name_index, (Venue, Artist), build)
+
+# venue locations for /venues/nearby, filled on first use and kept current
+# by the create, edit and delete handlers and load_index()
+venue_locations = app_local('venue_locations', lambda app: GridIndex())
+
+def load_venue_locations():
+  return load_index(venue_locations, (Venue,), lambda: venue_locations.build(
+    db.session.query(Venue.id, Venue.latitude, Venue.longitude).filter(Venue.latitude.isnot(None)).all()))
+
+#----------------------------------------------------------------------------#
+# Bookings.
+#----------------------------------------------------------------------------#
+
+def show_end_time(start_time, duration=None):
+  return start_time + timedelta(minutes=duration or current_app.config['SHOW_DURATION_MINUTES'])
+
+# the shows of each venue as interval trees, for the double-booking check
+# where there is no exclusion constraint to make it; loaded per venue on
+# first use and again once the venue's updated_at moved, which count_shows
+# bumps with every show written, by this process or any other
+venue_schedules = app_local('venue_schedules', lambda app: Schedules(
+  lambda venue_id: db.session.query(Show.start_time, Show.end_time, Show.id).filter(Show.venue_id == venue_id).all(),
+  lambda venue_id: db.session.query(Venue.updated_at).filter(Venue.id == venue_id).scalar()))
+
+def schedules_in_process():
+  # postgres keeps venues from double-booking with ex_Show_venue_booking,
+  # other databases rely on venue_schedules
+  return db.engine.dialect.name != 'postgresql'
+
+def booking_conflict(venue_id, start_time, end_time):
+  # the id of a show of the venue overlapping [start_time, end_time), or None;
+  # postgres finds it in the GiST index of ex_Show_venue_booking
+  if not schedules_in_process():
+    return db.session.query(Show.id).filter(
+      Show.venue_id == venue_id,
+      func.tsrange(Show.start_time, Show.end_time).op('&&')(func.tsrange(start_time, end_time))).limit(1).scalar()
+  return venue_schedules.conflict(venue_id, start_time, end_time)
+
+#----------------------------------------------------------------------------#
+# Home page.
+#----------------------------------------------------------------------------#
+
+# the latest venues and artists and the venues with the most upcoming
+# shows, kept current by the handlers that change them so the home page
+# renders without a query; each is loaded again every HOME_FEED_TTL seconds
+VENUE_CARD = (Venue.id, Venue.name, Venue.city, Venue.state, Venue.image_link, Venue.upcoming_shows_count)
+ARTIST_CARD = (Artist.id, Artist.name, Artist.city, Artist.state, Artist.image_link)
+
+def home_feed(load):
+  # the app_local() factory of a feed sized by HOME_FEED_SIZE
+  return lambda app: TopN(load, app.config['HOME_FEED_SIZE'], app.config['HOME_FEED_TTL'])
+
+recent_venues = app_local('recent_venues', home_feed(
+  lambda limit: [((row.id,), row.id, row._asdict()) for row in
+                 db.session.query(*VENUE_CARD).order_by(Venue.id.desc()).limit(limit)]))
+recent_artists = app_local('recent_artists', home_feed(
+  lambda limit: [((row.id,), row.id, row._asdict()) for row in
+                 db.session.query(*ARTIST_CARD).order_by(Artist.id.desc()).limit(limit)]))
+busiest_venues = app_local('busiest_venues', home_feed(
+  lambda limit: [((row.upcoming_shows_count, row.id), row.id, row._asdict()) for row in
+                 db.session.query(*VENUE_CARD).filter(Venue.upcoming_shows_count > 0)
+                 .order_by(Venue.upcoming_shows_count.desc(), Venue.id.desc()).limit(limit)]))
+
+def venue_changed(venue_id):
+  # after a write to the venue or its shows; returns its VENUE_CARD row
+  venue = db.session.query(*VENUE_CARD).filter(Venue.id == venue_id).one()
+  recent_venues.put(venue.id, (venue.id,), venue._asdict())
+  if venue.upcoming_shows_count > 0:
+    busiest_venues.put(venue.id, (venue.upcoming_shows_count, venue.id), venue._asdict())
+  else:
+    busiest_venues.remove(venue.id)
+  return venue
+
+def artist_changed(artist_id):
+  artist = db.session.query(*ARTIST_CARD).filter(Artist.id == artist_id).one()
+  recent_artists.put(artist.id, (artist.id,), artist._asdict())
+
+def home_page():
+  return render_template('pages/home.html', recent_venues=recent_venues.top(),
+                         recent_artists=recent_artists.top(), busiest_venues=busiest_venues.top())
+
+#----------------------------------------------------------------------------#
+# Caching.
+#----------------------------------------------------------------------------#
+
+# cached pages are tagged with the rows they render, e.g. 'venue:1' for the
+# venue page, 'area:San Francisco|CA' for the /venues page listing that area
+# and 'show-artist:1' for pages with a show tile of artist 1
+
+def area_tag(city, state):
+  return 'area:{}|{}'.format(city, state)
+
+def invalidate_areas(*areas):
+  # evicts the /venues pages listing these (city, state) areas, and every
+  # /venues page when one of them was just added or emptied, as paging shifts
+  tags = [area_tag(city, state) for city, state in areas]
+  for city, state in areas:
+    if db.session.query(Venue.id).filter(Venue.city == city, Venue.state == state).limit(2).count() <= 1:
+      tags.append('areas')
+      break
+  page_cache.invalidate(*tags)
+
+def touch(model, *criteria):
+  # bumps updated_at of the matching rows, for writes that change the
+  # page of a row without editing it
+  db.session.query(model).filter(*criteria) \
+    .update({model.updated_at: datetime.now()}, synchronize_session=False)
+
+def count_shows(delta, *criteria):
+  # adds delta to the counters of the venues and artists of the matching
+  # shows in two batched updates, e.g. count_shows(-1, Show.venue_id == 1)
+  # before deleting the shows of venue 1
+  for model, key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+    shows = db.session.query(key.label('id'),
+                             func.count(case((Show.is_past == False, Show.id))).label('upcoming'),
+                             func.count(case((Show.is_past == True, Show.id))).label('past'),
+                             func.count(Show.id).label('total')) \
+      .filter(*criteria).group_by(key).subquery()
+    db.session.execute(sa.update(model).where(model.id == shows.c.id).values(
+      upcoming_shows_count=model.upcoming_shows_count + delta * shows.c.upcoming,
+      past_shows_count=model.past_shows_count + delta * shows.c.past,
+      shows_count=model.shows_count + delta * shows.c.total,
+    ))
+
+# pages list shows as upcoming or past by is_past, which only the rollover
+# command changes; its counter updates bump updated_at of the venues and
+# artists and it bumps the shows, so updated_at covers that move too
+
+def venue_validator(venue_id):
+  return db.session.query(Venue.updated_at).filter(Venue.id == venue_id).one_or_none()
+
+def artist_validator(artist_id):
+  return db.session.query(Artist.updated_at).filter(Artist.id == artist_id).one_or_none()
+
+def venues_validator():
+  return db.session.query(func.max(Venue.updated_at), func.count(Venue.id)).one()
+
+def artists_validator():
+  return db.session.query(func.max(Artist.updated_at), func.count(Artist.id)).one()
+
+def shows_validator():
+  # new shows and artist edits bump the venues of the affected shows; the
+  # count catches deleted shows, which leave no updated_at behind
+  return db.session.query(db.session.query(func.max(Venue.updated_at)).scalar_subquery(),
+                          db.session.query(func.max(Show.updated_at)).scalar_subquery(),
+                          db.session.query(func.count(Show.id)).scalar_subquery()).one()
+
+def calendar_validator():
+  # the default range starts today, so the page changes with the day too
+  return tuple(shows_validator()) + calendar_range()
+
+#----------------------------------------------------------------------------#
+# Export.
+#----------------------------------------------------------------------------#
+
+def stream_export(kind, format):
+  # yields every venue, artist or show as chunks of CSV or NDJSON; rows come
+  # through a server-side cursor EXPORT_BATCH_SIZE at a time, so memory does
+  # not grow with the table
+  columns = COLUMNS[kind]
+  rows = select_rows(kind, columns).order_by(columns[0]).yield_per(current_app.config['EXPORT_BATCH_SIZE'])
+  if kind == 'artists':
+    rows = (row[:5] + (genres_list(row[5]),) + row[6:] for row in rows)
+  return exporter.export_rows([column.key for column in columns], rows, format,
+                              current_app.config['EXPORT_BATCH_SIZE'])
+
+#----------------------------------------------------------------------------#
+# Calendar.
+#----------------------------------------------------------------------------#
+
+def calendar_range():
+  # the [start, end) datetimes of the days /calendar lists: from ?from=,
+  # today by default, through ?to= or CALENDAR_DAYS days, at most
+  # CALENDAR_MAX_DAYS days
+  import dateutil.parser
+  try:
+    first = dateutil.parser.parse(request.args['from']) if request.args.get('from') else datetime.now()
+    last = dateutil.parser.parse(request.args['to']) if request.args.get('to') else None
+  except (ValueError, OverflowError):
+    abort(400)
+  start = first.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+  end = start + timedelta(days=current_app.config['CALENDAR_DAYS'])
+  if last:
+    end = last.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None) + timedelta(days=1)
+  if end <= start:
+    abort(400)
+  return start, min(end, start + timedelta(days=current_app.config['CALENDAR_MAX_DAYS']))
+
+def feed_since():
+  # the first day of the shows in the .ics feeds, moving once a day
+  today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+  return today - timedelta(days=current_app.config['CALENDAR_FEED_PAST_DAYS'])
+
+def venue_feed_validator(venue_id):
+  # show and artist writes bump the venue, so a poll costs one primary key
+  # lookup and is answered 304 until something in the feed changes
+  row = db.session.query(Venue.updated_at).filter(Venue.id == venue_id).one_or_none()
+  return row and (row.updated_at, feed_since())
+
+def artist_feed_validator(artist_id):
+  row = db.session.query(Artist.updated_at).filter(Artist.id == artist_id).one_or_none()
+  return row and (row.updated_at, feed_since())
+
+def stream_calendar(name, *criteria):
+  # yields the shows matching criteria since feed_since() as an iCalendar
+  # feed, read through a server-side cursor EXPORT_BATCH_SIZE at a time
+  batch_size = current_app.config['EXPORT_BATCH_SIZE']
+  rows = select_rows('shows', (Show.id, Show.start_time, Show.end_time, Show.updated_at, Show.venue_id,
+                               Venue.name.label('venue_name'), Venue.address, Venue.city, Venue.state,
+                               Artist.name.label('artist_name'))) \
+    .filter(Show.start_time >= feed_since(), *criteria) \
+    .order_by(Show.start_time, Show.id).yield_per(batch_size)
+  host = request.host.split(':')[0]
+  # a feed names few venues, each in many events
+  venue_urls = {}
+  venue_url = lambda venue_id: venue_urls.get(venue_id) or venue_urls.setdefault(
+    venue_id, url_for('main.show_venue', venue_id=venue_id, _external=True))
+  events = ({
+    'uid': 'show-{}@{}'.format(row.id, host),
+    'start': row.start_time,
+    'end': row.end_time,
+    'stamp': row.updated_at,
+    'summary': '{} at {}'.format(row.artist_name, row.venue_name),
+    'location': ', '.join(part for part in (row.venue_name, row.address, row.city, row.state) if part),
+    'url': venue_url(row.venue_id),
+  } for row in rows)
+  return exporter.export_calendar(name, events, batch_size)
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@bp.route('/')
 def index():
-  return render_template('pages/home.html')
+  return home_page()
 
 
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@bp.route('/venues')
+@conditional(venues_validator)
+@page_cache.cached()
 def venues():
 
   # DONE: replace with real venues data.
   # #       num_shows should be aggregated based on number of upcoming shows per venue.
 
-  all_places = db.session.query(func.count(Venue.id), Venue.city, Venue.state).group_by(Venue.city, Venue.state).all()
-  data = []
+  # areas are paged only when ?page= is given, otherwise every area is listed
+  page = request.args.get('page', type=int)
+  per_page = current_app.config['VENUE_AREAS_PER_PAGE']
+
+  areas = db.session.query(Venue.city, Venue.state).group_by(Venue.city, Venue.state)
+  if page:
+    page = max(page, 1)
+    # fetch one extra area so we know if there is a next page
+    areas = areas.order_by(Venue.state, Venue.city).limit(per_page + 1).offset((page - 1) * per_page)
+  areas = areas.subquery()
 
-  for place in all_places:
-    place_venues = db.session.query(Venue).filter_by(state=place.state).filter_by(city=place.city).all()
-    my_venue = []
-    for venue in place_venues:
-      upcoming_num = db.session.query(Show).filter(Show.venue_id==venue.id).filter(Show.start_time>datetime.now()).count()
-      my_venue.append({
-        "id": venue.id,
-        "name": venue.name,
-        "num_upcoming_shows": upcoming_num
+  # one round trip: venues of the selected areas with their upcoming show counter
+  rows = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, Venue.updated_at,
+                          Venue.upcoming_shows_count.label('num_upcoming_shows')) \
+    .join(areas, and_(Venue.city == areas.c.city, Venue.state == areas.c.state)) \
+    .order_by(Venue.state, Venue.city, Venue.id).all()
+
+  data = []
+  page_cache.tag('areas')
+  for row in rows:
+    if not data or (data[-1]['city'], data[-1]['state']) != (row.city, row.state):
+      page_cache.tag(area_tag(row.city, row.state))
+      data.append({
+        "city": row.city,
+        "state": row.state,
+        "venues": []
       })
-    data.append({
-      "city": place.city,
-      "state": place.state,
-      "venues": my_venue
+    data[-1]['venues'].append({
+      "id": row.id,
+      "name": row.name,
+      "num_upcoming_shows": row.num_upcoming_shows,
+      "version": row.updated_at
     })
 
-  return render_template('pages/venues.html', areas=data)
+  has_next = bool(page) and len(data) > per_page
+  return render_template('pages/venues.html', areas=data[:per_page] if page else data,
+                         page=page, has_next=has_next)
 
-@app.route('/venues/search', methods=['POST'])
+@bp.route('/venues/search', methods=['GET', 'POST'])
 def search_venues():
   # DONE: implement search on Venues with partial string search. Ensure it is case-insensitive.
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  data = request.form
-  search_writing = data['search_term']
+  search_writing = request.values.get('search_term', '')
+  page = max(request.values.get('page', 1, type=int), 1)
 
-  # make query to get data related the search input
-  my_venues = db.session.query(Venue).filter(Venue.name.ilike('%{}%'.format(search_writing))).all()
+  # ranked full-text search over name, city and state
+  match, rank = search_match(Venue, search_writing)
+  query = db.session.query(Venue.id, Venue.name).filter(match)
+  my_venues, count, has_next = search_page(query, rank, Venue.id, page)
   response = {}
-  response['count'] = len(my_venues)
+  response['count'] = count
   response['data'] = my_venues
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/venues/<int:venue_id>')
+  return render_template('pages/search_venues.html', results=response, search_term=search_writing,
+                         page=page, has_next=has_next)
+
+@bp.route('/venues/nearby')
+def venues_nearby():
+  # JSON of the venues within ?radius= km of ?lat=, ?lon=, nearest first,
+  # with their upcoming show counts; ?limit= like the API lists. The grid
+  # index finds them, the database only loads the page of rows by id
+  latitude = request.args.get('lat', type=float)
+  longitude = request.args.get('lon', type=float)
+  radius = request.args.get('radius', current_app.config['NEARBY_RADIUS_KM'], type=float)
+  if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+    api_error(400, 'lat and lon are required, in degrees')
+  if not radius > 0:
+    api_error(400, 'radius has to be a positive number of km')
+  radius = min(radius, current_app.config['NEARBY_MAX_RADIUS_KM'])
+  limit = max(min(request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int),
+                  current_app.config['API_MAX_PAGE_SIZE']), 1)
+
+  nearest = load_venue_locations().nearest(latitude, longitude, radius, limit)
+  rows = {row.id: row for row in db.session.query(
+    Venue.id, Venue.name, Venue.city, Venue.state, Venue.address, Venue.latitude, Venue.longitude,
+    Venue.upcoming_shows_count).filter(Venue.id.in_([id for distance, id in nearest]))}
+  data = [dict(rows[id]._asdict(), distance_km=round(distance, 2)) for distance, id in nearest if id in rows]
+  return api_response({'data': data, 'radius_km': radius})
+
+@bp.route('/venues/<int:venue_id>')
+@conditional(venue_validator)
+@page_cache.cached()
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # DONE: replace with real venue data from the venues table, using venue_id
-  my_venue = db.session.query(Venue).filter(Venue.id == venue_id).one()
+  my_venue = db.session.query(Venue).filter(Venue.id == venue_id).one_or_none()
   if my_venue:
-    #make join to get all shows and their related artists according to given venue_id
+    upcoming, past, past_cursor = split_shows(venue_shows(venue_id), decode_cursor(request.args.get('past_before')))
 
-    all_shows = db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id)
     past_shows = []
     upcoming_shows = []
-    current_time = datetime.now()
-    for show in all_shows:
-      add_show = {
-        "artist_id": show.artist_id,
-        "artist_name": show.artist.name,
-        "artist_image_link": show.artist.image_link,
-        "start_time": show.start_time.strftime('%c')
-      }
-
-      #determine if show is past or coming
-      if (show.start_time < current_time):
-        past_shows.append(add_show)
-      else:
-        upcoming_shows.append(add_show)
+    for shows_list, rows in ((past_shows, past), (upcoming_shows, upcoming)):
+      for show in rows:
+        page_cache.tag('show-artist:{}'.format(show.artist_id))
+        shows_list.append({
+          "artist_id": show.artist_id,
+          "artist_name": show.artist_name,
+          "artist_image_link": show.artist_image_link,
+          "start_time": show.start_time.strftime('%c')
+        })
 
     data = {
       "id": my_venue.id,
@@ -177,21 +816,24 @@ def show_venue(venue_id):
       "image_link": my_venue.image_link,
       "past_shows": past_shows,
       "upcoming_shows": upcoming_shows,
-      "past_shows_count": len(past_shows),
-      "upcoming_shows_count": len(upcoming_shows),
+      "past_shows_count": my_venue.past_shows_count,
+      "upcoming_shows_count": my_venue.upcoming_shows_count,
+      "past_shows_cursor": past_cursor,
     }
+    page_cache.tag('venue:{}'.format(venue_id))
     return render_template('pages/show_venue.html', venue=data)
   else:
-    return render_template('errors/404.html')
+    return render_template('errors/404.html'), 404
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@bp.route('/venues/create', methods=['GET'])
 def create_venue_form():
+  from forms import VenueForm
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@bp.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   data = request.form
   name = data['name']
@@ -202,6 +844,8 @@ def create_venue_submission():
   image_link = data['image_link']
   facebook_link = data['facebook_link']
 
+  latitude, longitude = geocode(city, state)
+
   error = False
   try:
     new_venue = Venue(name=name,
@@ -211,8 +855,12 @@ def create_venue_submission():
                       phone=phone,
                       image_link=image_link,
                       facebook_link=facebook_link,
+                      latitude=latitude,
+                      longitude=longitude,
                       )
     db.session.add(new_venue)
+    db.session.flush()
+    venue_id = new_venue.id
     db.session.commit()
   except:
     error = True
@@ -223,6 +871,11 @@ def create_venue_submission():
   if error:
     flash('An error occurred. Venue ' + name + ' could not be listed.')
   else:
+    name_index.add('venue', venue_id, name)
+    venue_locations.add(venue_id, latitude, longitude)
+    index_written(name_index, venue_locations)
+    venue_changed(venue_id)
+    invalidate_areas((city, state))
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
   # DONE: insert form data as a new Venue record in the db, instead
   # DONE: modify data to be the data object returned from db insertion
@@ -232,14 +885,19 @@ def create_venue_submission():
   # DONE: on unsuccessful db insert, flash an error instead.
   # e.g., flash('An error occurred. Venue ' + data.name + ' could not be listed.')
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
-  return render_template('pages/home.html')
+  return home_page()
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@bp.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   # DONE: Complete this endpoint for taking a venue_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
   error = False
+  area = db.session.query(Venue.city, Venue.state).filter(Venue.id == venue_id).one_or_none()
+  artist_ids = [id for id, in db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
   try:
+    # the shows of the venue go with it, off the counters of their artists
+    count_shows(-1, Show.venue_id == venue_id)
+    db.session.query(Show).filter(Show.venue_id == venue_id).delete()
     db.session.query(Venue).filter(Venue.id == venue_id).delete()
     db.session.commit()
   except:
@@ -251,92 +909,159 @@ def delete_venue(venue_id):
   if error:
     flash('Error! record can not be deleted!')
   else:
+    name_index.remove('venue', venue_id)
+    venue_locations.remove(venue_id)
+    index_written(name_index, venue_locations)
+    recent_venues.remove(venue_id)
+    busiest_venues.remove(venue_id)
+    venue_schedules.forget(venue_id)
+    page_cache.invalidate('venue:{}'.format(venue_id), 'show-venue:{}'.format(venue_id), 'shows',
+                          *['artist:{}'.format(id) for id in artist_ids])
+    if area:
+      invalidate_areas(tuple(area))
     flash('Record was successfully deleted!')
-  return None
+  return jsonify({'success': not error})
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@bp.route('/artists')
+@conditional(artists_validator)
+@page_cache.cached()
 def artists():
 
   # DONE: replace with real data returned from querying the database
 
 
-  all_artists = db.session.query(Artist.id, Artist.name)
+  # ?genre= (repeatable) keeps the artists playing one of the genres
+  selected = [genre for genre in map(canonical_genre, request.args.getlist('genre')) if genre]
+  all_artists = db.session.query(Artist.id, Artist.name, Artist.updated_at)
+  if selected:
+    all_artists = all_artists.filter(genre_match(*selected))
   data = []
-  for artist in all_artists:
+  for artist in all_artists.order_by(Artist.id):
     data.append({
       "id": artist[0],
-      "name": artist[1]
+      "name": artist[1],
+      "version": artist[2]
+    })
+  page_cache.tag('artists')
+  return render_template('pages/artists.html', artists=data, genres=GENRES, selected=selected)
+
+@bp.route('/genres/<name>')
+@page_cache.cached()
+def show_genre(name):
+  # the artists of a genre, busiest first, each with their next few shows
+  genre = canonical_genre(name)
+  if genre is None:
+    return render_template('errors/404.html'), 404
+  page = max(request.args.get('page', 1, type=int), 1)
+  per_page = current_app.config['GENRE_ARTISTS_PER_PAGE']
+
+  artists = db.session.query(Artist.id, Artist.name, Artist.image_link, Artist.upcoming_shows_count) \
+    .join(artist_genre, artist_genre.c.artist_id == Artist.id) \
+    .join(Genre, Genre.id == artist_genre.c.genre_id) \
+    .filter(Genre.name == genre) \
+    .order_by(Artist.upcoming_shows_count.desc(), Artist.id) \
+    .limit(per_page + 1).offset((page - 1) * per_page).all()
+  has_next = len(artists) > per_page
+  artists = artists[:per_page]
+
+  # the first shows of every artist on the page in one query
+  number = func.row_number().over(partition_by=Show.artist_id, order_by=(Show.start_time, Show.id)).label('number')
+  upcoming = db.session.query(Show.artist_id, Show.start_time, Show.venue_id, Venue.name.label('venue_name'), number) \
+    .join(Venue, Venue.id == Show.venue_id) \
+    .filter(Show.artist_id.in_([artist.id for artist in artists]), Show.start_time >= datetime.now()) \
+    .subquery()
+  shows = {}
+  for show in db.session.query(upcoming).filter(upcoming.c.number <= current_app.config['GENRE_SHOWS_PER_ARTIST']) \
+      .order_by(upcoming.c.artist_id, upcoming.c.number):
+    page_cache.tag('show-venue:{}'.format(show.venue_id))
+    shows.setdefault(show.artist_id, []).append({
+      "venue_id": show.venue_id,
+      "venue_name": show.venue_name,
+      "start_time": show.start_time.isoformat()
+    })
+
+  data = []
+  page_cache.tag('genre:{}'.format(genre))
+  for artist in artists:
+    page_cache.tag('artist:{}'.format(artist.id))
+    data.append({
+      "id": artist.id,
+      "name": artist.name,
+      "image_link": artist.image_link,
+      "upcoming_shows_count": artist.upcoming_shows_count,
+      "upcoming_shows": shows.get(artist.id, [])
     })
-  return render_template('pages/artists.html', artists=data)
+  return render_template('pages/genre.html', genre=genre, artists=data, page=page, has_next=has_next)
 
-@app.route('/artists/search', methods=['POST'])
+@bp.route('/artists/search', methods=['GET', 'POST'])
 def search_artists():
   # DONE: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
+  search_writing = request.values.get('search_term', '')
+  page = max(request.values.get('page', 1, type=int), 1)
 
-  data = request.form
-  search_writing = data['search_term']
-
-  #get data from database according to given search value
-  my_artists = db.session.query(Artist).filter(Artist.name.ilike('%{}%'.format(search_writing))).all()
+  # ranked full-text search over name, city, state and genres
+  match, rank = search_match(Artist, search_writing)
+  query = db.session.query(Artist.id, Artist.name).filter(match)
+  my_artists, count, has_next = search_page(query, rank, Artist.id, page)
   response = {}
-  response['count'] = len(my_artists)
+  response['count'] = count
   response['data'] = my_artists
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_artists.html', results=response, search_term=search_writing,
+                         page=page, has_next=has_next)
 
-@app.route('/artists/<int:artist_id>')
+@bp.route('/artists/<int:artist_id>')
+@conditional(artist_validator)
+@page_cache.cached()
 def show_artist(artist_id):
-  # shows the venue page with the given venue_id
-  # DONR: replace with real venue data from the venues table, using venue_id
-  my_artist = db.session.query(Artist).filter(Artist.id == artist_id).one()
+  # shows the artist page with the given artist_id
+  # DONE: replace with real artist data from the artists table, using artist_id
+  my_artist = db.session.query(Artist).filter(Artist.id == artist_id).one_or_none()
   if my_artist:
+    upcoming, past, past_cursor = split_shows(artist_shows(artist_id), decode_cursor(request.args.get('past_before')))
 
-    # make join to get all shows and their related venues according to given artist_id
-    all_shows = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id)
     past_shows = []
     upcoming_shows = []
-    current_time = datetime.now()
-    for show in all_shows:
-      add_show = {
-        "venue_id": show.artist_id,
-        "venue_name": show.venue.name,
-        "venue_image_link": show.venue.image_link,
-        "start_time": show.start_time.strftime('%c')
-      }
-
-      #determine if show is past or coming
-      if (show.start_time < current_time):
-        past_shows.append(add_show)
-      else:
-        upcoming_shows.append(add_show)
+    for shows_list, rows in ((past_shows, past), (upcoming_shows, upcoming)):
+      for show in rows:
+        page_cache.tag('show-venue:{}'.format(show.venue_id))
+        shows_list.append({
+          "venue_id": show.venue_id,
+          "venue_name": show.venue_name,
+          "venue_image_link": show.venue_image_link,
+          "start_time": show.start_time.isoformat()
+        })
 
     data = {
       "id": my_artist.id,
       "name": my_artist.name,
       "city": my_artist.city,
       "state": my_artist.state,
-      "genres": my_artist.genres.replace('{', '').replace('}', '').split(','),
+      "genres": genres_list(my_artist.genres),
       "phone": my_artist.phone,
       "facebook_link": my_artist.facebook_link,
       "image_link": my_artist.image_link,
       "past_shows": past_shows,
       "upcoming_shows": upcoming_shows,
-      "past_shows_count": len(past_shows),
-      "upcoming_shows_count": len(upcoming_shows),
+      "past_shows_count": my_artist.past_shows_count,
+      "upcoming_shows_count": my_artist.upcoming_shows_count,
+      "past_shows_cursor": past_cursor,
     }
-    return render_template('pages/show_venue.html', venue=data)
+    page_cache.tag('artist:{}'.format(artist_id))
+    return render_template('pages/show_artist.html', artist=data)
   else:
-    return render_template('errors/404.html')
+    return render_template('errors/404.html'), 404
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
+  from forms import ArtistForm
   form = ArtistForm()
 
   #get record that needs to be changed from our database
@@ -346,7 +1071,7 @@ def edit_artist(artist_id):
     form.city.data = my_artist.city
     form.state.data = my_artist.state
     form.phone.data = my_artist.phone
-    form.genres.data = my_artist.genres
+    form.genres.data = genres_list(my_artist.genres)
     form.facebook_link.data = my_artist.facebook_link
     form.image_link.data = my_artist.image_link
     return render_template('forms/edit_artist.html', form=form, artist=my_artist)
@@ -355,12 +1080,13 @@ def edit_artist(artist_id):
   # DONE: populate form with fields from artist with ID <artist_id>
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   # DONE: take values from the form submitted, and update existing
   # artist record with ID <artist_id> using the new attributes
 
   my_artist = db.session.query(Artist).filter(Artist.id == artist_id).one()
+  old_genres = genres_list(my_artist.genres)
   data = request.form
   name = data['name']
   city = data['city']
@@ -373,13 +1099,15 @@ def edit_artist_submission(artist_id):
 
   try:
     #applying changes to the row
-    my_artist.name = name,
-    my_artist.city = city,
-    my_artist.state = state,
-    my_artist.phone = phone,
-    my_artist.genres = genres,
-    my_artist.image_link = image_link,
-    my_artist.facebook_link = facebook_link,
+    my_artist.name = name
+    my_artist.city = city
+    my_artist.state = state
+    my_artist.phone = phone
+    my_artist.genres = genres_literal(genres)
+    my_artist.image_link = image_link
+    my_artist.facebook_link = facebook_link
+    set_genres([(artist_id, genres)])
+    touch(Venue, Venue.id.in_(db.session.query(Show.venue_id).filter(Show.artist_id == artist_id)))
     db.session.commit()
   except:
     error = True
@@ -390,10 +1118,16 @@ def edit_artist_submission(artist_id):
   if error:
     flash('An error occurred. Artist ' + name + ' could not be updated.')
   else:
-    return redirect(url_for('show_artist', artist_id=artist_id))
-
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+    name_index.add('artist', artist_id, name)
+    index_written(name_index)
+    artist_changed(artist_id)
+    page_cache.invalidate('artists', 'artist:{}'.format(artist_id), 'show-artist:{}'.format(artist_id),
+                          *['genre:{}'.format(genre) for genre in set(old_genres) | set(genres)])
+    return redirect(url_for('main.show_artist', artist_id=artist_id))
+
+@bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
+  from forms import VenueForm
   form = VenueForm()
 
   #get venue record that needs to be changed
@@ -411,12 +1145,13 @@ def edit_venue(venue_id):
     return render_template('errors/404.html')
   # DONE: populate form with values from venue with ID <venue_id>
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   # DONE: take values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes
 
   my_venue = db.session.query(Venue).filter(Venue.id == venue_id).one()
+  old_area = (my_venue.city, my_venue.state)
   data = request.form
   name = data['name']
   city = data['city']
@@ -429,13 +1164,15 @@ def edit_venue_submission(venue_id):
 
   try:
     #updating the values to the defined Venue object
-    my_venue.name = name,
-    my_venue.city = city,
-    my_venue.state = state,
-    my_venue.address = address,
-    my_venue.phone = phone,
-    my_venue.image_link = image_link,
-    my_venue.facebook_link = facebook_link,
+    my_venue.name = name
+    my_venue.city = city
+    my_venue.state = state
+    my_venue.address = address
+    my_venue.phone = phone
+    my_venue.image_link = image_link
+    my_venue.facebook_link = facebook_link
+    my_venue.latitude, my_venue.longitude = geocode(city, state)
+    touch(Artist, Artist.id.in_(db.session.query(Show.artist_id).filter(Show.venue_id == venue_id)))
     db.session.commit()
   except:
     error = True
@@ -447,17 +1184,24 @@ def edit_venue_submission(venue_id):
   if error:
     flash('An error occurred. Venue ' + name + ' could not be updated.')
   else:
-    return redirect(url_for('show_venue', venue_id=venue_id))
+    name_index.add('venue', venue_id, name)
+    venue_locations.add(venue_id, *geocode(city, state))
+    index_written(name_index, venue_locations)
+    venue_changed(venue_id)
+    page_cache.invalidate('venue:{}'.format(venue_id), 'show-venue:{}'.format(venue_id))
+    invalidate_areas(old_area, (city, state))
+    return redirect(url_for('main.show_venue', venue_id=venue_id))
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@bp.route('/artists/create', methods=['GET'])
 def create_artist_form():
+  from forms import ArtistForm
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@bp.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
   # DONE: insert form data as a new Venue record in the db, instead
@@ -478,11 +1222,14 @@ def create_artist_submission():
                         city=city,
                         state=state,
                         phone=phone,
-                        genres=genres,
+                        genres=genres_literal(genres),
                         image_link=image_link,
                         facebook_link=facebook_link,
                         )
     db.session.add(new_artist)
+    db.session.flush()
+    artist_id = new_artist.id
+    set_genres([(artist_id, genres)])
     db.session.commit()
   except:
     error = True
@@ -493,49 +1240,118 @@ def create_artist_submission():
   if error:
     flash('An error occurred. Artist ' + name + ' could not be listed.')
   else:
+    name_index.add('artist', artist_id, name)
+    index_written(name_index)
+    artist_changed(artist_id)
+    page_cache.invalidate('artists', *['genre:{}'.format(genre) for genre in genres])
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
 
   # on successful db insert, flash success
 
   # DONE: on unsuccessful db insert, flash an error instead.
   # e.g., flash('An error occurred. Artist ' + data.name + ' could not be listed.')
-  return render_template('pages/home.html')
+  return home_page()
 
 
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@bp.route('/shows')
+@conditional(shows_validator)
+@page_cache.cached()
 def shows():
   # displays list of shows at /shows
   # Done: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data = []
 
-  #query all_shows rows in the Show table
-  all_shows = db.session.query(Show.artist_id, Show.venue_id, Show.start_time).all()
+  # keyset pagination on (start_time, id): the first page starts at the
+  # shows not yet counted as past, ?after= walks forward in time and
+  # ?before= walks back into past shows
+  per_page = current_app.config['SHOWS_PER_PAGE']
+  after = decode_cursor(request.args.get('after'))
+  before = decode_cursor(request.args.get('before'))
+  key = tuple_(Show.start_time, Show.id)
+
+  #one joined query with only the columns shows.html renders
+  query = select_rows('shows', [FIELDS['shows'][name] for name in
+                                ('id', 'start_time', 'venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link')] +
+                      [Show.updated_at, Venue.updated_at.label('venue_updated_at'), Artist.updated_at.label('artist_updated_at')])
+  if before:
+    query = query.filter(key < before).order_by(Show.start_time.desc(), Show.id.desc())
+  else:
+    query = query.filter(key > after if after else Show.is_past == False).order_by(Show.start_time, Show.id)
+  all_shows = query.limit(per_page + 1).all()
+
+  has_more = len(all_shows) > per_page
+  all_shows = all_shows[:per_page]
+  if before:
+    all_shows.reverse()
+
+  data = []
+  page_cache.tag('shows')
   for show in all_shows:
+    page_cache.tag('show-venue:{}'.format(show.venue_id), 'show-artist:{}'.format(show.artist_id))
+    data.append({
+      "venue_id": show.venue_id,
+      "venue_name": show.venue_name,
+      "artist_id": show.artist_id,
+      "artist_name": show.artist_name,
+      "artist_image_link": show.artist_image_link,
+      "start_time": show.start_time.strftime("%c"),
+      # the tile shows the venue and artist names, so their edits count too
+      "version": max(show.updated_at, show.venue_updated_at, show.artist_updated_at)
+    })
 
-    #get artist row and venue row related to every show
-    artist = db.session.query(Artist.name, Artist.image_link).filter(Artist.id == show[0]).one()
-    venue = db.session.query(Venue.name).filter(Venue.id == show[1]).one()
+  next_cursor = prev_cursor = None
+  if all_shows:
+    if has_more or before:
+      next_cursor = encode_cursor(all_shows[-1].start_time, all_shows[-1].id)
+    if has_more or not before:
+      prev_cursor = encode_cursor(all_shows[0].start_time, all_shows[0].id)
+  return render_template('pages/shows.html', shows=data, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+@bp.route('/shows/search', methods=['GET', 'POST'])
+def search_shows():
+  # shows whose artist or venue matches the search, best matches first
+  search_writing = request.values.get('search_term', '')
+  page = max(request.values.get('page', 1, type=int), 1)
+
+  artist_match, artist_rank = search_match(Artist, search_writing)
+  venue_match, venue_rank = search_match(Venue, search_writing)
+  query = select_rows('shows', [FIELDS['shows'][name] for name in
+                                ('id', 'start_time', 'artist_id', 'artist_name', 'venue_id', 'venue_name')]) \
+    .filter(or_(artist_match, venue_match))
+  rank = artist_rank + venue_rank if artist_rank is not None else None
+  my_shows, count, has_next = search_page(query, rank, Show.id, page)
+  response = {}
+  response['count'] = count
+  response['data'] = my_shows
+  return render_template('pages/show.html', results=response, search_term=search_writing,
+                         page=page, has_next=has_next)
+
+@bp.route('/search/suggest')
+def search_suggest():
+  # venue and artist names starting with q, for the header search boxes
+  limit = min(request.args.get('limit', current_app.config['SUGGEST_LIMIT'], type=int), 50)
+  matches = load_name_index().search(request.args.get('q', ''), limit)
+  data = []
+  for kind, id, name in matches:
     data.append({
-      "venue_id": show[1],
-      "venue_name": venue[0],
-      "artist_id": show[0],
-      "artist_name": artist[0],
-      "artist_image_link": artist[1],
-      "start_time": show[2].strftime("%c")
+      "type": kind,
+      "id": id,
+      "name": name,
+      "url": url_for('main.show_' + kind, **{kind + '_id': id})
     })
-  return render_template('pages/shows.html', shows=data)
+  return jsonify(data)
 
-@app.route('/shows/create')
+@bp.route('/shows/create')
 def create_shows():
   # renders form. do not touch.
+  from forms import ShowForm
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@bp.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
   # DONE: insert form data as a new Show record in the db, instead
@@ -544,11 +1360,46 @@ def create_show_submission():
   artist_id = data['artist_id']
   venue_id = data['venue_id']
   start_time = data['start_time']
+  # the duration goes through ShowForm's range check before it reaches the
+  # schedules; start_time keeps the lenient parsing below
+  from forms import ShowForm
+  form = ShowForm(data)
+  if not form.duration.validate(form):
+    flash('{} Show could not be listed.'.format(form.duration.errors[0]))
+    return home_page()
   error=False
+  conflict = None
+  import dateutil.parser
   try:
-    new_show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
-    db.session.add(new_show)
-    db.session.commit()
+    start_time = dateutil.parser.parse(start_time)
+    end_time = show_end_time(start_time, form.duration.data)
+    venue_id = int(venue_id)
+    in_process = schedules_in_process()
+    # checked and booked under the venue's lock, so two requests of this
+    # process cannot both take the same slot
+    with venue_schedules.locked(venue_id):
+      for attempt in range(3):
+        conflict = booking_conflict(venue_id, start_time, end_time)
+        if conflict is not None:
+          break
+        new_show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time, end_time=end_time,
+                        is_past=start_time < datetime.now())
+        db.session.add(new_show)
+        db.session.flush()
+        # the insert holds the sqlite write lock until the commit: when
+        # another process booked the venue since the check, check again
+        if in_process and venue_schedules.stale(venue_id):
+          db.session.rollback()
+          continue
+        # also bumps updated_at of the venue and the artist
+        count_shows(1, Show.id == new_show.id)
+        show_id, version = new_show.id, venue_schedules.version(venue_id) if in_process else None
+        db.session.commit()
+        if in_process:
+          venue_schedules.booked(venue_id, start_time, end_time, show_id, version)
+        break
+      else:
+        raise RuntimeError('venue {} kept changing while it was checked'.format(venue_id))
   except:
     error = True
     db.session.rollback()
@@ -557,9 +1408,17 @@ def create_show_submission():
     db.session.close()
   if error:
     flash('An error occurred. Show could not be listed.')
+  elif conflict is not None:
+    flash('The venue is already booked at that time by show {}. Show could not be listed.'.format(conflict))
   else:
+    # count_shows bumped updated_at of the venue and the artist, and left
+    # their names and locations as they were
+    index_written(name_index, venue_locations)
+    venue = venue_changed(venue_id)
+    page_cache.invalidate('shows', 'venue:{}'.format(venue_id), 'artist:{}'.format(artist_id),
+                          area_tag(venue.city, venue.state))
     flash('Show was successfully listed!')
-  return render_template('pages/home.html')
+  return home_page()
 
   # on successful db insert, flash success
 
@@ -567,26 +1426,540 @@ def create_show_submission():
   # e.g., flash('An error occurred. Show could not be listed.')
   # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
 
+@bp.route('/shows/<int:show_id>', methods=['DELETE'])
+def delete_show(show_id):
+  error = False
+  show = db.session.query(Show.venue_id, Show.artist_id).filter(Show.id == show_id).one_or_none()
+  try:
+    count_shows(-1, Show.id == show_id)
+    db.session.query(Show).filter(Show.id == show_id).delete()
+    version = venue_schedules.version(show.venue_id) if show and schedules_in_process() else None
+    db.session.commit()
+  except:
+    db.session.rollback()
+    error = True
+    print(sys.exc_info())
+  finally:
+    db.session.close()
+  if error or not show:
+    flash('Error! record can not be deleted!')
+  else:
+    # count_shows bumped updated_at of the venue and the artist, and left
+    # their names and locations as they were
+    index_written(name_index, venue_locations)
+    if schedules_in_process():
+      venue_schedules.cancelled(show.venue_id, show_id, version)
+    venue = venue_changed(show.venue_id)
+    page_cache.invalidate('shows', 'venue:{}'.format(show.venue_id), 'artist:{}'.format(show.artist_id),
+                          area_tag(venue.city, venue.state))
+    flash('Record was successfully deleted!')
+  return jsonify({'success': not error and show is not None})
 
 
-@app.errorhandler(404)
+
+@bp.route('/export/<any(venues, artists, shows):kind>.<any(csv, ndjson):format>')
+def export(kind, format):
+  # e.g. /export/shows.csv, sent chunk by chunk as the rows are read
+  response = Response(stream_with_context(stream_export(kind, format)), mimetype=exporter.MIMETYPES[format])
+  response.headers['Content-Disposition'] = 'attachment; filename={}.{}'.format(kind, format)
+  return response
+#  Calendar
+#  ----------------------------------------------------------------
+
+@bp.route('/calendar')
+@conditional(calendar_validator)
+@page_cache.cached()
+def calendar():
+  # shows by day between ?from= and ?to=, with the ?city=, ?state=,
+  # ?venue_id= and ?artist_id= filters of /api/v1/shows; each is a range
+  # scan of a start_time index, on its own or after venue_id or artist_id
+  start, end = calendar_range()
+  limit = current_app.config['CALENDAR_MAX_SHOWS']
+  criteria = area_criteria() + [Show.start_time >= start, Show.start_time < end]
+  for name, column in (('venue_id', Show.venue_id), ('artist_id', Show.artist_id)):
+    if request.args.get(name):
+      criteria.append(column == request.args.get(name, 0, type=int))
+  rows = select_rows('shows', [FIELDS['shows'][name] for name in
+                               ('id', 'start_time', 'end_time', 'venue_id', 'venue_name', 'artist_id', 'artist_name')]) \
+    .filter(*criteria).order_by(Show.start_time, Show.id).limit(limit + 1).all()
+
+  page_cache.tag('shows')
+  if request.args.get('city') and request.args.get('state'):
+    page_cache.tag(area_tag(request.args['city'], request.args['state']))
+  days = []
+  for day, shows in itertools.groupby(rows[:limit], key=lambda row: row.start_time.date()):
+    data = []
+    for show in shows:
+      page_cache.tag('show-venue:{}'.format(show.venue_id), 'show-artist:{}'.format(show.artist_id))
+      data.append({
+        "venue_id": show.venue_id,
+        "venue_name": show.venue_name,
+        "artist_id": show.artist_id,
+        "artist_name": show.artist_name,
+        "start_time": show.start_time.strftime('%H:%M'),
+        "end_time": show.end_time.strftime('%H:%M'),
+      })
+    days.append({"date": day.strftime('%A %d %B %Y'), "shows": data})
+
+  filters = {name: request.args[name] for name in ('city', 'state', 'venue_id', 'artist_id') if request.args.get(name)}
+  # the ranges of the same length just before and after this one
+  last_day, span = end - timedelta(days=1), end - start
+  earlier = dict(filters, **{'from': (start - span).date().isoformat(), 'to': (start - timedelta(days=1)).date().isoformat()})
+  later = dict(filters, **{'from': end.date().isoformat(), 'to': (last_day + span).date().isoformat()})
+  return render_template('pages/calendar.html', days=days, filters=filters, truncated=len(rows) > limit,
+                         start=start, last_day=last_day, earlier=earlier, later=later)
+
+@bp.route('/venues/<int:venue_id>/calendar.ics')
+@conditional(venue_feed_validator)
+def venue_calendar(venue_id):
+  # the venue's shows for calendar apps to subscribe to, sent chunk by chunk
+  venue = db.session.query(Venue.name).filter(Venue.id == venue_id).one_or_none()
+  if venue is None:
+    abort(404)
+  return Response(stream_with_context(stream_calendar(venue.name, Show.venue_id == venue_id)),
+                  mimetype=exporter.MIMETYPES['ics'])
+
+@bp.route('/artists/<int:artist_id>/calendar.ics')
+@conditional(artist_feed_validator)
+def artist_calendar(artist_id):
+  artist = db.session.query(Artist.name).filter(Artist.id == artist_id).one_or_none()
+  if artist is None:
+    abort(404)
+  return Response(stream_with_context(stream_calendar(artist.name, Show.artist_id == artist_id)),
+                  mimetype=exporter.MIMETYPES['ics'])
+
+#  API
+#  ----------------------------------------------------------------
+#  read-only JSON versions of the pages above, e.g.
+#  /api/v1/shows?city=San Francisco&from=2024-01-01&fields=id,start_time,artist_name&limit=20
+#  lists take ?fields=, ?limit= and the ?after= cursor from the "next" of the
+#  previous page; venue and artist details also take the upcoming_shows and
+#  past_shows fields, paged with ?past_before= like the HTML pages
+
+def api_response(payload, status=200):
+  # compact JSON with dates in ISO 8601
+  return Response(json.dumps(payload, separators=(',', ':'), default=lambda value: value.isoformat()),
+                  status=status, mimetype='application/json')
+
+def api_error(status, message):
+  abort(api_response({'error': message}, status))
+
+def api_fields(kind, extra=()):
+  # the field names given by ?fields=, every column of kind by default
+  names = [name for name in request.args.get('fields', '').split(',') if name]
+  unknown = [name for name in names if name not in FIELDS[kind] and name not in extra]
+  if unknown:
+    api_error(400, 'unknown fields: ' + ', '.join(unknown))
+  return names or list(FIELDS[kind])
+
+def api_value(name, value):
+  return genres_list(value) if name == 'genres' else value
+
+def api_date(name):
+  value = request.args.get(name)
+  if not value:
+    return None
+  import dateutil.parser
+  try:
+    return dateutil.parser.parse(value)
+  except (ValueError, OverflowError):
+    api_error(400, 'invalid date: ' + name)
+
+def api_list(kind, criteria, key, encode):
+  # one page of the rows of kind matching criteria in key order; the key
+  # columns are selected after the requested ones and encode turns the key
+  # of the last row into the cursor of the next page
+  names = api_fields(kind)
+  columns = [FIELDS[kind][name] for name in names]
+  limit = max(min(request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int),
+                  current_app.config['API_MAX_PAGE_SIZE']), 1)
+  rows = select_rows(kind, columns + list(key)).filter(*criteria) \
+    .order_by(*key).limit(limit + 1).all()
+  next_cursor = None
+  if len(rows) > limit:
+    rows = rows[:limit]
+    next_cursor = encode(*rows[-1][len(columns):])
+  data = [{name: api_value(name, value) for name, value in zip(names, row)} for row in rows]
+  return api_response({'data': data, 'next': next_cursor})
+
+def api_detail(kind, id, shows=None):
+  # one row of kind by id; shows is the query of its shows, when it has any
+  extra = ('upcoming_shows', 'past_shows') if shows is not None else ()
+  names = api_fields(kind, extra)
+  columns = [FIELDS[kind][name] for name in names if name not in extra]
+  row = select_rows(kind, columns + [FIELDS[kind]['id']]).filter(FIELDS[kind]['id'] == id).one_or_none()
+  if row is None:
+    api_error(404, 'not found')
+  data = {column.key: api_value(column.key, value) for column, value in zip(columns, row)}
+  if set(extra) & set(names):
+    upcoming, past, past_cursor = split_shows(shows, decode_cursor(request.args.get('past_before')))
+    if 'upcoming_shows' in names:
+      data['upcoming_shows'] = [show._asdict() for show in upcoming]
+    if 'past_shows' in names:
+      data['past_shows'] = [show._asdict() for show in past]
+      data['past_shows_cursor'] = past_cursor
+  return api_response({'data': data})
+
+def area_criteria():
+  criteria = []
+  if request.args.get('city'):
+    criteria.append(Venue.city == request.args['city'])
+  if request.args.get('state'):
+    criteria.append(Venue.state == request.args['state'])
+  return criteria
+
+@bp.route('/api/v1/venues')
+@conditional(venues_validator)
+def api_venues():
+  # ?city= and ?state= filters
+  criteria = area_criteria()
+  if request.args.get('after'):
+    criteria.append(Venue.id > request.args.get('after', 0, type=int))
+  return api_list('venues', criteria, (Venue.id,), str)
+
+@bp.route('/api/v1/venues/<int:venue_id>')
+@conditional(venue_validator)
+def api_venue(venue_id):
+  return api_detail('venues', venue_id, venue_shows(venue_id))
+
+@bp.route('/api/v1/artists')
+@conditional(artists_validator)
+def api_artists():
+  # ?city=, ?state= and ?genre= filters
+  criteria = []
+  if request.args.get('city'):
+    criteria.append(Artist.city == request.args['city'])
+  if request.args.get('state'):
+    criteria.append(Artist.state == request.args['state'])
+  if request.args.get('genre'):
+    criteria.append(genre_match(request.args['genre']))
+  if request.args.get('after'):
+    criteria.append(Artist.id > request.args.get('after', 0, type=int))
+  return api_list('artists', criteria, (Artist.id,), str)
+
+@bp.route('/api/v1/artists/<int:artist_id>')
+@conditional(artist_validator)
+def api_artist(artist_id):
+  return api_detail('artists', artist_id, artist_shows(artist_id))
+
+@bp.route('/api/v1/shows')
+@conditional(shows_validator)
+def api_shows():
+  # ?city= and ?state= of the venue, ?genre= of the artist, ?venue_id=,
+  # ?artist_id= and a ?from= / ?to= start time range
+  criteria = area_criteria()
+  if request.args.get('genre'):
+    criteria.append(genre_match(request.args['genre']))
+  for name, column in (('venue_id', Show.venue_id), ('artist_id', Show.artist_id)):
+    if request.args.get(name):
+      criteria.append(column == request.args.get(name, 0, type=int))
+  start, end = api_date('from'), api_date('to')
+  if start:
+    criteria.append(Show.start_time >= start)
+  if end:
+    criteria.append(Show.start_time < end)
+  after = decode_cursor(request.args.get('after'))
+  if after:
+    criteria.append(tuple_(Show.start_time, Show.id) > after)
+  return api_list('shows', criteria, (Show.start_time, Show.id), encode_cursor)
+
+@bp.route('/api/v1/shows/<int:show_id>')
+def api_show(show_id):
+  return api_detail('shows', show_id)
+
+
+@bp.route('/cache/stats')
+def cache_stats():
+  # hit, miss and eviction counters of the page cache, for sizing it
+  return jsonify(page_cache.stats())
+
+@bp.route('/db/stats')
+def db_stats():
+  # connection pool occupancy and checkout waits, for sizing the pools
+  return jsonify({key or 'primary': database.pool_status(engine.pool) for key, engine in db.engines.items()})
+
+@bp.route('/shows/overlaps')
+def show_overlaps():
+  # shows booked into their venue while an earlier show there is still on,
+  # found in one pass over the shows in venue and start order; each names
+  # the earlier show that ends last
+  rows = db.session.query(Show.id, Show.venue_id, Show.start_time, Show.end_time, Show.artist_id) \
+    .order_by(Show.venue_id, Show.start_time, Show.id).yield_per(current_app.config['EXPORT_BATCH_SIZE'])
+  data = [{
+    'venue_id': row.venue_id,
+    'show_id': row.id,
+    'artist_id': row.artist_id,
+    'start_time': row.start_time.isoformat(),
+    'end_time': row.end_time.isoformat(),
+    'overlaps_show_id': other_id,
+    'overlaps_until': other_end.isoformat(),
+  } for row, other_id, other_end in overlaps(rows)]
+  return jsonify({'count': len(data), 'overlaps': data})
+
+@bp.route('/metrics')
+def prometheus_metrics():
+  # request metrics plus the page cache and pool readings, for Prometheus
+  cache = page_cache.stats()
+  fragments = fragment_cache.stats()
+  pools = {key or 'primary': database.pool_status(engine.pool) for key, engine in db.engines.items()}
+  def by_pool(name):
+    return {(('bind', bind),): status.get(name) for bind, status in pools.items()}
+  gauges = [
+    ('fyyur_page_cache_entries', 'gauge', 'Pages in the page cache.', {(): cache['entries']}),
+    ('fyyur_page_cache_hits_total', 'counter', 'Page cache hits.', {(): cache['hits']}),
+    ('fyyur_page_cache_misses_total', 'counter', 'Page cache misses.', {(): cache['misses']}),
+    ('fyyur_page_cache_evictions_total', 'counter', 'Pages evicted to make room.', {(): cache['evictions']}),
+    ('fyyur_fragment_cache_entries', 'gauge', 'Template fragments in the fragment cache.', {(): fragments['entries']}),
+    ('fyyur_fragment_cache_hits_total', 'counter', 'Fragment cache hits.', {(): fragments['hits']}),
+    ('fyyur_fragment_cache_misses_total', 'counter', 'Fragment cache misses.', {(): fragments['misses']}),
+    ('fyyur_db_pool_size', 'gauge', 'Connections kept open by the pool.', by_pool('size')),
+    ('fyyur_db_pool_checked_out', 'gauge', 'Connections in use.', by_pool('checked_out')),
+    ('fyyur_db_pool_saturation', 'gauge', 'Connections in use over pool_size + max_overflow.', by_pool('saturation')),
+    ('fyyur_db_pool_checkouts_total', 'counter', 'Connections handed out.', by_pool('checkouts')),
+    ('fyyur_db_pool_timeouts_total', 'counter', 'Checkouts that gave up waiting.', by_pool('timeouts')),
+    ('fyyur_db_pool_wait_max_seconds', 'gauge', 'Longest checkout wait.',
+     {labels: value / 1000.0 for labels, value in by_pool('wait_max_ms').items() if value is not None}),
+  ]
+  return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@bp.cli.group()
+def counters():
+  """Maintain the show counters of venues and artists."""
+
+@counters.command()
+def rollover():
+  """Move shows that have begun from upcoming to past."""
+  # run it every few minutes, e.g. from cron: flask counters rollover
+  started = and_(Show.is_past == False, Show.start_time < datetime.now())
+  for model, key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+    shows = db.session.query(key.label('id'), func.count(Show.id).label('started')) \
+      .filter(started).group_by(key).subquery()
+    db.session.execute(sa.update(model).where(model.id == shows.c.id).values(
+      upcoming_shows_count=model.upcoming_shows_count - shows.c.started,
+      past_shows_count=model.past_shows_count + shows.c.started,
+    ))
+  moved = db.session.query(Show).filter(started) \
+    .update({Show.is_past: True}, synchronize_session=False)
+  db.session.commit()
+  click.echo('{} shows moved to past'.format(moved))
+
+@counters.command()
+@click.option('--fix', is_flag=True, help='Overwrite the counters that drifted.')
+def verify(fix):
+  """Recompute the counters from Show and report drift."""
+  drifted = 0
+  for model, key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+    upcoming = func.count(case((Show.is_past == False, Show.id)))
+    past = func.count(case((Show.is_past == True, Show.id)))
+    total = func.count(Show.id)
+    rows = db.session.query(model.id, model.upcoming_shows_count, model.past_shows_count, model.shows_count,
+                            upcoming, past, total) \
+      .outerjoin(Show, key == model.id) \
+      .group_by(model.id, model.upcoming_shows_count, model.past_shows_count, model.shows_count) \
+      .having(or_(model.upcoming_shows_count != upcoming, model.past_shows_count != past,
+                  model.shows_count != total)).all()
+    for row in rows:
+      drifted += 1
+      click.echo('{} {}: upcoming {} (counted {}), past {} (counted {}), total {} (counted {})'.format(
+        model.__tablename__, row[0], row[4], row[1], row[5], row[2], row[6], row[3]))
+      if fix:
+        db.session.query(model).filter(model.id == row[0]).update({
+          model.upcoming_shows_count: row[4],
+          model.past_shows_count: row[5],
+          model.shows_count: row[6],
+        }, synchronize_session=False)
+  late = db.session.query(func.count(Show.id)) \
+    .filter(Show.is_past == False, Show.start_time < datetime.now()).scalar()
+  db.session.commit()
+  click.echo('{} counters drifted{}, {} shows due for rollover'.format(drifted, ', fixed' if fix and drifted else '', late))
+
+@bp.cli.group('import')
+def import_data():
+  """Bulk load venues, artists and shows from CSV or NDJSON files."""
+
+def name_ids(model):
+  # maps lower case names to ids, None for names shared by several rows
+  ids = {}
+  for id, name in db.session.query(model.id, model.name).yield_per(10000):
+    key = (name or '').casefold()
+    ids[key] = None if key in ids else id
+  return ids
+
+def run_import(path, format, batch_size, rejects, table, columns, convert, inserted_rows=None):
+  # validates and converts every row with convert(row), which returns a
+  # tuple of column values or raises ValueError with the reasons to reject it;
+  # inserted_rows(ids, rows) runs after each batch, before its commit
+  started = time.perf_counter()
+  read = inserted = rejected = 0
+  rejects = open(rejects, 'w') if rejects else None
+  try:
+    for batch in importer.batches(enumerate(importer.read_rows(path, format), 1), batch_size):
+      rows = []
+      for line, row in batch:
+        read += 1
+        try:
+          rows.append(convert(row))
+        except ValueError as e:
+          rejected += 1
+          if rejects:
+            rejects.write(json.dumps({'line': line, 'row': row, 'errors': e.args[0]}, default=str) + '\n')
+      ids = importer.BulkWriter(db.session.connection(), table, columns).write(rows)
+      if inserted_rows and ids:
+        inserted_rows(ids, rows)
+      db.session.commit()
+      inserted += len(ids)
+      click.echo('{} rows read, {} inserted, {} rejected, {:.0f} rows/s'.format(
+        read, inserted, rejected, read / (time.perf_counter() - started)))
+  finally:
+    if rejects:
+      rejects.close()
+  elapsed = time.perf_counter() - started
+  click.echo('done: {} inserted, {} rejected in {:.1f}s ({:.0f} rows/s)'.format(
+    inserted, rejected, elapsed, read / elapsed if elapsed else 0))
+
+def import_options(command):
+  command = click.argument('path', type=click.Path(exists=True, dir_okay=False))(command)
+  command = click.option('--format', type=click.Choice(['csv', 'ndjson']),
+                         help='File format, taken from the extension by default.')(command)
+  command = click.option('--batch-size', default=5000, show_default=True,
+                         help='Rows inserted per batch.')(command)
+  command = click.option('--rejects', type=click.Path(dir_okay=False),
+                         help='Write rejected rows and their errors to this NDJSON file.')(command)
+  return command
+
+@import_data.command('venues')
+@import_options
+def import_venues(path, format, batch_size, rejects):
+  """Import venues, validated like the new venue form."""
+  from forms import VenueForm
+  columns = ('name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+             'latitude', 'longitude', 'updated_at')
+  def convert(row):
+    data, errors = importer.validate(VenueForm, row)
+    if errors:
+      raise ValueError(errors)
+    return tuple(data[column] for column in columns[:-3]) + geocode(data['city'], data['state']) + (datetime.now(),)
+  run_import(path, format, batch_size, rejects, Venue.__table__, columns, convert)
+
+@import_data.command('artists')
+@import_options
+def import_artists(path, format, batch_size, rejects):
+  """Import artists, validated like the new artist form.
+
+  genres is a list in NDJSON and a semicolon separated string in CSV.
+  """
+  from forms import ArtistForm
+  columns = ('name', 'city', 'state', 'phone', 'genres', 'image_link', 'facebook_link', 'updated_at')
+  def convert(row):
+    if isinstance(row.get('genres'), str):
+      row = dict(row, genres=[genre.strip() for genre in row['genres'].split(';') if genre.strip()])
+    data, errors = importer.validate(ArtistForm, row)
+    if errors:
+      raise ValueError(errors)
+    data['genres'] = genres_literal(data['genres'])
+    return tuple(data[column] for column in columns[:-1]) + (datetime.now(),)
+  def link_genres(ids, rows):
+    set_genres((id, genres_list(row[4])) for id, row in zip(ids, rows))
+  run_import(path, format, batch_size, rejects, Artist.__table__, columns, convert, link_genres)
+
+@import_data.command('shows')
+@import_options
+def import_shows(path, format, batch_size, rejects):
+  """Import shows, validated like the new show form.
+
+  Each show names its artist and venue either by id (artist_id, venue_id)
+  or by their exact name (artist, venue).
+  """
+  from forms import ShowForm
+  columns = ('artist_id', 'venue_id', 'start_time', 'end_time', 'is_past', 'updated_at')
+  references = {'artist': name_ids(Artist), 'venue': name_ids(Venue)}
+  known_ids = {
+    'artist': set(id for id, in db.session.query(Artist.id).yield_per(10000)),
+    'venue': set(id for id, in db.session.query(Venue.id).yield_per(10000)),
+  }
+  # rows are checked against the venue bookings and those of earlier rows,
+  # which are booked under negative keys until they have ids
+  pending = itertools.count(-1, -1)
+  def convert(row):
+    data, errors = importer.validate(ShowForm, row)
+    errors = dict(errors or {})
+    ids = {}
+    for kind in ('artist', 'venue'):
+      key = kind + '_id'
+      if row.get(key) not in (None, ''):
+        try:
+          ids[key] = int(row[key])
+        except ValueError:
+          ids[key] = None
+      else:
+        ids[key] = references[kind].get((row.get(kind) or '').casefold())
+      if ids[key] not in known_ids[kind]:
+        errors[key] = ['Unknown or ambiguous {}.'.format(kind)]
+    if errors:
+      raise ValueError(errors)
+    end_time = show_end_time(data['start_time'], data.get('duration'))
+    conflict = venue_schedules.book(ids['venue_id'], data['start_time'], end_time, next(pending))
+    if conflict is not None:
+      raise ValueError({'start_time': ['The venue is already booked at that time{}.'.format(
+        ' by show {}'.format(conflict) if conflict > 0 else ' by an earlier row')]})
+    return (ids['artist_id'], ids['venue_id'], data['start_time'], end_time,
+            data['start_time'] < datetime.now(), datetime.now())
+  run_import(path, format, batch_size, rejects, Show.__table__, columns, convert,
+             lambda ids, rows: count_shows(1, Show.id.in_(ids)))
+
+@bp.cli.command('geocode')
+@click.option('--all', 'everything', is_flag=True, help='Locate venues that already have a location too.')
+def geocode_venues(everything):
+  """Locate venues from the offline geocode table in geo.py."""
+  # one update per city and state, through ix_Venue_state_city
+  query = db.session.query(Venue.city, Venue.state).distinct()
+  if not everything:
+    query = query.filter(Venue.latitude.is_(None))
+  located = missing = 0
+  for city, state in query.all():
+    latitude, longitude = geocode(city, state)
+    if latitude is None:
+      missing += db.session.query(Venue).filter(Venue.city == city, Venue.state == state).count()
+      continue
+    located += db.session.query(Venue).filter(Venue.city == city, Venue.state == state) \
+      .update({Venue.latitude: latitude, Venue.longitude: longitude}, synchronize_session=False)
+  db.session.commit()
+  click.echo('{} venues located, {} in cities missing from the geocode table'.format(located, missing))
+
+@bp.cli.command('export')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.option('--format', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-',
+              help='File to write, standard output by default.')
+def export_data(kind, format, output):
+  """Stream every venue, artist or show as CSV or NDJSON."""
+  for chunk in stream_export(kind, format):
+    output.write(chunk)
+
+@bp.cli.command('compile-templates')
+def compile_templates():
+  """Compile every template into the bytecode cache, e.g. at deploy time."""
+  env = current_app.jinja_env
+  if env.bytecode_cache is None:
+    raise click.UsageError('TEMPLATE_CACHE_DIR is not set')
+  names = env.list_templates(filter_func=lambda name: name.endswith('.html'))
+  for name in names:
+    env.get_template(name)
+  click.echo('{} templates compiled into {}'.format(len(names), current_app.config['TEMPLATE_CACHE_DIR']))
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -594,11 +1967,11 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
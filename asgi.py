@@ -0,0 +1,138 @@
+"""ASGI entry point that serves the read routes on an async engine.
+
+    pip install -r requirements.txt uvicorn    # and asyncpg on postgres
+    uvicorn asgi:application
+
+The read routes in READ_ENDPOINTS run their usual Flask view code on the
+event loop: db.session is, for that request, the sync face of an AsyncSession
+on an async engine, so each query awaits the driver instead of holding a
+thread while the database works. Every other route, the writes included,
+goes to the WSGI app in a thread pool, unchanged.
+
+Reads in this mode always go to SQLALCHEMY_DATABASE_URI, which has to be a
+server or a sqlite file; an in-memory sqlite database is not shared with the
+async engine.
+"""
+import io
+import sys
+
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+
+import database
+from app import db
+
+READ_ENDPOINTS = {'main.' + endpoint for endpoint in (
+  'index', 'venues', 'search_venues', 'venues_nearby', 'show_venue', 'artists', 'search_artists',
+  'show_artist', 'show_genre', 'shows', 'search_shows', 'search_suggest', 'calendar',
+  'api_venues', 'api_venue', 'api_artists', 'api_artist', 'api_shows', 'api_show',
+)}
+
+
+def wsgi_environ(scope, body):
+  # the WSGI environ of an ASGI http scope
+  server = scope.get('server') or ('localhost', 80)
+  environ = {
+    'REQUEST_METHOD': scope['method'],
+    'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+    'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+    'QUERY_STRING': scope['query_string'].decode('ascii'),
+    'SERVER_NAME': server[0],
+    'SERVER_PORT': str(server[1]),
+    'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+    'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+    'wsgi.version': (1, 0),
+    'wsgi.url_scheme': scope.get('scheme', 'http'),
+    'wsgi.input': io.BytesIO(body),
+    'wsgi.errors': sys.stderr,
+    'wsgi.multithread': True,
+    'wsgi.multiprocess': True,
+    'wsgi.run_once': False,
+  }
+  for name, value in scope.get('headers', []):
+    name = name.decode('latin-1').upper().replace('-', '_')
+    value = value.decode('latin-1')
+    if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+      name = 'HTTP_' + name
+    environ[name] = environ[name] + ',' + value if name in environ else value
+  return environ
+
+
+class AsyncReads(object):
+  """ASGI app running READ_ENDPOINTS on an async engine, the rest as WSGI."""
+
+  def __init__(self, app, db):
+    self.app = app
+    self.db = db
+    self.wsgi = WsgiToAsgi(app)
+    url, options = database.async_engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+    self.engine = create_async_engine(url, **options)
+    database.instrument(self.engine.sync_engine, app.config)
+
+  async def __call__(self, scope, receive, send):
+    if scope['type'] == 'lifespan':
+      return await self.lifespan(receive, send)
+    if scope['type'] != 'http':
+      return await self.wsgi(scope, receive, send)
+
+    body = b''
+    while True:
+      message = await receive()
+      body += message.get('body', b'')
+      if not message.get('more_body'):
+        break
+    environ = wsgi_environ(scope, body)
+
+    try:
+      endpoint, args = self.app.url_map.bind_to_environ(environ).match()
+    except (HTTPException, RequestRedirect):
+      endpoint = None
+    if endpoint not in READ_ENDPOINTS:
+      async def replay():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+      return await self.wsgi(scope, replay, send)
+
+    async with AsyncSession(self.engine) as session:
+      response = await session.run_sync(self.respond, environ)
+    await send({
+      'type': 'http.response.start',
+      'status': response.status_code,
+      'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.items()],
+    })
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+  def respond(self, session, environ):
+    # runs in the greenlet of run_sync, where queries on session await the
+    # async driver; the response body is built before it returns
+    with self.app.request_context(environ):
+      self.db.session.registry.set(session)
+      try:
+        response = self.app.full_dispatch_request()
+        response.get_data()
+        return response
+      finally:
+        self.db.session.registry.clear()
+
+  async def lifespan(self, receive, send):
+    while True:
+      message = await receive()
+      if message['type'] == 'lifespan.startup':
+        await send({'type': 'lifespan.startup.complete'})
+      elif message['type'] == 'lifespan.shutdown':
+        await self.engine.dispose()
+        await send({'type': 'lifespan.shutdown.complete'})
+        return
+
+
+
+def __getattr__(name):
+  # the ASGI app of uvicorn asgi:application, over the app of `from app
+  # import app`, built on first use like it
+  if name == 'application':
+    global application
+    from app import app
+    application = AsyncReads(app, db)
+    return application
+  raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -0,0 +1,271 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session
+from jinja2 import nodes
+from jinja2.ext import Extension
+from werkzeug.http import is_resource_modified
+
+
+class NullCache(object):
+  """Backend that stores nothing, used to switch caching off."""
+
+  def __init__(self, max_entries=0, default_ttl=0):
+    self.max_entries = max_entries
+    self.default_ttl = default_ttl
+    self.hits = self.misses = self.evictions = self.expirations = 0
+
+  def __len__(self):
+    return 0
+
+  def get(self, key):
+    self.misses += 1
+    return None
+
+  def set(self, key, value, ttl=None, tags=()):
+    pass
+
+  def invalidate(self, *tags):
+    return 0
+
+  def clear(self):
+    pass
+
+  def stats(self):
+    return {
+      'backend': type(self).__name__,
+      'entries': len(self),
+      'max_entries': self.max_entries,
+      'hits': self.hits,
+      'misses': self.misses,
+      'evictions': self.evictions,
+      'expirations': self.expirations,
+    }
+
+
+class LRUCache(NullCache):
+  """In-process cache bounded to max_entries, least recently used out first.
+
+  Every entry expires after its ttl and can carry tags, so a write can evict
+  exactly the entries that rendered the rows it changed.
+  """
+
+  def __init__(self, max_entries=1024, default_ttl=60):
+    super(LRUCache, self).__init__(max_entries, default_ttl)
+    self.entries = OrderedDict()
+    self.tags = {}
+    self.lock = threading.Lock()
+
+  def __len__(self):
+    return len(self.entries)
+
+  def get(self, key):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is not None and entry[0] < time.monotonic():
+        self._delete(key)
+        self.expirations += 1
+        entry = None
+      if entry is None:
+        self.misses += 1
+        return None
+      self.entries.move_to_end(key)
+      self.hits += 1
+      return entry[1]
+
+  def set(self, key, value, ttl=None, tags=()):
+    expires = time.monotonic() + (self.default_ttl if ttl is None else ttl)
+    with self.lock:
+      if key in self.entries:
+        self._delete(key)
+      self.entries[key] = (expires, value, tuple(tags))
+      for tag in tags:
+        self.tags.setdefault(tag, set()).add(key)
+      while len(self.entries) > self.max_entries:
+        self._delete(next(iter(self.entries)))
+        self.evictions += 1
+
+  def invalidate(self, *tags):
+    # removes every entry carrying one of tags and returns how many
+    with self.lock:
+      keys = set()
+      for tag in tags:
+        keys.update(self.tags.get(tag, ()))
+      for key in keys:
+        self._delete(key)
+      return len(keys)
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+      self.tags.clear()
+
+  def _delete(self, key):
+    expires, value, tags = self.entries.pop(key)
+    for tag in tags:
+      keys = self.tags.get(tag)
+      keys.discard(key)
+      if not keys:
+        del self.tags[tag]
+
+
+BACKENDS = {
+  'lru': LRUCache,
+  'null': NullCache,
+}
+
+
+class PageCache(object):
+  """Caches rendered GET pages, keyed by path and query string.
+
+  Views add tags to the page they render with tag(), and write handlers
+  evict those pages with invalidate(). Pages are not cached or served from
+  the cache while flashed messages are pending, since the layout shows them,
+  and not cached when the view set g.cache_skip.
+
+  Under conditional(), a page is stored with the ETag it was rendered for
+  and served only to requests with the same ETag: another process may have
+  changed the rows without this one having seen the invalidation.
+
+  Each app keeps its pages in a backend of its own, app.extensions['page_cache'].
+  """
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('CACHE_BACKEND', 'lru')
+    app.config.setdefault('CACHE_MAX_ENTRIES', 1024)
+    app.config.setdefault('CACHE_DEFAULT_TTL', 60)
+    app.extensions['page_cache'] = BACKENDS[app.config['CACHE_BACKEND']](
+      app.config['CACHE_MAX_ENTRIES'], app.config['CACHE_DEFAULT_TTL'])
+
+  @property
+  def backend(self):
+    return current_app.extensions['page_cache']
+
+  def cached(self, ttl=None):
+    def decorator(view):
+      @wraps(view)
+      def wrapper(*args, **kwargs):
+        if request.method != 'GET' or session.get('_flashes'):
+          return view(*args, **kwargs)
+        key = 'page:' + request.full_path
+        etag = g.get('etag')
+        entry = self.backend.get(key)
+        if entry is not None and entry[0] == etag:
+          return entry[1]
+        g.cache_tags = set()
+        page = view(*args, **kwargs)
+        if isinstance(page, str) and not g.get('cache_skip'):
+          self.backend.set(key, (etag, page), ttl, g.cache_tags)
+        return page
+      return wrapper
+    return decorator
+
+  def tag(self, *tags):
+    if 'cache_tags' in g:
+      g.cache_tags.update(tags)
+
+  def invalidate(self, *tags):
+    return self.backend.invalidate(*tags)
+
+  def stats(self):
+    return self.backend.stats()
+
+
+class FragmentCacheExtension(Extension):
+  """The {% cache key, ... %}...{% endcache %} template tag.
+
+  The markup between the tags is rendered once per template and key, then
+  emitted from environment.fragment_cache. The key should name the entity
+  and its version, such as its id and updated_at, so an edit renders the
+  fragment anew and the stale one ages out of the LRU.
+  """
+  tags = {'cache'}
+
+  def __init__(self, environment):
+    super(FragmentCacheExtension, self).__init__(environment)
+    environment.extend(fragment_cache=NullCache())
+
+  def parse(self, parser):
+    lineno = next(parser.stream).lineno
+    key = [nodes.Const(parser.name), parser.parse_expression()]
+    while parser.stream.skip_if('comma'):
+      key.append(parser.parse_expression())
+    body = parser.parse_statements(['name:endcache'], drop_needle=True)
+    return nodes.CallBlock(self.call_method('_render', [nodes.Tuple(key, 'load')]), [], [], body).set_lineno(lineno)
+
+  def _render(self, key, caller):
+    key = 'fragment:' + repr(key)
+    fragment = self.environment.fragment_cache.get(key)
+    if fragment is None:
+      fragment = caller()
+      self.environment.fragment_cache.set(key, fragment)
+    return fragment
+
+
+class FragmentCache(object):
+  """Keeps the {% cache %} fragments of the app templates in a bounded LRU.
+
+  Each app keeps its fragments in a backend of its own, the fragment_cache
+  of its jinja environment and app.extensions['fragment_cache'].
+  """
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('FRAGMENT_CACHE_BACKEND', 'lru')
+    app.config.setdefault('FRAGMENT_CACHE_MAX_ENTRIES', 10000)
+    app.config.setdefault('FRAGMENT_CACHE_TTL', 3600)
+    backend = BACKENDS[app.config['FRAGMENT_CACHE_BACKEND']](
+      app.config['FRAGMENT_CACHE_MAX_ENTRIES'], app.config['FRAGMENT_CACHE_TTL'])
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = backend
+    app.extensions['fragment_cache'] = backend
+
+  @property
+  def backend(self):
+    return current_app.extensions['fragment_cache']
+
+  def stats(self):
+    return self.backend.stats()
+
+
+def conditional(validator):
+  """Answers conditional GETs with 304 Not Modified before running the view.
+
+  validator is called with the view arguments and returns a row of values
+  that change whenever the page does, such as updated_at columns, or None
+  when there is no such page. The ETag is a hash of the row and the request
+  path, Last-Modified the latest datetime in the row.
+  """
+  def decorator(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      values = validator(*args, **kwargs)
+      if request.method != 'GET' or values is None or session.get('_flashes'):
+        return view(*args, **kwargs)
+      etag = hashlib.sha1(repr((request.full_path, tuple(values))).encode('utf-8')).hexdigest()
+      dates = [value for value in values if isinstance(value, datetime)]
+      last_modified = max(dates).astimezone(timezone.utc) if dates else None
+
+      if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        # for PageCache.cached, which serves only pages rendered for this etag
+        g.etag = etag
+        response = make_response(view(*args, **kwargs))
+      else:
+        response = make_response('', 304)
+      response.set_etag(etag, weak=True)
+      response.last_modified = last_modified
+      response.cache_control.no_cache = True
+      return response
+    return wrapper
+  return decorator
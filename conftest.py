@@ -0,0 +1 @@
+# lets the tests under tests/ import the top-level modules of the app
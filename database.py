@@ -0,0 +1,303 @@
+import os
+import random
+import threading
+import time
+import weakref
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, render_template, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+class QueryBudgetExceeded(RuntimeError):
+  pass
+
+
+class PoolStats(object):
+  """Checkout counters of one connection pool.
+
+  The wait of a checkout is the time spent in connect(), which includes
+  queueing for a free connection once pool_size + max_overflow are out.
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.checkouts = self.timeouts = 0
+    self.wait_total = self.wait_max = 0.0
+
+  def record(self, wait, timed_out=False):
+    with self.lock:
+      self.checkouts += 1
+      self.timeouts += timed_out
+      self.wait_total += wait
+      self.wait_max = max(self.wait_max, wait)
+
+
+class TimedQueuePool(QueuePool):
+  """QueuePool that records how long every checkout waited."""
+
+  def __init__(self, creator, pool_size=5, max_overflow=10, **kwargs):
+    super(TimedQueuePool, self).__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kwargs)
+    self.max_overflow = max_overflow
+    self.stats = PoolStats()
+
+  def connect(self):
+    started = time.perf_counter()
+    try:
+      connection = super(TimedQueuePool, self).connect()
+    except sa.exc.TimeoutError:
+      self.stats.record(time.perf_counter() - started, timed_out=True)
+      raise
+    self.stats.record(time.perf_counter() - started)
+    return connection
+
+
+def engine_options(uri, config):
+  # SQLALCHEMY_ENGINE_OPTIONS for uri from the DB_POOL_* settings; an
+  # in-memory sqlite database is a single shared connection and not pooled
+  url = sa.engine.make_url(uri)
+  options = {
+    'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    'pool_recycle': config['DB_POOL_RECYCLE'],
+  }
+  if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+    return options
+  options.update(
+    poolclass=TimedQueuePool,
+    pool_size=config['DB_POOL_SIZE'],
+    max_overflow=config['DB_MAX_OVERFLOW'],
+    pool_timeout=config['DB_POOL_TIMEOUT'],
+  )
+  return options
+
+
+# the engines a forked worker drops the inherited connections of; weak, so
+# engines of apps that are gone are not kept alive by the hook
+fork_safe_engines = weakref.WeakSet()
+
+
+def _dispose_after_fork():
+  for engine in list(fork_safe_engines):
+    engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_dispose_after_fork)
+
+
+def dispose_after_fork(engine):
+  # a forked worker opens connections of its own instead of sharing the ones
+  # the parent had open; one hook serves every engine added here
+  fork_safe_engines.add(engine)
+
+
+# async drivers of each backend, for the ASGI mode in asgi.py
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+
+def async_engine_options(uri, config):
+  # the URL of uri with the async driver of its backend, and the pool
+  # settings of engine_options without the sync-only pool class
+  url = sa.engine.make_url(uri)
+  url = url.set(drivername='{}+{}'.format(url.get_backend_name(), ASYNC_DRIVERS[url.get_backend_name()]))
+  options = engine_options(uri, config)
+  options.pop('poolclass', None)
+  return url, options
+
+
+def pool_status(pool):
+  # occupancy and checkout waits of pool, for the /db/stats page
+  status = {'pool': type(pool).__name__}
+  if isinstance(pool, QueuePool):
+    capacity = pool.size() + getattr(pool, 'max_overflow', 0)
+    status.update(
+      size=pool.size(),
+      checked_in=pool.checkedin(),
+      checked_out=pool.checkedout(),
+      overflow=max(pool.overflow(), 0),
+      saturation=round(pool.checkedout() / capacity, 3) if capacity else None,
+    )
+  stats = getattr(pool, 'stats', None)
+  if stats is not None:
+    with stats.lock:
+      status.update(
+        checkouts=stats.checkouts,
+        timeouts=stats.timeouts,
+        wait_avg_ms=round(stats.wait_total * 1000 / stats.checkouts, 3) if stats.checkouts else 0,
+        wait_max_ms=round(stats.wait_max * 1000, 3),
+      )
+  return status
+
+
+def set_statement_timeout(engine, timeout_ms):
+  # aborts statements of requests running longer than timeout_ms:
+  # statement_timeout on postgres, a progress handler interrupting the
+  # statement on sqlite. Statements run outside a request, by the flask
+  # commands and the index rebuilds, have no limit
+  if engine.dialect.name == 'postgresql':
+    @event.listens_for(engine, 'checkout')
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+      # only when the connection moves between requests and the rest, so a
+      # worker serving requests sets it once per connection; committed, as
+      # a rollback would undo it
+      timeout = timeout_ms if has_request_context() else 0
+      if connection_record.info.get('statement_timeout') != timeout:
+        cursor = dbapi_connection.cursor()
+        cursor.execute('SET statement_timeout = {:d}'.format(timeout))
+        cursor.close()
+        dbapi_connection.commit()
+        connection_record.info['statement_timeout'] = timeout
+
+  elif engine.dialect.name == 'sqlite' and not engine.dialect.is_async:
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+      deadline = connection_record.info['statement_deadline'] = [None]
+      dbapi_connection.set_progress_handler(
+        lambda: deadline[0] is not None and time.monotonic() > deadline[0], 1000)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+      if 'statement_deadline' in conn.info and has_request_context():
+        conn.info['statement_deadline'][0] = time.monotonic() + timeout_ms / 1000.0
+
+    # rows are fetched without a deadline, so long exports can stream
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+      if 'statement_deadline' in conn.info:
+        conn.info['statement_deadline'][0] = None
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+      if context.connection is not None and 'statement_deadline' in context.connection.info:
+        context.connection.info['statement_deadline'][0] = None
+
+
+class QueryStats(object):
+  """The statements one request ran: how many, and when timed, how long
+  they took in total and which was the slowest; statements keeps every
+  (duration, statement) pair for the debug panel when asked to."""
+
+  __slots__ = ('count', 'timed', 'time', 'slowest', 'slowest_statement', 'statements')
+
+  def __init__(self, timed=False, keep=False):
+    self.count = 0
+    self.timed = timed
+    self.time = self.slowest = 0.0
+    self.slowest_statement = None
+    self.statements = [] if keep else None
+
+  def record(self, statement, duration):
+    self.time += duration
+    if duration > self.slowest:
+      self.slowest, self.slowest_statement = duration, statement
+    if self.statements is not None:
+      self.statements.append((duration, statement))
+
+
+def record_queries(engine):
+  # counts the statements of the request in g.sql, and times them when the
+  # request was sampled; the budget is checked on every request
+  @event.listens_for(engine, 'before_cursor_execute')
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = g.get('sql') if has_request_context() else None
+    if stats is None:
+      return
+    stats.count += 1
+    budget = current_app.config['DB_QUERY_BUDGET']
+    if budget and stats.count == budget + 1:
+      message = '{} {} ran more than {} queries'.format(request.method, request.path, budget)
+      if current_app.config['DB_QUERY_BUDGET_STRICT']:
+        raise QueryBudgetExceeded(message)
+      current_app.logger.warning(message)
+    if stats.timed:
+      conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+  @event.listens_for(engine, 'after_cursor_execute')
+  def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = g.get('sql') if has_request_context() else None
+    if stats is not None and stats.timed and conn.info.get('query_started'):
+      stats.record(statement, time.perf_counter() - conn.info['query_started'].pop())
+
+
+def instrument(engine, config):
+  if config['DB_STATEMENT_TIMEOUT_MS']:
+    set_statement_timeout(engine, config['DB_STATEMENT_TIMEOUT_MS'])
+  record_queries(engine)
+
+
+def report_queries(app):
+  # starts the QueryStats of every request, timing SQL_TIMING_SAMPLE_RATE of
+  # them (all of them with the debug panel on), and reports them in the
+  # X-Query-Count and Server-Timing headers, the slow query log and, on HTML
+  # pages in debug mode, a panel listing the statements
+  panel = app.debug and app.config['SQL_DEBUG_PANEL']
+  rate = 1.0 if panel else app.config['SQL_TIMING_SAMPLE_RATE']
+  slow = app.config['SQL_SLOW_QUERY_MS'] / 1000.0
+
+  @app.before_request
+  def start_query_stats():
+    g.sql = QueryStats(timed=random.random() < rate, keep=panel)
+
+  @app.after_request
+  def add_query_stats(response):
+    stats = g.get('sql')
+    if stats is None:
+      return response
+    response.headers['X-Query-Count'] = str(stats.count)
+    if not stats.timed:
+      return response
+    response.headers.add('Server-Timing', 'db;dur={:.3f};desc="{} queries"'.format(stats.time * 1000, stats.count))
+    if stats.slowest_statement is not None:
+      response.headers.add('Server-Timing', 'db-slowest;dur={:.3f}'.format(stats.slowest * 1000))
+      if slow and stats.slowest > slow:
+        app.logger.warning('%s %s: slowest query took %.0fms: %s', request.method, request.path,
+                           stats.slowest * 1000, ' '.join(stats.slowest_statement.split()))
+    if panel and response.mimetype == 'text/html' and not response.is_streamed and response.status_code == 200:
+      body = response.get_data(as_text=True)
+      end = body.rfind('</body>')
+      if end != -1:
+        response.set_data(body[:end] + render_template('debug/sql_panel.html', sql=stats) + body[end:])
+    return response
+
+
+class RoutingSession(Session):
+  """Session sending the reads of GET and HEAD requests to the replica bind.
+
+  Flushes, INSERT/UPDATE/DELETE statements and every other request go to the
+  primary, and so do the reads of a browser shortly after its own writes.
+  """
+
+  def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+    if bind is None and not self._flushing and has_request_context() and g.get('use_replica') \
+        and not (clause is not None and getattr(clause, 'is_dml', False)):
+      replica = self._db.engines.get('replica')
+      if replica is not None:
+        return replica
+    return super(RoutingSession, self).get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def route_reads(app):
+  # reads of GET and HEAD requests use the replica, except for
+  # DB_READ_YOUR_WRITES seconds after a write by the same browser; pages
+  # read from the replica that soon after any write are not cached, as the
+  # replica may still be behind
+  window = app.config['DB_READ_YOUR_WRITES']
+  # time.monotonic() of the last write request the app served
+  last_write = [float('-inf')]
+
+  @app.before_request
+  def choose_bind():
+    # set on every request, as g outlives one when the app context is
+    # already pushed, like in the tests
+    g.use_replica = request.method in READ_METHODS and time.time() - session.get('wrote_at', 0) > window
+    g.cache_skip = g.use_replica and time.monotonic() - last_write[0] < window
+
+  @app.after_request
+  def remember_write(response):
+    if request.method not in READ_METHODS:
+      session['wrote_at'] = time.time()
+      last_write[0] = time.monotonic()
+    return response
@@ -0,0 +1,105 @@
+import csv
+import io
+import json
+from datetime import date, timezone
+
+MIMETYPES = {
+  'csv': 'text/csv',
+  'ndjson': 'application/x-ndjson',
+  'ics': 'text/calendar',
+}
+
+
+def _value(value, format):
+  if isinstance(value, date):
+    return value.isoformat()
+  if isinstance(value, list) and format == 'csv':
+    # the same ; separated form flask import reads back
+    return ';'.join(value)
+  return value
+
+
+def export_rows(columns, rows, format, chunk_rows=1000):
+  # yields rows encoded as CSV with a header line or as NDJSON, chunk_rows
+  # rows per chunk, without holding more than one chunk in memory
+  buffer = io.StringIO()
+  if format == 'csv':
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    write = lambda row: writer.writerow([_value(value, format) for value in row])
+  else:
+    write = lambda row: buffer.write(json.dumps(
+      dict(zip(columns, [_value(value, format) for value in row])), separators=(',', ':')) + '\n')
+
+  count = 0
+  for row in rows:
+    write(row)
+    count += 1
+    if count % chunk_rows == 0:
+      yield buffer.getvalue()
+      buffer.seek(0)
+      buffer.truncate()
+  if buffer.tell():
+    yield buffer.getvalue()
+
+
+def _ics_text(value):
+  # TEXT values escape backslashes, separators and line breaks (RFC 5545 3.3.11)
+  return (value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,') \
+    .replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def _ics_line(line):
+  # content lines end in CRLF and are folded after 75 octets, continuing
+  # on lines that start with a space; a fold landing inside a UTF-8
+  # character backs off to its first octet, which is never 10xxxxxx
+  octets = line.encode('utf-8')
+  if len(octets) <= 75:
+    return line + '\r\n'
+  parts, start, limit = [], 0, 75
+  while len(octets) - start > limit:
+    end = start + limit
+    while octets[end] & 0xc0 == 0x80:
+      end -= 1
+    parts.append(octets[start:end])
+    start, limit = end, 74
+  parts.append(octets[start:])
+  return b'\r\n '.join(parts).decode('utf-8') + '\r\n'
+
+
+def _ics_time(value):
+  # local times are floating, written as they are; DTSTAMP has to be UTC
+  if value.tzinfo is None:
+    return value.strftime('%Y%m%dT%H%M%S')
+  return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def export_calendar(name, events, chunk_rows=1000):
+  # yields an iCalendar feed named name, chunk_rows events per chunk; events
+  # are dicts with uid, start, end, stamp, summary, location and url
+  buffer = io.StringIO()
+  write = lambda line: buffer.write(_ics_line(line))
+  for line in ('BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Fyyur//Shows//EN', 'CALSCALE:GREGORIAN',
+               'METHOD:PUBLISH', 'X-WR-CALNAME:' + _ics_text(name)):
+    write(line)
+
+  count = 0
+  for event in events:
+    write('BEGIN:VEVENT')
+    write('UID:' + event['uid'])
+    write('DTSTAMP:' + _ics_time(event['stamp'].astimezone(timezone.utc)))
+    write('DTSTART:' + _ics_time(event['start']))
+    write('DTEND:' + _ics_time(event['end']))
+    write('SUMMARY:' + _ics_text(event['summary']))
+    if event.get('location'):
+      write('LOCATION:' + _ics_text(event['location']))
+    if event.get('url'):
+      write('URL:' + event['url'])
+    write('END:VEVENT')
+    count += 1
+    if count % chunk_rows == 0:
+      yield buffer.getvalue()
+      buffer.seek(0)
+      buffer.truncate()
+  write('END:VCALENDAR')
+  yield buffer.getvalue()
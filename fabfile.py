@@ -4,11 +4,16 @@ from fabric.contrib.console import confirm
 # prepare for deployment
 
 
+# every read route against a small seeded sqlite database; fails on server errors
+BENCHMARK = (
+    "export DATABASE_URL=sqlite:////tmp/fyyur-bench.db && rm -f /tmp/fyyur-bench.db && "
+    "python scripts/seed_data.py --scale 1k --create && python scripts/benchmark.py --iterations 5"
+)
+
+
 def test():
     with settings(warn_only=True):
-        result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
-        )
+        result = local("python -m pytest -q && " + BENCHMARK, capture=True)
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
 
@@ -39,9 +44,8 @@ def heroku():
 
 
 def heroku_test():
-    local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
-    )
+    # a single request to every read route of the deployed app
+    local("heroku run python scripts/benchmark.py --iterations 1 --warmup 0")
 
 
 def deploy():
@@ -1,7 +1,7 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, Optional, NumberRange
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -15,6 +15,12 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    # minutes; SHOW_DURATION_MINUTES when left empty
+    duration = IntegerField(
+        'duration',
+        validators=[Optional(), NumberRange(min=1, max=24 * 60,
+                                             message='Duration must be between %(min)s and %(max)s minutes.')]
+    )
 
 class VenueForm(Form):
     name = StringField(
@@ -0,0 +1,204 @@
+import heapq
+import math
+import threading
+
+from suggest import normalize
+
+EARTH_RADIUS_KM = 6371.0088
+
+# the offline geocode table: the centre of each city venues are listed in,
+# as (city, state, latitude, longitude); venues elsewhere get no location
+CITIES = [
+  ('New York', 'NY', 40.7128, -74.0060), ('Brooklyn', 'NY', 40.6782, -73.9442),
+  ('Buffalo', 'NY', 42.8864, -78.8784), ('Los Angeles', 'CA', 34.0522, -118.2437),
+  ('San Diego', 'CA', 32.7157, -117.1611), ('San Jose', 'CA', 37.3382, -121.8863),
+  ('San Francisco', 'CA', 37.7749, -122.4194), ('Oakland', 'CA', 37.8044, -122.2712),
+  ('Sacramento', 'CA', 38.5816, -121.4944), ('Fresno', 'CA', 36.7378, -119.7871),
+  ('Long Beach', 'CA', 33.7701, -118.1937), ('Chicago', 'IL', 41.8781, -87.6298),
+  ('Houston', 'TX', 29.7604, -95.3698), ('San Antonio', 'TX', 29.4241, -98.4936),
+  ('Dallas', 'TX', 32.7767, -96.7970), ('Austin', 'TX', 30.2672, -97.7431),
+  ('Fort Worth', 'TX', 32.7555, -97.3308), ('El Paso', 'TX', 31.7619, -106.4850),
+  ('Phoenix', 'AZ', 33.4484, -112.0740), ('Tucson', 'AZ', 32.2226, -110.9747),
+  ('Philadelphia', 'PA', 39.9526, -75.1652), ('Pittsburgh', 'PA', 40.4406, -79.9959),
+  ('Jacksonville', 'FL', 30.3322, -81.6557), ('Miami', 'FL', 25.7617, -80.1918),
+  ('Tampa', 'FL', 27.9506, -82.4572), ('Orlando', 'FL', 28.5383, -81.3792),
+  ('Columbus', 'OH', 39.9612, -82.9988), ('Cleveland', 'OH', 41.4993, -81.6944),
+  ('Cincinnati', 'OH', 39.1031, -84.5120), ('Charlotte', 'NC', 35.2271, -80.8431),
+  ('Raleigh', 'NC', 35.7796, -78.6382), ('Asheville', 'NC', 35.5951, -82.5515),
+  ('Indianapolis', 'IN', 39.7684, -86.1581), ('Seattle', 'WA', 47.6062, -122.3321),
+  ('Spokane', 'WA', 47.6588, -117.4260), ('Denver', 'CO', 39.7392, -104.9903),
+  ('Washington', 'DC', 38.9072, -77.0369), ('Boston', 'MA', 42.3601, -71.0589),
+  ('Nashville', 'TN', 36.1627, -86.7816), ('Memphis', 'TN', 35.1495, -90.0490),
+  ('Detroit', 'MI', 42.3314, -83.0458), ('Oklahoma City', 'OK', 35.4676, -97.5164),
+  ('Tulsa', 'OK', 36.1540, -95.9928), ('Portland', 'OR', 45.5152, -122.6784),
+  ('Las Vegas', 'NV', 36.1699, -115.1398), ('Reno', 'NV', 39.5296, -119.8138),
+  ('Louisville', 'KY', 38.2527, -85.7585), ('Baltimore', 'MD', 39.2904, -76.6122),
+  ('Milwaukee', 'WI', 43.0389, -87.9065), ('Madison', 'WI', 43.0731, -89.4012),
+  ('Albuquerque', 'NM', 35.0844, -106.6504), ('Santa Fe', 'NM', 35.6870, -105.9378),
+  ('Kansas City', 'MO', 39.0997, -94.5786), ('St Louis', 'MO', 38.6270, -90.1994),
+  ('Atlanta', 'GA', 33.7490, -84.3880), ('Savannah', 'GA', 32.0809, -81.0912),
+  ('Athens', 'GA', 33.9519, -83.3576), ('Omaha', 'NE', 41.2565, -95.9345),
+  ('Minneapolis', 'MN', 44.9778, -93.2650), ('New Orleans', 'LA', 29.9511, -90.0715),
+  ('Salt Lake City', 'UT', 40.7608, -111.8910), ('Honolulu', 'HI', 21.3069, -157.8583),
+  ('Anchorage', 'AK', 61.2181, -149.9003), ('Richmond', 'VA', 37.5407, -77.4360),
+  ('Boise', 'ID', 43.6150, -116.2023), ('Birmingham', 'AL', 33.5186, -86.8104),
+  ('Providence', 'RI', 41.8240, -71.4128), ('Hartford', 'CT', 41.7658, -72.6734),
+  ('Newark', 'NJ', 40.7357, -74.1724), ('Des Moines', 'IA', 41.5868, -93.6250),
+  ('Little Rock', 'AR', 34.7465, -92.2896), ('Charleston', 'SC', 32.7765, -79.9311),
+  ('Burlington', 'VT', 44.4759, -73.2121), ('Portland', 'ME', 43.6591, -70.2568),
+  ('Manchester', 'NH', 42.9956, -71.4548), ('Wilmington', 'DE', 39.7391, -75.5398),
+  ('Jackson', 'MS', 32.2988, -90.1848), ('Fargo', 'ND', 46.8772, -96.7898),
+  ('Sioux Falls', 'SD', 43.5446, -96.7311), ('Billings', 'MT', 45.7833, -108.5007),
+  ('Cheyenne', 'WY', 41.1400, -104.8202), ('Charleston', 'WV', 38.3498, -81.6326),
+  ('Wichita', 'KS', 37.6872, -97.3301),
+]
+
+_LOCATIONS = {(normalize(city), state): (latitude, longitude) for city, state, latitude, longitude in CITIES}
+
+
+def geocode(city, state):
+  # the (latitude, longitude) of a city in CITIES, or (None, None); "st. louis"
+  # finds St Louis
+  return _LOCATIONS.get((normalize(city), (state or '').strip().upper()), (None, None))
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+  # great-circle distance by the haversine formula
+  lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+  a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+  return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude, longitude, radius_km):
+  # (min_lat, max_lat, min_lon, max_lon) around every point within radius_km;
+  # longitudes may run past +-180 near the antimeridian, and span all of
+  # them when the circle reaches a pole
+  angle = radius_km / EARTH_RADIUS_KM
+  min_lat = latitude - math.degrees(angle)
+  max_lat = latitude + math.degrees(angle)
+  if min_lat <= -90 or max_lat >= 90:
+    return max(min_lat, -90), min(max_lat, 90), -180, 180
+  spread = math.sin(angle) / math.cos(math.radians(latitude))
+  if spread >= 1:
+    return min_lat, max_lat, -180, 180
+  delta = math.degrees(math.asin(spread))
+  return min_lat, max_lat, longitude - delta, longitude + delta
+
+
+class GridIndex(object):
+  """Points in cells of cell_degrees by cell_degrees, answering nearest
+  within a radius queries by measuring only the points of the cells the
+  circle's bounding box covers, nearest cells first.
+
+  Venues are located at the centre of their city, so most share a point
+  with others: each cell keeps a point once with the ids at it, and a query
+  measures one distance per point rather than per venue.
+  """
+
+  def __init__(self, cell_degrees=0.05):
+    self.cell_degrees = cell_degrees
+    self.columns = int(round(360 / cell_degrees))
+    self.cells = {}
+    self.points = {}
+    self.lock = threading.RLock()
+    self.built = False
+
+  def __len__(self):
+    return len(self.points)
+
+  def _cell(self, latitude, longitude):
+    return int(math.floor(latitude / self.cell_degrees)), int(math.floor(longitude / self.cell_degrees))
+
+  def build(self, rows):
+    # replaces the points with (id, latitude, longitude) rows, skipping rows
+    # without a location; queries keep using the old points meanwhile
+    built = GridIndex(self.cell_degrees)
+    for id, latitude, longitude in rows:
+      built.add(id, latitude, longitude)
+    with self.lock:
+      self.cells, self.points = built.cells, built.points
+      self.built = True
+
+  def add(self, id, latitude, longitude):
+    with self.lock:
+      self.remove(id)
+      if latitude is None or longitude is None:
+        return
+      point = (latitude, longitude)
+      self.points[id] = point
+      self.cells.setdefault(self._cell(*point), {}).setdefault(point, set()).add(id)
+
+  def remove(self, id):
+    with self.lock:
+      point = self.points.pop(id, None)
+      if point is None:
+        return
+      key = self._cell(*point)
+      cell = self.cells[key]
+      cell[point].discard(id)
+      if not cell[point]:
+        del cell[point]
+        if not cell:
+          del self.cells[key]
+
+  def _covered(self, min_lat, max_lat, min_lon, max_lon):
+    # the keys of the occupied cells in the box, wrapping longitudes past
+    # +-180; scans the occupied cells instead when the box has more
+    first_row, first_column = self._cell(min_lat, min_lon)
+    last_row, last_column = self._cell(max_lat, max_lon)
+    rows = range(first_row, last_row + 1)
+    half = self.columns // 2
+    columns = {(column + half) % self.columns - half
+               for column in range(first_column, min(last_column + 1, first_column + self.columns))}
+    if len(rows) * len(columns) > len(self.cells):
+      return [key for key in self.cells if key[0] in rows and key[1] in columns]
+    return [(row, column) for row in rows for column in columns if (row, column) in self.cells]
+
+  def _reach(self, key, latitude, longitude):
+    # a lower bound of the distance from the point to the cell: to the point
+    # of its nearest meridian edge, or of the meridian through the point when
+    # the cell spans its longitude, nearest the foot of the great circle
+    # through the point crossing that meridian at a right angle. The foot
+    # lies poleward of the point and, once the edge is over 90 degrees away,
+    # past the pole, so the edge end nearest it is taken around the circle
+    row, column = key
+    south, west = row * self.cell_degrees, column * self.cell_degrees
+    north = south + self.cell_degrees
+    east_by, west_by = (west - longitude) % 360, (longitude - west - self.cell_degrees) % 360
+    if (longitude - west) % 360 <= self.cell_degrees:
+      return distance_km(latitude, longitude, min(max(latitude, south), north), longitude)
+    if east_by <= west_by:
+      apart, edge_lon = east_by, longitude + east_by
+    else:
+      apart, edge_lon = west_by, longitude - west_by
+    foot = math.degrees(math.atan2(math.sin(math.radians(latitude)),
+                                   math.cos(math.radians(latitude)) * math.cos(math.radians(apart))))
+    if south <= foot <= north:
+      edge_lat = foot
+    else:
+      edge_lat = min((south, north), key=lambda edge: abs((edge - foot + 180) % 360 - 180))
+    # less a hair, so rounding never puts a cell past a point it holds
+    return distance_km(latitude, longitude, edge_lat, edge_lon) * (1 - 1e-9)
+
+  def nearest(self, latitude, longitude, radius_km, limit):
+    # the (distance_km, id) of the limit ids nearest the point within
+    # radius_km, nearest first; cells are measured nearest first, and the
+    # walk stops at the first cell that is farther than the limit-th id found
+    found = []
+    with self.lock:
+      cells = sorted((self._reach(key, latitude, longitude), key)
+                     for key in self._covered(*bounding_box(latitude, longitude, radius_km)))
+      for reach, key in cells:
+        if reach > radius_km or (len(found) == limit and reach > -found[0][0]):
+          break
+        for point, ids in self.cells[key].items():
+          distance = distance_km(latitude, longitude, *point)
+          if distance > radius_km:
+            continue
+          # a heap of the limit nearest so far, the farthest on top
+          for id in ids:
+            if len(found) < limit:
+              heapq.heappush(found, (-distance, -id))
+            elif (-distance, -id) > found[0]:
+              heapq.heapreplace(found, (-distance, -id))
+    return sorted((-distance, -id) for distance, id in found)
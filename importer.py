@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+from itertools import islice
+
+import sqlalchemy as sa
+from werkzeug.datastructures import MultiDict
+
+
+def read_rows(path, format=None):
+  # yields one dict per row of a CSV file with a header line, or per line of
+  # an NDJSON file; the format is taken from the extension unless given
+  format = format or ('ndjson' if path.endswith(('.ndjson', '.jsonl', '.json')) else 'csv')
+  with open(path, newline='', encoding='utf-8') as f:
+    if format == 'csv':
+      for row in csv.DictReader(f):
+        yield row
+    else:
+      for line in f:
+        if line.strip():
+          yield json.loads(line)
+
+
+def validate(form_class, row):
+  # runs row through the same form the create pages use and returns
+  # (data, errors), the form data when it validates or the errors otherwise
+  formdata = MultiDict()
+  for key, value in row.items():
+    if isinstance(value, list):
+      for item in value:
+        formdata.add(key, item)
+    elif value is not None:
+      formdata.add(key, str(value))
+  form = form_class(formdata)
+  if form.validate():
+    return form.data, None
+  return None, form.errors
+
+
+def batches(iterable, size):
+  iterator = iter(iterable)
+  while True:
+    batch = list(islice(iterator, size))
+    if not batch:
+      return
+    yield batch
+
+
+class BulkWriter(object):
+  """Inserts batches of rows into one table and returns their new ids.
+
+  On postgres the ids are taken from the table sequence up front and the rows
+  are streamed in with COPY; elsewhere they go through a multi-row INSERT
+  with RETURNING.
+  """
+
+  def __init__(self, connection, table, columns):
+    self.connection = connection
+    self.table = table
+    self.columns = list(columns)
+    self.postgres = connection.dialect.name == 'postgresql'
+
+  def write(self, rows):
+    if not rows:
+      return []
+    if self.postgres:
+      return self._copy(rows)
+    result = self.connection.execute(
+      sa.insert(self.table).returning(self.table.c.id, sort_by_parameter_order=True),
+      [dict(zip(self.columns, row)) for row in rows])
+    return [id for id, in result]
+
+  def _copy(self, rows):
+    ids = [id for id, in self.connection.execute(
+      sa.text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :n)"),
+      {'table': '"{}"'.format(self.table.name), 'n': len(rows)})]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    for id, row in zip(ids, rows):
+      # unquoted empty fields are NULL to COPY, quoted ones empty strings
+      writer.writerow([id] + [value.isoformat(' ') if hasattr(value, 'isoformat') else value for value in row])
+    sql = 'COPY "{}" (id, {}) FROM STDIN WITH (FORMAT csv)'.format(
+      self.table.name, ', '.join('"{}"'.format(column) for column in self.columns))
+    cursor = self.connection.connection.cursor()
+    if hasattr(cursor, 'copy_expert'):
+      # psycopg2
+      buffer.seek(0)
+      cursor.copy_expert(sql, buffer)
+    else:
+      # psycopg 3
+      with cursor.copy(sql) as copy:
+        copy.write(buffer.getvalue())
+    return ids
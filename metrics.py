@@ -0,0 +1,181 @@
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+from flask import before_render_template, g, request, template_rendered
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+HELP = {
+  'fyyur_http_requests_total': ('counter', 'Requests served, by endpoint, method and status.'),
+  'fyyur_http_request_duration_seconds': ('histogram', 'Time to build the response, by endpoint.'),
+  'fyyur_http_response_size_bytes': ('histogram', 'Size of the response body, by endpoint; streamed responses are left out.'),
+  'fyyur_http_request_queries': ('histogram', 'SQL statements run per request, by endpoint.'),
+  'fyyur_db_duration_seconds': ('histogram', 'Time spent in SQL per request, by endpoint, from the timed sample of requests.'),
+  'fyyur_template_render_seconds': ('histogram', 'Time to render a template, by template.'),
+}
+
+
+class Metrics(object):
+  """Request metrics in the Prometheus text format.
+
+  Every thread records into a shard of its own, so requests never wait on
+  each other; the lock is taken once per thread, to register its shard, and
+  once more when the thread exits and its shard is merged into retired.
+  render() adds the shards up when /metrics is scraped.
+  """
+
+  def __init__(self, app=None):
+    self.local = threading.local()
+    self.lock = threading.Lock()
+    self.shards = []
+    # the totals of the threads that have exited
+    self.retired = {}
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.before_request(self._start)
+    app.after_request(self._finish)
+    before_render_template.connect(self._start_template, app)
+    template_rendered.connect(self._finish_template, app)
+    app.extensions['metrics'] = self
+
+  def _shard(self):
+    shard = getattr(self.local, 'shard', None)
+    if shard is None:
+      shard = self.local.shard = {}
+      with self.lock:
+        self.shards.append(shard)
+      # the thread-local goes with its thread, and the owner with it
+      self.local.owner = _Owner()
+      weakref.finalize(self.local.owner, self._retire, shard)
+    return shard
+
+  def _retire(self, shard):
+    with self.lock:
+      self.shards.remove(shard)
+      _add(self.retired, shard)
+
+  def inc(self, name, labels, value=1):
+    shard = self._shard()
+    key = (name, labels)
+    shard[key] = shard.get(key, 0) + value
+
+  def observe(self, name, labels, value, buckets):
+    # histograms are kept as one count per bucket, then the sum and count
+    shard = self._shard()
+    key = (name, labels)
+    histogram = shard.get(key)
+    if histogram is None:
+      histogram = shard[key] = [buckets] + [0] * (len(buckets) + 2)
+    index = bisect_left(buckets, value)
+    if index < len(buckets):
+      histogram[index + 1] += 1
+    histogram[-2] += value
+    histogram[-1] += 1
+
+  def _start(self):
+    g.metrics_started = time.perf_counter()
+
+  def _finish(self, response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+      return response
+    endpoint = (('endpoint', request.endpoint or 'none'),)
+    self.inc('fyyur_http_requests_total', endpoint + (('method', request.method), ('status', str(response.status_code))))
+    self.observe('fyyur_http_request_duration_seconds', endpoint, time.perf_counter() - started, LATENCY_BUCKETS)
+    if not response.is_streamed:
+      self.observe('fyyur_http_response_size_bytes', endpoint, response.calculate_content_length() or 0, SIZE_BUCKETS)
+    sql = g.get('sql')
+    if sql is not None:
+      self.observe('fyyur_http_request_queries', endpoint, sql.count, QUERY_BUCKETS)
+      if sql.timed:
+        self.observe('fyyur_db_duration_seconds', endpoint, sql.time, LATENCY_BUCKETS)
+    return response
+
+  def _start_template(self, sender, template, context, **extra):
+    g.setdefault('templates_started', []).append(time.perf_counter())
+
+  def _finish_template(self, sender, template, context, **extra):
+    started = g.get('templates_started')
+    if started:
+      self.observe('fyyur_template_render_seconds', (('template', template.name or 'string'),),
+                   time.perf_counter() - started.pop(), LATENCY_BUCKETS)
+
+  def collect(self):
+    # the shards added up, as {name: {labels: value or histogram}}
+    added = {}
+    with self.lock:
+      _add(added, self.retired)
+      shards = list(self.shards)
+    for shard in shards:
+      _add(added, shard)
+    totals = {}
+    for (name, labels), value in added.items():
+      totals.setdefault(name, {})[labels] = value
+    return totals
+
+  def render(self, gauges=()):
+    # the text exposition of the collected series followed by gauges, a
+    # list of (name, kind, help, {labels: value}) read at scrape time from
+    # elsewhere, such as the page cache and the connection pools
+    lines = []
+    totals = self.collect()
+    for name in sorted(totals):
+      kind, help = HELP.get(name, ('untyped', ''))
+      lines.append('# HELP {} {}'.format(name, help))
+      lines.append('# TYPE {} {}'.format(name, kind))
+      for labels, value in sorted(totals[name].items()):
+        if kind != 'histogram':
+          lines.append('{}{} {}'.format(name, _labels(labels), _number(value)))
+          continue
+        buckets, counts = value[0], value[1:-2]
+        cumulative = 0
+        for bound, count in zip(buckets, counts):
+          cumulative += count
+          lines.append('{}_bucket{} {}'.format(name, _labels(labels + (('le', _number(bound)),)), cumulative))
+        lines.append('{}_bucket{} {}'.format(name, _labels(labels + (('le', '+Inf'),)), value[-1]))
+        lines.append('{}_sum{} {}'.format(name, _labels(labels), _number(value[-2])))
+        lines.append('{}_count{} {}'.format(name, _labels(labels), value[-1]))
+    for name, kind, help, series in gauges:
+      lines.append('# HELP {} {}'.format(name, help))
+      lines.append('# TYPE {} {}'.format(name, kind))
+      for labels, value in sorted(series.items()):
+        if value is not None:
+          lines.append('{}{} {}'.format(name, _labels(labels), _number(value)))
+    return '\n'.join(lines) + '\n'
+
+
+class _Owner(object):
+  # held only by a thread's thread-local, to tell when the thread is gone
+  pass
+
+
+def _add(totals, shard):
+  # adds the counters and histograms of shard into totals, both keyed by
+  # (name, labels)
+  for key, value in list(shard.items()):
+    if isinstance(value, list):
+      total = totals.get(key)
+      if total is None:
+        totals[key] = list(value)
+      else:
+        for i in range(1, len(value)):
+          total[i] += value[i]
+    else:
+      totals[key] = totals.get(key, 0) + value
+
+
+def _labels(labels):
+  if not labels:
+    return ''
+  return '{' + ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                        for key, value in labels) + '}'
+
+
+def _number(value):
+  return repr(float(value)) if isinstance(value, float) else str(value)
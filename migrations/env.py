@@ -27,6 +27,18 @@ config.set_main_option(
     str(current_app.extensions['migrate'].db.engine.url).replace('%', '%%'))
 target_metadata = current_app.extensions['migrate'].db.metadata
 
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # the model objects declared with ddl_if(dialect=...) exist only on
+    # that dialect, as in the migrations creating them; elsewhere autogenerate
+    # and flask db check leave them out instead of reporting them missing
+    ddl_if = getattr(object, '_ddl_if', None)
+    if reflected or ddl_if is None or ddl_if.dialect is None:
+        return True
+    dialects = (ddl_if.dialect,) if isinstance(ddl_if.dialect, str) else ddl_if.dialect
+    return context.get_context().dialect.name in dialects
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -47,7 +59,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=target_metadata, literal_binds=True
+        url=url, target_metadata=target_metadata, literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -83,6 +96,7 @@ def run_migrations_online():
             connection=connection,
             target_metadata=target_metadata,
             process_revision_directives=process_revision_directives,
+            include_object=include_object,
             **current_app.extensions['migrate'].configure_args
         )
 
@@ -0,0 +1,30 @@
+"""give venues a latitude and longitude
+
+flask geocode fills them in for the venues already listed.
+
+Revision ID: 030d643652c4
+Revises: f018c2dc0809
+Create Date: 2026-10-18 19:12:40.286315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '030d643652c4'
+down_revision = 'f018c2dc0809'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('Venue') as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('Venue') as batch_op:
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
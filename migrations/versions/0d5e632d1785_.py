@@ -0,0 +1,32 @@
+"""add updated_at to venues, artists and shows
+
+Revision ID: 0d5e632d1785
+Revises: 5b1f0c7e2a94
+Create Date: 2026-10-18 12:20:43.117092
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0d5e632d1785'
+down_revision = '5b1f0c7e2a94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing rows start out as updated now, new rows get it from the models
+    for table in ('Venue', 'Artist', 'Show'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                          server_default=sa.func.now()))
+            batch_op.create_index('ix_{}_updated_at'.format(table), ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('Show', 'Artist', 'Venue'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_index('ix_{}_updated_at'.format(table))
+            batch_op.drop_column('updated_at')
@@ -0,0 +1,116 @@
+"""move artist genres into Genre and ArtistGenre tables
+
+Revision ID: 2cbd2d19b438
+Revises: 3e1207de17d4
+Create Date: 2026-10-18 15:20:44.103519
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2cbd2d19b438'
+down_revision = '3e1207de17d4'
+branch_labels = None
+depends_on = None
+
+# the choices of ArtistForm.genres when this revision was written
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop',
+    'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae',
+    'Rock n Roll', 'Soul', 'Other',
+]
+
+# the search vector of 5b1f0c7e2a94, which has to be dropped while the
+# genres column it reads changes type
+ARTIST_VECTOR = """
+    setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(city, '') || ' ' || coalesce(state, '')), 'B') ||
+    setweight(to_tsvector('simple', translate(coalesce(genres, ''), '{}",', '    ')), 'C')
+"""
+
+
+def parse_genres(value):
+    # the canonical genres in a set literal such as {Jazz,"Rock n Roll"} or a
+    # stringified list such as ['Jazz', 'Rock n Roll']; unknown ones are Other
+    canonical = {genre.casefold(): genre for genre in GENRES}
+    genres = []
+    for name in re.split(r'[{}\[\]",\']+', value or ''):
+        name = name.strip()
+        if name:
+            genre = canonical.get(name.casefold(), 'Other')
+            if genre not in genres:
+                genres.append(genre)
+    return genres
+
+
+def genres_literal(genres):
+    return '{' + ','.join('"{}"'.format(genre) if ' ' in genre else genre for genre in genres) + '}'
+
+
+def alter_genres(type_):
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_Artist_search_vector', table_name='Artist')
+        op.drop_column('Artist', 'search_vector')
+        op.alter_column('Artist', 'genres', type_=type_)
+        op.execute('ALTER TABLE "Artist" ADD COLUMN search_vector tsvector '
+                   'GENERATED ALWAYS AS ({}) STORED'.format(ARTIST_VECTOR))
+        op.create_index('ix_Artist_search_vector', 'Artist', ['search_vector'], unique=False,
+                        postgresql_using='gin')
+    else:
+        with op.batch_alter_table('Artist') as batch_op:
+            batch_op.alter_column('genres', type_=type_)
+
+
+def upgrade():
+    genre = op.create_table(
+        'Genre',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name'),
+    )
+    artist_genre = op.create_table(
+        'ArtistGenre',
+        sa.Column('artist_id', sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('artist_id', 'genre_id'),
+    )
+    op.create_index('ix_ArtistGenre_genre_id_artist_id', 'ArtistGenre', ['genre_id', 'artist_id'], unique=False)
+    op.bulk_insert(genre, [{'id': i, 'name': name} for i, name in enumerate(GENRES, 1)])
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('''SELECT setval(pg_get_serial_sequence('"Genre"', 'id'), {})'''.format(len(GENRES)))
+
+    # the genres column holds long genre lists too, as the copy the pages show
+    alter_genres(sa.Text())
+
+    # backfill the association and rewrite the copies in canonical form
+    connection = op.get_bind()
+    artist = sa.table('Artist', sa.column('id', sa.Integer()), sa.column('genres', sa.Text()))
+    ids = {name: i for i, name in enumerate(GENRES, 1)}
+    links, copies = [], []
+    for artist_id, value in connection.execute(sa.select(artist.c.id, artist.c.genres)):
+        genres = parse_genres(value)
+        links.extend({'artist_id': artist_id, 'genre_id': ids[name]} for name in genres)
+        copies.append({'artist_id': artist_id, 'value': genres_literal(genres)})
+    if links:
+        op.bulk_insert(artist_genre, links)
+    if copies:
+        connection.execute(artist.update().where(artist.c.id == sa.bindparam('artist_id'))
+                           .values(genres=sa.bindparam('value')), copies)
+
+
+def downgrade():
+    # genre lists longer than 120 characters do not fit the old column
+    artist = sa.table('Artist', sa.column('genres', sa.Text()))
+    op.execute(artist.update().where(sa.func.length(artist.c.genres) > 120)
+               .values(genres=sa.func.substr(artist.c.genres, 1, 120)))
+    alter_genres(sa.String(length=120))
+    op.drop_index('ix_ArtistGenre_genre_id_artist_id', table_name='ArtistGenre')
+    op.drop_table('ArtistGenre')
+    op.drop_table('Genre')
@@ -0,0 +1,53 @@
+"""add show counters to venues and artists
+
+Revision ID: 3e1207de17d4
+Revises: 0d5e632d1785
+Create Date: 2026-10-18 13:41:09.562810
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e1207de17d4'
+down_revision = '0d5e632d1785'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.add_column(sa.Column('is_past', sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.create_index('ix_Show_rollover', 'Show', ['start_time'], unique=False,
+                    postgresql_where=sa.text('NOT is_past'), sqlite_where=sa.text('NOT is_past'))
+    for table in ('Venue', 'Artist'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('upcoming_shows_count', sa.Integer(), nullable=False, server_default='0'))
+            batch_op.add_column(sa.Column('past_shows_count', sa.Integer(), nullable=False, server_default='0'))
+            batch_op.add_column(sa.Column('shows_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # backfill from the existing shows
+    show = sa.table('Show', sa.column('id'), sa.column('venue_id'), sa.column('artist_id'),
+                    sa.column('start_time'), sa.column('is_past', sa.Boolean()))
+    op.execute(show.update().values(is_past=True).where(show.c.start_time < sa.func.now()))
+    for table, key in (('Venue', show.c.venue_id), ('Artist', show.c.artist_id)):
+        entity = sa.table(table, sa.column('id'), sa.column('upcoming_shows_count'),
+                          sa.column('past_shows_count'), sa.column('shows_count'))
+        shows = sa.select(sa.func.count(show.c.id)).where(key == entity.c.id)
+        op.execute(entity.update().values(
+            upcoming_shows_count=shows.where(show.c.is_past == sa.false()).scalar_subquery(),
+            past_shows_count=shows.where(show.c.is_past == sa.true()).scalar_subquery(),
+            shows_count=shows.scalar_subquery(),
+        ))
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('shows_count')
+            batch_op.drop_column('past_shows_count')
+            batch_op.drop_column('upcoming_shows_count')
+    op.drop_index('ix_Show_rollover', table_name='Show')
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.drop_column('is_past')
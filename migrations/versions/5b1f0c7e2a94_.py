@@ -0,0 +1,53 @@
+"""add full-text search vectors to venues and artists
+
+Revision ID: 5b1f0c7e2a94
+Revises: cfe4352668d9
+Create Date: 2026-10-18 11:02:17.804351
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1f0c7e2a94'
+down_revision = 'cfe4352668d9'
+branch_labels = None
+depends_on = None
+
+# the name weighs most, then the location, then the genres; genres are
+# stored as a set literal such as {Jazz,"Rock n Roll"}
+VENUE_VECTOR = """
+    setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(city, '') || ' ' || coalesce(state, '')), 'B')
+"""
+ARTIST_VECTOR = VENUE_VECTOR + """ ||
+    setweight(to_tsvector('simple', translate(coalesce(genres, ''), '{}",', '    ')), 'C')
+"""
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # generated columns keep the vectors current on every insert and update
+        op.execute('ALTER TABLE "Venue" ADD COLUMN search_vector tsvector '
+                   'GENERATED ALWAYS AS ({}) STORED'.format(VENUE_VECTOR))
+        op.execute('ALTER TABLE "Artist" ADD COLUMN search_vector tsvector '
+                   'GENERATED ALWAYS AS ({}) STORED'.format(ARTIST_VECTOR))
+        op.create_index('ix_Venue_search_vector', 'Venue', ['search_vector'], unique=False,
+                        postgresql_using='gin')
+        op.create_index('ix_Artist_search_vector', 'Artist', ['search_vector'], unique=False,
+                        postgresql_using='gin')
+    else:
+        op.add_column('Venue', sa.Column('search_vector', sa.Text(), nullable=True))
+        op.add_column('Artist', sa.Column('search_vector', sa.Text(), nullable=True))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_Artist_search_vector', table_name='Artist')
+        op.drop_index('ix_Venue_search_vector', table_name='Venue')
+    with op.batch_alter_table('Artist') as batch_op:
+        batch_op.drop_column('search_vector')
+    with op.batch_alter_table('Venue') as batch_op:
+        batch_op.drop_column('search_vector')
@@ -0,0 +1,41 @@
+"""add indexes for the venue, artist and show access paths
+
+Revision ID: cfe4352668d9
+Revises: 0edfef3e08e1
+Create Date: 2026-10-18 10:12:41.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cfe4352668d9'
+down_revision = '0edfef3e08e1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+    op.create_index('ix_Venue_state_city', 'Venue', ['state', 'city'], unique=False)
+
+    # trigram indexes serve the ILIKE '%term%' name searches on postgres
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index('ix_Venue_name_trgm', 'Venue', ['name'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+        op.create_index('ix_Artist_name_trgm', 'Artist', ['name'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_Artist_name_trgm', table_name='Artist')
+        op.drop_index('ix_Venue_name_trgm', table_name='Venue')
+    op.drop_index('ix_Venue_state_city', table_name='Venue')
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
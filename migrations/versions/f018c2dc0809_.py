@@ -0,0 +1,71 @@
+"""give shows an end time and keep a venue from being booked twice at once
+
+Revision ID: f018c2dc0809
+Revises: 2cbd2d19b438
+Create Date: 2026-10-18 17:02:31.418250
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f018c2dc0809'
+down_revision = '2cbd2d19b438'
+branch_labels = None
+depends_on = None
+
+log = logging.getLogger('alembic.runtime.migration')
+
+# SHOW_DURATION_MINUTES when this revision was written
+DURATION_MINUTES = 120
+
+# shows that begin before an earlier show of their venue has ended, as the
+# /shows/overlaps report lists them
+OVERLAPS = """
+    SELECT id, venue_id, start_time FROM (
+        SELECT id, venue_id, start_time, max(end_time) OVER (
+            PARTITION BY venue_id ORDER BY start_time, id
+            ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS busy_until
+        FROM "Show") AS shows
+    WHERE start_time < busy_until
+    ORDER BY venue_id, start_time
+    LIMIT 20
+"""
+
+CONSTRAINT = ('ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_venue_booking" '
+              'EXCLUDE USING gist (venue_id WITH =, tsrange(start_time, end_time) WITH &&)')
+
+
+def upgrade():
+    postgres = op.get_bind().dialect.name == 'postgresql'
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    if postgres:
+        op.execute('''UPDATE "Show" SET end_time = start_time + interval '{} minutes' '''.format(DURATION_MINUTES))
+    else:
+        op.execute('''UPDATE "Show" SET end_time = datetime(start_time, '+{} minutes')'''.format(DURATION_MINUTES))
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+
+    if postgres:
+        # btree_gist lets the constraint compare venue_id with = in a GiST index
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        overlapping = op.get_bind().execute(sa.text(OVERLAPS)).fetchall()
+        if overlapping:
+            # the upgrade goes on without the constraint: new bookings are
+            # still checked by the app, only not under concurrent writes
+            log.warning(
+                'not adding ex_Show_venue_booking: shows overlap an earlier show of their venue, e.g. %s. '
+                'Delete or move them (GET /shows/overlaps lists them all), then run: %s',
+                ', '.join('show {} (venue {}, {})'.format(*row) for row in overlapping), CONSTRAINT)
+        else:
+            op.execute(CONSTRAINT)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('ALTER TABLE "Show" DROP CONSTRAINT IF EXISTS "ex_Show_venue_booking"')
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.drop_column('end_time')
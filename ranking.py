@@ -0,0 +1,88 @@
+import threading
+import time
+
+
+class TopN(object):
+  """The size highest ranked rows of a query, kept in memory between loads.
+
+  load(limit) returns up to limit (key, id, data) of the query, highest key
+  first. Twice size rows are kept, so that removals rarely leave fewer than
+  size, and every row not kept ranks at or below floor, the highest key
+  dropped so far. Writes report rows with put() and remove(); rows rising
+  above floor come in, rows falling to it go out. The rows are loaded again
+  once fewer than size are left while others may rank, and every ttl
+  seconds, which also catches writes made by other processes.
+  """
+
+  def __init__(self, load, size=10, ttl=300):
+    self.load = load
+    self.size = size
+    self.ttl = ttl
+    self.lock = threading.RLock()
+    self.rows = {}
+    # () ranks below every key: nothing was dropped
+    self.floor = ()
+    self.loaded_at = None
+    # counts put(), update() and remove(), to tell whether one came in while
+    # the rows were loading
+    self.writes = 0
+
+  def _reload(self):
+    # the rows are read without the lock: under asgi.py the callers are
+    # coroutines of one thread, which a lock held over a query would leave
+    # waiting on each other. Writes reported meanwhile may be missing from
+    # what was read, so then the rows are loaded again on the next call
+    with self.lock:
+      writes = self.writes
+    capacity = 2 * self.size
+    rows = self.load(capacity + 1)
+    with self.lock:
+      self.rows = {id: (key, data) for key, id, data in rows[:capacity]}
+      self.floor = rows[capacity][0] if len(rows) > capacity else ()
+      self.loaded_at = time.monotonic() if self.writes == writes else None
+
+  def top(self):
+    # the data of the size highest rows, highest first; queries only when
+    # the rows are due to be loaded again
+    with self.lock:
+      due = self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl
+    if due:
+      self._reload()
+    with self.lock:
+      ranked = sorted(self.rows.values(), key=lambda row: row[0], reverse=True)
+      return [data for key, data in ranked[:self.size]]
+
+  def put(self, id, key, data):
+    # a row was added or its key changed
+    with self.lock:
+      self.writes += 1
+      if self.loaded_at is None:
+        return
+      if key > self.floor:
+        self.rows[id] = (key, data)
+        while len(self.rows) > 2 * self.size:
+          lowest = min(self.rows, key=lambda id: self.rows[id][0])
+          self.floor = max(self.floor, self.rows.pop(lowest)[0])
+      else:
+        self.remove(id)
+
+  def update(self, id, data):
+    # the data of a row changed but not its key
+    with self.lock:
+      self.writes += 1
+      if id in self.rows:
+        key, old = self.rows[id]
+        self.rows[id] = (key, dict(old, **data))
+
+  def remove(self, id):
+    with self.lock:
+      self.writes += 1
+      if self.rows.pop(id, None) is not None and len(self.rows) < self.size and self.floor != ():
+        self.loaded_at = None
+
+  def clear(self):
+    with self.lock:
+      self.writes += 1
+      self.rows.clear()
+      self.floor = ()
+      self.loaded_at = None
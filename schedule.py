@@ -0,0 +1,191 @@
+import random
+import threading
+
+
+class _Node(object):
+  __slots__ = ('start', 'end', 'key', 'priority', 'max_end', 'left', 'right')
+
+  def __init__(self, start, end, key):
+    self.start = start
+    self.end = end
+    self.key = key
+    self.priority = random.random()
+    self.max_end = end
+    self.left = self.right = None
+
+
+def _update(node):
+  node.max_end = node.end
+  for child in (node.left, node.right):
+    if child is not None and child.max_end > node.max_end:
+      node.max_end = child.max_end
+  return node
+
+
+def _split(node, order):
+  # the nodes before order and the nodes from order on
+  if node is None:
+    return None, None
+  if (node.start, node.key) < order:
+    node.right, right = _split(node.right, order)
+    return _update(node), right
+  left, node.left = _split(node.left, order)
+  return left, _update(node)
+
+
+def _merge(left, right):
+  if left is None or right is None:
+    return left or right
+  if left.priority > right.priority:
+    left.right = _merge(left.right, right)
+    return _update(left)
+  right.left = _merge(left, right.left)
+  return _update(right)
+
+
+class IntervalTree(object):
+  """Half-open [start, end) intervals answering overlap checks in O(log n).
+
+  A treap ordered by (start, key) where every node also holds the latest
+  end below it, so a check walks down one path: into the left subtree when
+  something there ends after the start asked about, right otherwise.
+  """
+
+  def __init__(self):
+    self.root = None
+    self.intervals = {}
+
+  def __len__(self):
+    return len(self.intervals)
+
+  def add(self, start, end, key):
+    if key in self.intervals:
+      self.remove(key)
+    self.intervals[key] = (start, end)
+    left, right = _split(self.root, (start, key))
+    self.root = _merge(_merge(left, _Node(start, end, key)), right)
+
+  def remove(self, key):
+    start, end = self.intervals.pop(key)
+    left, right = _split(self.root, (start, key))
+    middle, right = _split(right, (start, key, None))
+    self.root = _merge(left, right)
+
+  def overlap(self, start, end):
+    # the key of an interval overlapping [start, end), or None
+    node = self.root
+    while node is not None:
+      if node.start < end and start < node.end:
+        return node.key
+      if node.left is not None and node.left.max_end > start:
+        node = node.left
+      elif node.start < end:
+        node = node.right
+      else:
+        return None
+    return None
+
+
+class Schedules(object):
+  """The bookings of each venue as an IntervalTree, loaded on first use.
+
+  load(venue_id) returns the (start, end, show id) of the venue's shows, and
+  version(venue_id) a value that changes whenever they do, cheap to read.
+  Every check reads the version first and loads the tree again when it
+  changed since, so shows written by other processes are seen by the next
+  check. Bookings and cancellations this process commits go into the tree
+  with the version they left, through booked() and cancelled(), and cost no
+  load; bookings of rows not yet inserted, through book(), stay in the tree
+  until the venue's shows change.
+
+  Checks of one venue are serialized by the lock locked() returns, and
+  those of different venues run side by side.
+  """
+
+  def __init__(self, load, version):
+    self.load = load
+    self.version = version
+    self.trees = {}
+    self.locks = {}
+    # guards trees and locks, and is never held over a query
+    self.lock = threading.Lock()
+
+  def locked(self, venue_id):
+    # the lock of the venue, to hold over a check and the booking it allows
+    with self.lock:
+      return self.locks.setdefault(venue_id, threading.RLock())
+
+  def _tree(self, venue_id):
+    version = self.version(venue_id)
+    entry = self.trees.get(venue_id)
+    if entry is None or entry[1] != version:
+      tree = IntervalTree()
+      for start, end, key in self.load(venue_id):
+        tree.add(start, end, key)
+      entry = (tree, version)
+      with self.lock:
+        self.trees[venue_id] = entry
+    return entry[0]
+
+  def conflict(self, venue_id, start, end):
+    # the show of the venue overlapping [start, end), or None
+    with self.locked(venue_id):
+      return self._tree(venue_id).overlap(start, end)
+
+  def stale(self, venue_id):
+    # whether the venue's shows changed since its tree was loaded or booked
+    entry = self.trees.get(venue_id)
+    return entry is None or entry[1] != self.version(venue_id)
+
+  def book(self, venue_id, start, end, key):
+    # adds the booking unless it overlaps one, and returns the overlapping
+    # show, or None when the booking was added
+    with self.locked(venue_id):
+      tree = self._tree(venue_id)
+      conflict = tree.overlap(start, end)
+      if conflict is None:
+        tree.add(start, end, key)
+      return conflict
+
+  def booked(self, venue_id, start, end, key, version):
+    # a show this process committed, leaving the venue's shows at version
+    with self.locked(venue_id):
+      entry = self.trees.get(venue_id)
+      if entry is not None:
+        entry[0].add(start, end, key)
+        with self.lock:
+          self.trees[venue_id] = (entry[0], version)
+
+  def cancelled(self, venue_id, key, version):
+    # a show this process deleted, leaving the venue's shows at version
+    with self.locked(venue_id):
+      entry = self.trees.get(venue_id)
+      if entry is not None:
+        if key in entry[0].intervals:
+          entry[0].remove(key)
+        with self.lock:
+          self.trees[venue_id] = (entry[0], version)
+
+  def forget(self, venue_id):
+    with self.lock:
+      self.trees.pop(venue_id, None)
+
+  def clear(self):
+    with self.lock:
+      self.trees.clear()
+
+
+def overlaps(rows):
+  # one pass over (id, venue_id, start, end) rows sorted by venue and start,
+  # yielding (row, id, end) for every show that begins before an earlier
+  # show of its venue has ended, with that show's id and end; of the earlier
+  # shows it names the one ending last
+  venue = latest = None
+  for row in rows:
+    id, venue_id, start, end = row[:4]
+    if venue_id != venue:
+      venue, latest = venue_id, None
+    if latest is not None and start < latest[1]:
+      yield row, latest[0], latest[1]
+    if latest is None or end > latest[1]:
+      latest = (id, end)
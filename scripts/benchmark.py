@@ -0,0 +1,205 @@
+"""Time every read route of app.py against the current database.
+
+Each route is requested through the Flask test client; the script records
+latency percentiles, the number of queries and time spent in SQL (from the
+X-Query-Count and Server-Timing headers) and the peak memory allocated while
+building one response. Routes that write (create, edit, delete) are left out
+so runs stay comparable. The page cache is off unless --cache is given.
+
+Seed one database per scale and save a run against each:
+
+    for scale in 1k 100k 1m; do
+      export DATABASE_URL=sqlite:////tmp/fyyur-$scale.db
+      python scripts/seed_data.py --scale $scale --create
+      python scripts/benchmark.py --save bench-$scale.json
+    done
+
+and compare a later commit with a saved run:
+
+    python scripts/benchmark.py --compare bench-100k.json
+
+The exit status is 1 when a route answers with a server error.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# time the SQL of every request, without the debug panel or slow query log
+os.environ.setdefault('SQL_TIMING_SAMPLE_RATE', '1')
+os.environ.setdefault('SQL_DEBUG_PANEL', '0')
+os.environ.setdefault('SQL_SLOW_QUERY_MS', '0')
+
+from app import app, db, Venue, Artist, Show, encode_cursor
+from cache import NullCache
+
+# values for the URL arguments other than ids
+ARGUMENTS = {'kind': 'shows', 'format': 'ndjson', 'name': 'Jazz'}
+
+# query strings worth timing on top of the plain routes
+EXTRA = [
+  '/venues?page=2',
+  '/artists?genre=Jazz&genre=Blues',
+  '/venues/search?search_term=the',
+  '/artists/search?search_term=band',
+  '/shows/search?search_term=hall',
+  '/shows?before={cursor}',
+  '/venues/{venue_id}?past_before={cursor}',
+  '/search/suggest?q=the',
+  '/api/v1/venues?city=Chicago&fields=id,name',
+  '/api/v1/artists?genre=Jazz',
+  '/api/v1/shows?from={today}&limit=200',
+  '/api/v1/venues/{venue_id}?fields=name,upcoming_shows,past_shows',
+  '/calendar?city=Chicago&state=IL',
+  # New York, the busiest city of seed_data.py
+  '/venues/nearby?lat=40.7128&lon=-74.0060',
+  '/venues/nearby?lat=40.7128&lon=-74.0060&radius=500&limit=200',
+]
+
+
+def percentile(values, p):
+  values = sorted(values)
+  return values[min(int(round(p / 100.0 * (len(values) - 1))), len(values) - 1)]
+
+
+def server_timing(response, name):
+  for entry in response.headers.getlist('Server-Timing'):
+    match = re.match(r'{};dur=([\d.]+)'.format(name), entry)
+    if match:
+      return float(match.group(1))
+  return None
+
+
+def urls():
+  # every GET route, with the ids of the venue and artist with most shows,
+  # so the heaviest pages are the ones timed, followed by EXTRA
+  venue = db.session.query(Venue.id).order_by(Venue.shows_count.desc()).first()
+  artist = db.session.query(Artist.id).order_by(Artist.shows_count.desc()).first()
+  show = db.session.query(Show.id, Show.start_time).order_by(Show.id).first()
+  values = dict(ARGUMENTS, venue_id=venue.id if venue else 1, artist_id=artist.id if artist else 1,
+                show_id=show.id if show else 1)
+  values['cursor'] = encode_cursor(datetime.now(), 0)
+  values['today'] = datetime.now().date().isoformat()
+  found = []
+  for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+    if 'GET' not in rule.methods or rule.endpoint == 'static':
+      continue
+    found.append(re.sub(r'<(?:[^:>]+:)?([^>]+)>', lambda match: str(values[match.group(1)]), rule.rule))
+  return found + [url.format(**values) for url in EXTRA]
+
+
+def measure(client, url, iterations, warmup):
+  for i in range(warmup):
+    client.get(url).get_data()
+  latencies, db_times = [], []
+  for i in range(iterations):
+    started = time.perf_counter()
+    response = client.get(url)
+    body = response.get_data()
+    latencies.append((time.perf_counter() - started) * 1000)
+    db_time = server_timing(response, 'db')
+    if db_time is not None:
+      db_times.append(db_time)
+
+  # memory is traced on a request of its own, as tracing slows everything down
+  tracemalloc.start()
+  client.get(url).get_data()
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+
+  return {
+    'status': response.status_code,
+    'bytes': len(body),
+    'queries': int(response.headers.get('X-Query-Count', 0)),
+    'p50_ms': round(percentile(latencies, 50), 3),
+    'p90_ms': round(percentile(latencies, 90), 3),
+    'p99_ms': round(percentile(latencies, 99), 3),
+    'max_ms': round(max(latencies), 3),
+    'db_p50_ms': round(percentile(db_times, 50), 3) if db_times else None,
+    'peak_kb': round(peak / 1024.0, 1),
+  }
+
+
+def git_commit():
+  try:
+    return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                   cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def run(iterations, warmup, only=None, cache=False):
+  with app.app_context():
+    if not cache:
+      app.extensions['page_cache'] = NullCache()
+    meta = {
+      'commit': git_commit(),
+      'date': datetime.now().isoformat(timespec='seconds'),
+      'python': platform.python_version(),
+      'database': db.engine.dialect.name,
+      'venues': db.session.query(Venue).count(),
+      'artists': db.session.query(Artist).count(),
+      'shows': db.session.query(Show).count(),
+      'iterations': iterations,
+      'cache': cache,
+    }
+    targets = [url for url in urls() if not only or re.search(only, url)]
+    db.session.remove()
+  client = app.test_client()
+  routes = {}
+  for url in targets:
+    routes[url] = measure(client, url, iterations, warmup)
+  return {'meta': meta, 'routes': routes}
+
+
+def print_results(results, previous=None):
+  meta = results['meta']
+  print('{database}: {venues} venues, {artists} artists, {shows} shows, {iterations} requests per route'.format(**meta))
+  old = (previous or {}).get('routes', {})
+  print('{:<58} {:>6} {:>9} {:>9} {:>9} {:>8} {:>9}'.format('route', 'status', 'p50 ms', 'p99 ms', 'db ms', 'queries', 'peak kb'))
+  for url, route in results['routes'].items():
+    line = '{:<58} {:>6} {:>9} {:>9} {:>9} {:>8} {:>9}'.format(
+      url[:58], route['status'], route['p50_ms'], route['p99_ms'], route['db_p50_ms'] if route['db_p50_ms'] is not None else '-',
+      route['queries'], route['peak_kb'])
+    if url in old:
+      before = old[url]
+      change = (route['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+      line += '  p50 {:+.0f}%'.format(change)
+      if route['queries'] != before['queries']:
+        line += ', queries {} -> {}'.format(before['queries'], route['queries'])
+    print(line)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--iterations', type=int, default=20, help='timed requests per route')
+  parser.add_argument('--warmup', type=int, default=2, help='untimed requests per route first')
+  parser.add_argument('--only', metavar='REGEX', help='time only the routes matching REGEX')
+  parser.add_argument('--cache', action='store_true', help='keep the page cache on')
+  parser.add_argument('--save', metavar='FILE', help='write the results to FILE as JSON')
+  parser.add_argument('--compare', metavar='FILE', help='show how the results differ from a saved FILE')
+  args = parser.parse_args()
+
+  results = run(args.iterations, args.warmup, args.only, args.cache)
+  previous = None
+  if args.compare:
+    with open(args.compare) as f:
+      previous = json.load(f)
+  print_results(results, previous)
+  if args.save:
+    with open(args.save, 'w') as f:
+      json.dump(results, f, indent=2)
+  if any(route['status'] >= 500 for route in results['routes'].values()):
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,165 @@
+"""Compare the throughput of the read routes served sync (WSGI) and async (asgi.py).
+
+Both modes get the same number of requests with the same concurrency: the
+sync app through the Flask test client on a pool of --threads threads, as a
+threaded WSGI server would run it, and the ASGI app called directly from
+--concurrency asyncio tasks on one event loop, as uvicorn would. No server or
+socket is involved, so the numbers compare the two ways of waiting on the
+database rather than HTTP servers.
+
+The database has to be a server or a sqlite file, seeded first:
+
+    export DATABASE_URL=sqlite:////tmp/fyyur-10k.db
+    python scripts/seed_data.py --scale 10k --create
+    python scripts/benchmark_async.py --concurrency 50 --db-latency-ms 5
+
+--db-latency-ms adds a delay to every statement in both modes, standing in
+for the network round trip to a database server that a local sqlite file
+does not have; blocking in the sync mode, awaited in the async one.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+os.environ.setdefault('SQL_DEBUG_PANEL', '0')
+os.environ.setdefault('SQL_SLOW_QUERY_MS', '0')
+
+from sqlalchemy import event
+from sqlalchemy.util import await_only
+
+from app import app, db, Venue, Artist
+from asgi import application
+from cache import NullCache
+
+ROUTES = ['/venues', '/artists', '/shows', '/venues/{venue_id}', '/artists/{artist_id}',
+          '/genres/Jazz', '/api/v1/shows?limit=50', '/search/suggest?q=the',
+          '/venues/nearby?lat=40.7128&lon=-74.0060']
+
+
+def percentile(values, p):
+  values = sorted(values)
+  return values[min(int(round(p / 100.0 * (len(values) - 1))), len(values) - 1)]
+
+
+def summary(latencies, statuses, elapsed):
+  return {
+    'requests': len(latencies),
+    'errors': sum(1 for status in statuses if status >= 500),
+    'requests_per_s': round(len(latencies) / elapsed, 1),
+    'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+    'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+  }
+
+
+def add_latency(engine, seconds, wait):
+  @event.listens_for(engine, 'before_cursor_execute')
+  def delay(conn, cursor, statement, parameters, context, executemany):
+    wait(seconds)
+
+
+def run_sync(urls, threads):
+  client = app.test_client()
+
+  def get(url):
+    started = time.perf_counter()
+    response = client.get(url)
+    response.get_data()
+    return time.perf_counter() - started, response.status_code
+
+  started = time.perf_counter()
+  with ThreadPoolExecutor(threads) as pool:
+    results = list(pool.map(get, urls))
+  return summary([r[0] for r in results], [r[1] for r in results], time.perf_counter() - started)
+
+
+async def asgi_get(url):
+  path, _, query = url.partition('?')
+  scope = {'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http', 'path': path,
+           'root_path': '', 'query_string': query.encode(), 'headers': [(b'host', b'localhost')],
+           'server': ('localhost', 80), 'client': ('127.0.0.1', 0)}
+  status = []
+
+  async def receive():
+    return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+  async def send(message):
+    if message['type'] == 'http.response.start':
+      status.append(message['status'])
+
+  started = time.perf_counter()
+  await application(scope, receive, send)
+  return time.perf_counter() - started, status[0]
+
+
+async def run_async(urls, concurrency):
+  limit = asyncio.Semaphore(concurrency)
+
+  async def get(url):
+    async with limit:
+      return await asgi_get(url)
+
+  started = time.perf_counter()
+  results = await asyncio.gather(*[get(url) for url in urls])
+  return summary([r[0] for r in results], [r[1] for r in results], time.perf_counter() - started)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--requests', type=int, default=500, help='requests per mode')
+  parser.add_argument('--concurrency', type=int, default=50, help='requests in flight in the async mode')
+  parser.add_argument('--threads', type=int, default=8, help='worker threads of the sync mode')
+  parser.add_argument('--db-latency-ms', type=float, default=0, help='delay added to every SQL statement')
+  parser.add_argument('--save', metavar='FILE', help='write the results to FILE as JSON')
+  args = parser.parse_args()
+
+  with app.app_context():
+    if db.engine.url.database in (None, '', ':memory:'):
+      parser.error('the async mode needs a database server or a sqlite file in DATABASE_URL')
+    app.extensions['page_cache'] = NullCache()
+    venue = db.session.query(Venue.id).order_by(Venue.shows_count.desc()).first()
+    artist = db.session.query(Artist.id).order_by(Artist.shows_count.desc()).first()
+    routes = [route.format(venue_id=venue.id if venue else 1, artist_id=artist.id if artist else 1)
+              for route in ROUTES]
+    if args.db_latency_ms:
+      add_latency(db.engine, args.db_latency_ms / 1000.0, time.sleep)
+    db.session.remove()
+  if args.db_latency_ms:
+    add_latency(application.engine.sync_engine, args.db_latency_ms / 1000.0,
+                lambda seconds: await_only(asyncio.sleep(seconds)))
+  urls = [routes[i % len(routes)] for i in range(args.requests)]
+
+  # an untimed pass first in each mode, to open connections and compile
+  # templates; the async passes share a loop, as pooled connections belong to it
+  async def both():
+    await run_async(routes, args.concurrency)
+    return await run_async(urls, args.concurrency)
+
+  run_sync(routes, args.threads)
+  results = {
+    'meta': {'database': application.engine.dialect.name, 'requests': args.requests, 'threads': args.threads,
+             'concurrency': args.concurrency, 'db_latency_ms': args.db_latency_ms},
+    'sync': run_sync(urls, args.threads),
+    'async': asyncio.run(both()),
+  }
+  print('{requests} requests, {threads} threads (sync), {concurrency} in flight (async), '
+        '{db_latency_ms} ms added per statement'.format(**results['meta']))
+  print('{:<6} {:>10} {:>9} {:>9} {:>7}'.format('mode', 'req/s', 'p50 ms', 'p99 ms', 'errors'))
+  for mode in ('sync', 'async'):
+    result = results[mode]
+    print('{:<6} {:>10} {:>9} {:>9} {:>7}'.format(mode, result['requests_per_s'], result['p50_ms'],
+                                                    result['p99_ms'], result['errors']))
+  if args.save:
+    with open(args.save, 'w') as f:
+      json.dump(results, f, indent=2)
+  if results['sync']['errors'] or results['async']['errors']:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
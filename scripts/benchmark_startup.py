@@ -0,0 +1,98 @@
+"""Time a worker cold start: from importing app.py to its first response.
+
+Every run is a fresh interpreter that imports app, calls create_app() and
+requests one page through the test client, as a new gunicorn or autoscaled
+worker would. The script reports the median of each phase over --runs runs,
+first with the template bytecode cache emptied before every run (cold), then
+with the cache filled by the previous runs (warm).
+
+    DATABASE_URL=sqlite:////tmp/fyyur-1k.db python scripts/benchmark_startup.py --url /venues
+
+python -X importtime -c 'import app' shows what the import phase is made of.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+response = application.test_client().get({url!r})
+response.get_data()
+answered = time.perf_counter()
+print(json.dumps({{
+  'status': response.status_code,
+  'import_ms': (imported - started) * 1000,
+  'create_app_ms': (created - imported) * 1000,
+  'first_response_ms': (answered - created) * 1000,
+  'total_ms': (answered - started) * 1000,
+}}))
+'''
+
+PHASES = ('import_ms', 'create_app_ms', 'first_response_ms', 'total_ms')
+
+
+def median(values):
+  values = sorted(values)
+  middle = len(values) // 2
+  return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+def run(url, runs, cache_dir, cold):
+  env = dict(os.environ, TEMPLATE_CACHE_DIR=cache_dir, SQL_DEBUG_PANEL='0')
+  results = []
+  for i in range(runs):
+    if cold:
+      shutil.rmtree(cache_dir, ignore_errors=True)
+    output = subprocess.check_output([sys.executable, '-c', CHILD.format(root=ROOT, url=url)], env=env, cwd=ROOT)
+    results.append(json.loads(output.decode().strip().splitlines()[-1]))
+  summary = {phase: round(median([result[phase] for result in results]), 1) for phase in PHASES}
+  summary['status'] = results[-1]['status']
+  return summary
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--url', default='/', help='page requested first')
+  parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per mode')
+  parser.add_argument('--save', metavar='FILE', help='write the results to FILE as JSON')
+  args = parser.parse_args()
+
+  cache_dir = tempfile.mkdtemp(prefix='fyyur-jinja-')
+  try:
+    results = {
+      'meta': {'url': args.url, 'runs': args.runs, 'python': sys.version.split()[0]},
+      'cold': run(args.url, args.runs, cache_dir, cold=True),
+      'warm': run(args.url, args.runs, cache_dir, cold=False),
+    }
+  finally:
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+  print('{url}, median of {runs} fresh interpreters'.format(**results['meta']))
+  print('{:<6} {:>7} {:>10} {:>14} {:>15} {:>9}'.format('cache', 'status', 'import ms', 'create_app ms',
+                                                         'first resp ms', 'total ms'))
+  for mode in ('cold', 'warm'):
+    result = results[mode]
+    print('{:<6} {:>7} {:>10} {:>14} {:>15} {:>9}'.format(mode, result['status'], result['import_ms'],
+                                                           result['create_app_ms'], result['first_response_ms'],
+                                                           result['total_ms']))
+  if args.save:
+    with open(args.save, 'w') as f:
+      json.dump(results, f, indent=2)
+  if results['cold']['status'] >= 500 or results['warm']['status'] >= 500:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
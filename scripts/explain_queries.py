@@ -0,0 +1,112 @@
+"""Print the query plans of every read route in app.py.
+
+Each route is requested through the Flask test client, the SQL it runs is
+captured from the engine and then EXPLAINed against the same database.
+
+Save the plans before applying a migration and compare afterwards:
+
+    python scripts/explain_queries.py --save before.json
+    flask db upgrade
+    python scripts/explain_queries.py --compare before.json
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import event
+
+from app import app, db, Venue, Artist
+
+ROUTES = [
+  ('GET', '/venues', None),
+  ('GET', '/venues?page=1', None),
+  ('GET', '/venues/{venue_id}', None),
+  ('POST', '/venues/search', {'search_term': 'music'}),
+  ('GET', '/artists', None),
+  ('GET', '/artists/{artist_id}', None),
+  ('POST', '/artists/search', {'search_term': 'band'}),
+  ('GET', '/shows', None),
+]
+
+
+def capture(client, method, url, form):
+  statements = []
+
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    statements.append((statement, parameters))
+
+  event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+  try:
+    client.open(url, method=method, data=form)
+  finally:
+    event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+  return statements
+
+
+def explain(statement, parameters):
+  prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+  with db.engine.connect() as conn:
+    rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+  # sqlite returns (id, parent, notused, detail), postgres a single text column
+  return [str(row[-1]) for row in rows]
+
+
+def collect_plans():
+  plans = {}
+  with app.app_context():
+    venue = db.session.query(Venue.id).first()
+    artist = db.session.query(Artist.id).first()
+    ids = {'venue_id': venue.id if venue else 1, 'artist_id': artist.id if artist else 1}
+    client = app.test_client()
+    for method, url, form in ROUTES:
+      url = url.format(**ids)
+      plans[url] = [
+        {'statement': statement, 'plan': explain(statement, parameters)}
+        for statement, parameters in capture(client, method, url, form)
+        if statement.lstrip().upper().startswith('SELECT')
+      ]
+  return plans
+
+
+def print_plans(plans, previous=None):
+  for url, queries in plans.items():
+    print('=' * 78)
+    print(url, '({} queries)'.format(len(queries)))
+    old = {query['statement']: query['plan'] for query in (previous or {}).get(url, [])}
+    for query in queries:
+      print('-' * 78)
+      print(' '.join(query['statement'].split()))
+      if previous is not None and query['statement'] in old:
+        if old[query['statement']] == query['plan']:
+          print('  plan unchanged')
+          continue
+        print('  before:')
+        for line in old[query['statement']]:
+          print('    ' + line)
+        print('  after:')
+      for line in query['plan']:
+        print('    ' + line)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--save', metavar='FILE', help='write the plans to FILE as JSON')
+  parser.add_argument('--compare', metavar='FILE', help='show how the plans differ from a saved FILE')
+  args = parser.parse_args()
+
+  plans = collect_plans()
+  previous = None
+  if args.compare:
+    with open(args.compare) as f:
+      previous = json.load(f)
+  print_plans(plans, previous)
+  if args.save:
+    with open(args.save, 'w') as f:
+      json.dump(plans, f, indent=2)
+
+
+if __name__ == '__main__':
+  main()
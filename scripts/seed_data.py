@@ -0,0 +1,208 @@
+"""Fill the database with a synthetic but realistic set of venues, artists and shows.
+
+The scale is the number of shows; there is one venue per 20 shows and one
+artist per 10. A few venues and artists host most of the shows, as in real
+listings, and the shows spread over the past and the coming year.
+
+    DATABASE_URL=sqlite:////tmp/fyyur-100k.db python scripts/seed_data.py --scale 100k --create
+    python scripts/seed_data.py --scale 1k --reset
+
+Rows go in through the same bulk writer as flask import (COPY on postgres),
+and the venue and artist show counters are kept current as they do.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import app, db, Venue, Artist, Show, GENRES, artist_genre, count_shows, genres_literal, genres_list, set_genres
+import importer
+from geo import geocode
+
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+
+CITIES = [
+  ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('Houston', 'TX'), ('Phoenix', 'AZ'),
+  ('Philadelphia', 'PA'), ('San Antonio', 'TX'), ('San Diego', 'CA'), ('Dallas', 'TX'), ('San Jose', 'CA'),
+  ('Austin', 'TX'), ('Jacksonville', 'FL'), ('San Francisco', 'CA'), ('Columbus', 'OH'), ('Seattle', 'WA'),
+  ('Denver', 'CO'), ('Washington', 'DC'), ('Boston', 'MA'), ('Nashville', 'TN'), ('Detroit', 'MI'),
+  ('Portland', 'OR'), ('Las Vegas', 'NV'), ('Memphis', 'TN'), ('Louisville', 'KY'), ('Baltimore', 'MD'),
+  ('Milwaukee', 'WI'), ('Albuquerque', 'NM'), ('Atlanta', 'GA'), ('Kansas City', 'MO'), ('Miami', 'FL'),
+  ('Minneapolis', 'MN'), ('New Orleans', 'LA'), ('Cleveland', 'OH'), ('Pittsburgh', 'PA'), ('Salt Lake City', 'UT'),
+]
+STREETS = ['Main St', 'Market St', 'Broadway', 'Mission St', 'Valencia St', 'Sunset Blvd', 'Elm St',
+           'Oak Ave', 'Park Ave', 'Lake St', 'Hill Rd', '2nd Ave', '5th St', 'Union Sq', 'River Rd']
+VENUE_WORDS = (
+  ['The', 'The', 'The', 'Club', 'Cafe', 'Park Square', 'Old Town', 'Uptown', 'Harbor', 'Velvet', 'Blue', 'Golden'],
+  ['Musical', 'Dueling', 'Electric', 'Velvet', 'Copper', 'Neon', 'Rusty', 'Silver', 'Crimson', 'Hidden',
+   'Lucky', 'Midnight', 'Rolling', 'Urban', 'Wild', 'Broken', 'Little', 'Grand'],
+  ['Hop', 'Pianos Bar', 'Lounge', 'Room', 'Hall', 'Tavern', 'Theatre', 'Live Music & Coffee', 'Ballroom',
+   'Warehouse', 'Garden', 'Cellar', 'Stage', 'Saloon', 'Social Club', 'Record Bar'],
+)
+FIRST_NAMES = ['Matt', 'Ana', 'Leo', 'Maya', 'Sam', 'Rosa', 'Jin', 'Amir', 'Nina', 'Theo', 'Ivy', 'Omar',
+               'Lena', 'Kai', 'Zoe', 'Eli', 'Ruth', 'Hugo', 'Iris', 'Ravi']
+LAST_NAMES = ['Quevedo', 'Moreno', 'Park', 'Okafor', 'Lindqvist', 'Rossi', 'Nakamura', 'Haddad', 'Kowalski',
+              'Byrne', 'Silva', 'Novak', 'Fischer', 'Adeyemi', 'Laurent', 'Chen', 'Petrov', 'Dubois']
+BAND_WORDS = (
+  ['Guns N', 'The Wild', 'The Velvet', 'Electric', 'Midnight', 'Paper', 'Neon', 'The Lonely', 'Silver',
+   'Hollow', 'Crystal', 'The Rolling', 'Golden', 'Static', 'Burning'],
+  ['Petals', 'Sax Band', 'Wolves', 'Echoes', 'Tigers', 'Kites', 'Ghosts', 'Machines', 'Satellites',
+   'Rivers', 'Foxes', 'Lanterns', 'Owls', 'Horizons', 'Strangers'],
+)
+
+def ranked_weights(n, skew=0.8):
+  # cumulative Zipf-like weights: rank r is picked in proportion to 1/(r+1)^skew
+  total, weights = 0.0, []
+  for rank in range(n):
+    total += 1.0 / (rank + 1) ** skew
+    weights.append(total)
+  return weights
+
+
+def unique(name, seen):
+  count = seen.get(name, 0) + 1
+  seen[name] = count
+  return name if count == 1 else '{} {}'.format(name, count)
+
+
+def phone(rng):
+  return '{}-{}-{:04d}'.format(rng.randint(201, 989), rng.randint(200, 999), rng.randint(0, 9999))
+
+
+def venue_rows(rng, n):
+  seen = {}
+  cities = ranked_weights(len(CITIES))
+  for i in range(n):
+    city, state = rng.choices(CITIES, cum_weights=cities)[0]
+    name = unique(' '.join(rng.choice(words) for words in VENUE_WORDS), seen)
+    # scattered over about 20 km around the centre of the city
+    latitude, longitude = geocode(city, state)
+    yield (name, city, state, '{} {}'.format(rng.randint(1, 2999), rng.choice(STREETS)), phone(rng),
+           'https://picsum.photos/seed/venue-{}/300/300'.format(i),
+           'https://www.facebook.com/{}'.format(''.join(name.split()).lower()),
+           latitude + rng.uniform(-0.1, 0.1), longitude + rng.uniform(-0.1, 0.1), datetime.now())
+
+
+def artist_rows(rng, n):
+  seen = {}
+  cities = ranked_weights(len(CITIES))
+  for i in range(n):
+    city, state = rng.choices(CITIES, cum_weights=cities)[0]
+    if rng.random() < 0.4:
+      name = '{} {}'.format(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))
+    else:
+      name = ' '.join(rng.choice(words) for words in BAND_WORDS)
+    name = unique(name, seen)
+    genres = genres_literal(rng.sample(GENRES, rng.choice((1, 1, 2, 2, 3))))
+    yield (name, city, state, phone(rng), genres,
+           'https://picsum.photos/seed/artist-{}/300/300'.format(i),
+           'https://www.facebook.com/{}'.format(''.join(name.split()).lower()), datetime.now())
+
+
+# show slots of a day, two hours apart so that no two shows of a venue overlap
+SLOTS = (14, 16, 18, 20, 22)
+SLOT_WEIGHTS = (1, 2, 6, 8, 4)
+# shows of a venue at most, half of its slots over the two years, so that a
+# free slot is found in a few draws even at the busiest venues
+MAX_VENUE_SHOWS = (2 * 365 + 1) * len(SLOTS) // 2
+
+
+def draw_slot(rng):
+  # a slot of the two years around today, counted from today's first one
+  return rng.randint(-365, 365) * len(SLOTS) + rng.choices(range(len(SLOTS)), SLOT_WEIGHTS)[0]
+
+
+def open_venues(venue_ids, venues, booked):
+  # venue_ids and their cumulative weights without the venues that are full
+  open_ids, weights, total = [], [], 0.0
+  for venue_id, before, weight in zip(venue_ids, [0.0] + venues, venues):
+    if len(booked.get(venue_id, ())) < MAX_VENUE_SHOWS:
+      total += weight - before
+      open_ids.append(venue_id)
+      weights.append(total)
+  return open_ids, weights
+
+
+def show_rows(rng, n, venue_ids, artist_ids):
+  if n > len(venue_ids) * MAX_VENUE_SHOWS:
+    raise ValueError('{} shows do not fit {} venues of at most {} shows each'.format(n, len(venue_ids), MAX_VENUE_SHOWS))
+  now = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+  venues = ranked_weights(len(venue_ids))
+  artists = ranked_weights(len(artist_ids))
+  booked = {}
+  for i in range(n):
+    # shows over the past and the coming year, mostly in the evening; a full
+    # venue leaves the draw, and a slot the venue already has is drawn again
+    venue_id = rng.choices(venue_ids, cum_weights=venues)[0]
+    if len(booked.get(venue_id, ())) >= MAX_VENUE_SHOWS:
+      venue_ids, venues = open_venues(venue_ids, venues, booked)
+      venue_id = rng.choices(venue_ids, cum_weights=venues)[0]
+    taken = booked.setdefault(venue_id, set())
+    slot = draw_slot(rng)
+    while slot in taken:
+      slot = draw_slot(rng)
+    taken.add(slot)
+    day, hour = divmod(slot, len(SLOTS))
+    minute = rng.choice((0, 0, 30))
+    start_time = now + timedelta(days=day, hours=SLOTS[hour], minutes=minute)
+    end_time = start_time + timedelta(minutes=rng.choice((60, 90, 120)) - minute)
+    yield (rng.choices(artist_ids, cum_weights=artists)[0], venue_id,
+           start_time, end_time, start_time < now, datetime.now())
+
+
+def load(table, columns, rows, batch_size, on_batch=None):
+  ids = []
+  started = time.perf_counter()
+  for batch in importer.batches(rows, batch_size):
+    batch_ids = importer.BulkWriter(db.session.connection(), table, columns).write(batch)
+    if on_batch:
+      on_batch(batch_ids, batch)
+    db.session.commit()
+    ids.extend(batch_ids)
+  print('{:>9} {} in {:.1f}s'.format(len(ids), table.name, time.perf_counter() - started))
+  return ids
+
+
+def seed(shows, venues=None, artists=None, batch_size=5000, random_seed=1):
+  rng = random.Random(random_seed)
+  venues = venues or max(shows // 20, 1)
+  artists = artists or max(shows // 10, 1)
+  venue_ids = load(Venue.__table__, ('name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+                                     'latitude', 'longitude', 'updated_at'), venue_rows(rng, venues), batch_size)
+  artist_ids = load(Artist.__table__, ('name', 'city', 'state', 'phone', 'genres', 'image_link', 'facebook_link',
+                                       'updated_at'), artist_rows(rng, artists), batch_size,
+                    lambda ids, rows: set_genres((id, genres_list(row[4])) for id, row in zip(ids, rows)))
+  load(Show.__table__, ('artist_id', 'venue_id', 'start_time', 'end_time', 'is_past', 'updated_at'),
+       show_rows(rng, shows, venue_ids, artist_ids), batch_size,
+       lambda ids, rows: count_shows(1, Show.id.in_(ids)))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--scale', default='1k', help='number of shows: one of {} or a number'.format(', '.join(SCALES)))
+  parser.add_argument('--venues', type=int, help='number of venues, shows / 20 by default')
+  parser.add_argument('--artists', type=int, help='number of artists, shows / 10 by default')
+  parser.add_argument('--batch-size', type=int, default=5000)
+  parser.add_argument('--seed', type=int, default=1, help='random seed, the same seed builds the same data')
+  parser.add_argument('--create', action='store_true', help='create missing tables first (sqlite; use flask db upgrade on postgres)')
+  parser.add_argument('--reset', action='store_true', help='delete every show, venue and artist first')
+  args = parser.parse_args()
+  shows = SCALES.get(args.scale.lower()) or int(args.scale)
+
+  with app.app_context():
+    if args.create:
+      db.create_all()
+    if args.reset:
+      db.session.execute(artist_genre.delete())
+      for model in (Show, Venue, Artist):
+        db.session.query(model).delete()
+      db.session.commit()
+    seed(shows, args.venues, args.artists, args.batch_size, args.seed)
+
+
+if __name__ == '__main__':
+  main()
@@ -2,3 +2,39 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// search-as-you-type for the header search boxes, backed by /search/suggest
+document.addEventListener('DOMContentLoaded', function() {
+  var inputs = document.querySelectorAll('form.search input[name=search_term]');
+  Array.prototype.forEach.call(inputs, function(input, n) {
+    var list = document.createElement('datalist');
+    var urls = {};
+    var pending = null;
+    list.id = 'search-suggestions-' + n;
+    input.setAttribute('list', list.id);
+    input.setAttribute('autocomplete', 'off');
+    input.parentNode.appendChild(list);
+
+    input.addEventListener('input', function() {
+      if (urls[input.value]) {
+        window.location = urls[input.value];
+        return;
+      }
+      clearTimeout(pending);
+      pending = setTimeout(function() {
+        fetch('/search/suggest?q=' + encodeURIComponent(input.value))
+          .then(function(response) { return response.json(); })
+          .then(function(matches) {
+            list.innerHTML = '';
+            urls = {};
+            matches.forEach(function(match) {
+              var option = document.createElement('option');
+              option.value = match.name;
+              urls[match.name] = match.url;
+              list.appendChild(option);
+            });
+          });
+      }, 100);
+    });
+  });
+});
@@ -0,0 +1,116 @@
+import re
+import threading
+from array import array
+from bisect import bisect_left
+
+
+def normalize(name):
+  # lower case words separated by single spaces, e.g. "The Musical Hop!" -> "the musical hop"
+  return ' '.join(re.findall(r'\w+', (name or '').casefold()))
+
+
+class PrefixIndex(object):
+  """Sorted in-memory index answering name prefix lookups in O(log n + k).
+
+  Every name is stored once under its full normalized form and once under
+  each of its later words, so "hop" finds "The Musical Hop". Keys are kept in
+  a sorted list of strings next to an array of packed (kind, id) references,
+  which keeps 100k names to a few megabytes.
+  """
+
+  def __init__(self, kinds):
+    self.kinds = list(kinds)
+    self.names = {}
+    self.lock = threading.RLock()
+    self.built = False
+    # full names first, then names by the word after their first
+    self.keys = ([], [])
+    self.refs = (array('q'), array('q'))
+
+  def __len__(self):
+    return len(self.names)
+
+  def _ref(self, kind, id):
+    return id * len(self.kinds) + self.kinds.index(kind)
+
+  def _unref(self, ref):
+    id, kind = divmod(ref, len(self.kinds))
+    return self.kinds[kind], id
+
+  def _entries(self, name):
+    words = normalize(name).split(' ')
+    if not words[0]:
+      return
+    yield 0, ' '.join(words)
+    for i in range(1, len(words)):
+      yield 1, ' '.join(words[i:])
+
+  def build(self, rows):
+    # replaces the index contents with (kind, id, name) rows in one sort
+    entries = ([], [])
+    names = {}
+    for kind, id, name in rows:
+      names[(kind, id)] = name
+      ref = self._ref(kind, id)
+      for level, key in self._entries(name):
+        entries[level].append((key, ref))
+    with self.lock:
+      self.names = names
+      for level in (0, 1):
+        entries[level].sort()
+        self.keys[level][:] = [key for key, ref in entries[level]]
+        self.refs[level][:] = array('q', [ref for key, ref in entries[level]])
+      self.built = True
+
+  def add(self, kind, id, name):
+    with self.lock:
+      if not self.built:
+        return
+      if (kind, id) in self.names:
+        self._remove(kind, id)
+      self.names[(kind, id)] = name
+      ref = self._ref(kind, id)
+      for level, key in self._entries(name):
+        # equal keys stay in ref order, the order build() sorts them in
+        keys, refs = self.keys[level], self.refs[level]
+        i = bisect_left(keys, key)
+        while i < len(keys) and keys[i] == key and refs[i] < ref:
+          i += 1
+        keys.insert(i, key)
+        refs.insert(i, ref)
+
+  def remove(self, kind, id):
+    with self.lock:
+      if self.built and (kind, id) in self.names:
+        self._remove(kind, id)
+
+  def _remove(self, kind, id):
+    name = self.names.pop((kind, id))
+    ref = self._ref(kind, id)
+    for level, key in self._entries(name):
+      keys, refs = self.keys[level], self.refs[level]
+      i = bisect_left(keys, key)
+      while keys[i] == key and refs[i] != ref:
+        i += 1
+      del keys[i]
+      del refs[i]
+
+  def search(self, prefix, limit=10):
+    # returns up to limit (kind, id, name) matches, names starting with the
+    # prefix first, then names with a later word starting with it
+    prefix = normalize(prefix)
+    results = []
+    if not prefix:
+      return results
+    seen = set()
+    with self.lock:
+      for level in (0, 1):
+        keys, refs = self.keys[level], self.refs[level]
+        i = bisect_left(keys, prefix)
+        while i < len(keys) and len(results) < limit and keys[i].startswith(prefix):
+          if refs[i] not in seen:
+            seen.add(refs[i])
+            kind, id = self._unref(refs[i])
+            results.append((kind, id, self.names[(kind, id)]))
+          i += 1
+    return results
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import config
+from app import Artist, Show, Venue, create_app, db
+
+
+def app_config(database, **settings):
+  # config.py with the database a sqlite file of the test, the SQL panel
+  # and the template cache on disk off, and the indexes checked every time
+  values = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+  values.update(
+    SQLALCHEMY_DATABASE_URI='sqlite:///{}'.format(database),
+    TESTING=True,
+    SQL_DEBUG_PANEL=False,
+    TEMPLATE_CACHE_DIR=None,
+    INDEX_CHECK_SECONDS=0,
+  )
+  values.update(settings)
+  return SimpleNamespace(**values)
+
+
+@pytest.fixture
+def settings():
+  # overridden by the tests that need other settings
+  return {}
+
+
+@pytest.fixture
+def app(tmp_path, settings):
+  app = create_app(app_config(tmp_path / 'fyyur.db', **settings))
+  with app.app_context():
+    # the tables of the primary; the tests with a replica create its own
+    db.create_all(bind_key=None)
+    yield app
+    db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+  return app.test_client()
+
+
+@pytest.fixture
+def seed(app):
+  # adds venues, artists and shows straight to the database, as another
+  # process would, and returns their ids
+  def seed(venues=(), artists=(), shows=()):
+    rows = SimpleNamespace(venues=[], artists=[], shows=[])
+    for name, city, state in venues:
+      venue = Venue(name=name, city=city, state=state, address='1 Main St', phone='555-0100',
+                    image_link='', facebook_link='')
+      db.session.add(venue)
+      rows.venues.append(venue)
+    for name in artists:
+      artist = Artist(name=name, city='New York', state='NY', phone='555-0101', genres='{Jazz}',
+                      image_link='', facebook_link='')
+      db.session.add(artist)
+      rows.artists.append(artist)
+    db.session.flush()
+    for venue, artist, days in shows:
+      start_time = datetime.now().replace(microsecond=0) + timedelta(days=days)
+      show = Show(venue_id=rows.venues[venue].id, artist_id=rows.artists[artist].id, start_time=start_time,
+                  end_time=start_time + timedelta(hours=2), is_past=days < 0)
+      db.session.add(show)
+      rows.shows.append(show)
+    db.session.commit()
+    return SimpleNamespace(venues=[row.id for row in rows.venues], artists=[row.id for row in rows.artists],
+                           shows=[row.id for row in rows.shows])
+  return seed
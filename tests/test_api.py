@@ -0,0 +1,46 @@
+def test_venue_list_pages_by_cursor(app, client, seed):
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA'), ('Park Square Live', 'San Francisco', 'CA'),
+               ('The Dueling Pianos Bar', 'New York', 'NY')])
+  first = client.get('/api/v1/venues?limit=2&fields=id,name').json
+  assert first == {'data': [{'id': 1, 'name': 'The Musical Hop'}, {'id': 2, 'name': 'Park Square Live'}],
+                   'next': '2'}
+  second = client.get('/api/v1/venues?limit=2&fields=id,name&after=' + first['next']).json
+  assert second == {'data': [{'id': 3, 'name': 'The Dueling Pianos Bar'}], 'next': None}
+  assert [venue['id'] for venue in client.get('/api/v1/venues?city=San Francisco&state=CA').json['data']] == [1, 2]
+
+
+def test_venue_detail_lists_its_shows(app, client, seed):
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')], artists=['Guns N Petals'],
+       shows=[(0, 0, 3), (0, 0, -3), (0, 0, -2)])
+  venue = client.get('/api/v1/venues/1?fields=name,upcoming_shows,past_shows').json['data']
+  assert venue['name'] == 'The Musical Hop'
+  assert [show['id'] for show in venue['upcoming_shows']] == [1]
+  # newest first
+  assert [show['id'] for show in venue['past_shows']] == [3, 2]
+  assert venue['past_shows_cursor'] is None
+  assert venue['upcoming_shows'][0]['artist_name'] == 'Guns N Petals'
+  assert set(client.get('/api/v1/venues/1').json['data']) == {
+    'id', 'name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+    'upcoming_shows_count', 'past_shows_count'}
+
+
+def test_show_list_pages_by_start_time(app, client, seed):
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA'), ('Park Square Live', 'New York', 'NY')],
+       artists=['Guns N Petals'], shows=[(0, 0, 3), (1, 0, 1), (0, 0, 2)])
+  first = client.get('/api/v1/shows?limit=2&fields=id,venue_name').json
+  assert first['data'] == [{'id': 2, 'venue_name': 'Park Square Live'}, {'id': 3, 'venue_name': 'The Musical Hop'}]
+  assert client.get('/api/v1/shows?limit=2&fields=id&after=' + first['next']).json == \
+    {'data': [{'id': 1}], 'next': None}
+  assert [show['id'] for show in client.get('/api/v1/shows?venue_id=1').json['data']] == [3, 1]
+  assert [show['id'] for show in client.get('/api/v1/shows?state=NY').json['data']] == [2]
+  assert client.get('/api/v1/shows/2?fields=artist_name').json == {'data': {'artist_name': 'Guns N Petals'}}
+
+
+def test_bad_requests_are_answered_with_errors(app, client, seed):
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')])
+  response = client.get('/api/v1/venues?fields=id,bogus')
+  assert (response.status_code, response.json) == (400, {'error': 'unknown fields: bogus'})
+  response = client.get('/api/v1/venues/9')
+  assert (response.status_code, response.json) == (404, {'error': 'not found'})
+  assert client.get('/api/v1/shows?from=someday').json == {'error': 'invalid date: from'}
+  assert client.get('/api/v1/shows?after=yesterday').status_code == 400
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+from conftest import app_config
+
+from app import GENRES, create_app, db
+
+
+def test_importing_the_app_leaves_the_forms_unimported():
+  code = 'import sys, app; print(sorted(name for name in ("forms", "wtforms", "flask_wtf", "babel") if name in sys.modules))'
+  output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.dirname(__file__)),
+                          capture_output=True, text=True, check=True).stdout
+  assert output == '[]\n'
+
+
+def test_genres_are_the_choices_of_the_artist_form():
+  from forms import ArtistForm
+  assert GENRES == [value for value, label in ArtistForm.genres.kwargs['choices']]
+
+
+def test_apps_keep_their_own_caches_and_indexes(app, client, seed, tmp_path):
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')])
+  other = create_app(app_config(tmp_path / 'other.db'))
+  with other.app_context():
+    db.create_all(bind_key=None)
+  other_client = other.test_client()
+  assert [match['name'] for match in client.get('/search/suggest?q=hop').json] == ['The Musical Hop']
+  assert other_client.get('/search/suggest?q=hop').json == []
+  client.get('/venues/1')
+  assert client.get('/cache/stats').json['entries'] == 1
+  assert other_client.get('/cache/stats').json['entries'] == 0
+  assert other_client.get('/venues/1').status_code == 404
+  assert 'The Musical Hop' in client.get('/').get_data(as_text=True)
+  assert 'The Musical Hop' not in other_client.get('/').get_data(as_text=True)
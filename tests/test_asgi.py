@@ -0,0 +1,78 @@
+import asyncio
+import threading
+from urllib.parse import urlencode
+
+from app import db
+from asgi import AsyncReads
+
+
+def run_asgi(application, paths, timeout=30, form=None):
+  # the (status, body) of each path, requested concurrently from one event
+  # loop as uvicorn would, posting form when given; fails instead of hanging
+  # when the loop blocks
+  results = []
+  body = urlencode(form).encode() if form is not None else b''
+  headers = [(b'host', b'localhost')]
+  if form is not None:
+    headers.append((b'content-type', b'application/x-www-form-urlencoded'))
+    headers.append((b'content-length', str(len(body)).encode()))
+
+  async def get(path):
+    path, _, query = path.partition('?')
+    scope = {'type': 'http', 'http_version': '1.1', 'method': 'GET' if form is None else 'POST', 'scheme': 'http',
+             'path': path, 'root_path': '', 'query_string': query.encode(), 'headers': headers,
+             'server': ('localhost', 80), 'client': ('127.0.0.1', 0)}
+    sent = []
+
+    async def receive():
+      return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+      sent.append(message)
+
+    await application(scope, receive, send)
+    return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+  async def main():
+    results.extend(await asyncio.gather(*[get(path) for path in paths]))
+    await application.engine.dispose()
+
+  thread = threading.Thread(target=asyncio.run, args=(main(),), daemon=True)
+  thread.start()
+  thread.join(timeout)
+  assert not thread.is_alive(), 'the event loop blocked'
+  return results
+
+
+def test_concurrent_index_loads_do_not_block_the_loop(app, seed):
+  seed(venues=[('The Musical Hop', 'New York', 'NY'), ('Park Square Live', 'Chicago', 'IL')])
+  from app import Venue
+  db.session.query(Venue).filter(Venue.city == 'New York').update({Venue.latitude: 40.7128, Venue.longitude: -74.006})
+  db.session.commit()
+  paths = ['/search/suggest?q=hop', '/venues/nearby?lat=40.7&lon=-74.0', '/'] * 5
+  results = run_asgi(AsyncReads(app, db), paths)
+  assert [status for status, body in results] == [200] * len(paths)
+  assert b'The Musical Hop' in results[0][1]
+  assert b'The Musical Hop' in results[1][1]
+
+
+def test_reads_answer_like_the_wsgi_app(app, client, seed):
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')], artists=['Guns N Petals'], shows=[(0, 0, 3)])
+  paths = ['/api/v1/venues', '/api/v1/shows?fields=id,artist_name', '/api/v1/artists/1', '/api/v1/venues/9',
+           '/venues/1']
+  results = run_asgi(AsyncReads(app, db), paths)
+  for path, (status, body) in zip(paths[:-1], results):
+    response = client.get(path)
+    assert (status, body) == (response.status_code, response.get_data())
+  assert results[-1][0] == 200 and b'Guns N Petals' in results[-1][1]
+
+
+def test_writes_go_to_the_wsgi_app_and_reads_see_them(app, seed):
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')], artists=['Guns N Petals'])
+  form = {'artist_id': '1', 'venue_id': '1', 'start_time': '2031-05-01 20:00'}
+  [(status, body)] = run_asgi(AsyncReads(app, db), ['/shows/create'], form=form)
+  assert status == 200 and b'successfully listed' in body
+  [(status, body)] = run_asgi(AsyncReads(app, db), ['/shows/create'], form=dict(form, start_time='2031-05-01 21:00'))
+  assert b'already booked' in body
+  [(status, body)] = run_asgi(AsyncReads(app, db), ['/api/v1/venues/1?fields=upcoming_shows_count'])
+  assert body == b'{"data":{"upcoming_shows_count":1}}'
@@ -0,0 +1,136 @@
+from jinja2 import DictLoader, Environment
+
+import cache
+from cache import FragmentCacheExtension, LRUCache
+
+
+class Clock(object):
+
+  def __init__(self):
+    self.now = 0.0
+
+  def monotonic(self):
+    return self.now
+
+
+def test_lru_cache_evicts_the_least_recently_used():
+  lru = LRUCache(max_entries=2, default_ttl=60)
+  lru.set('page:/venues', 'venues')
+  lru.set('page:/artists', 'artists')
+  assert lru.get('page:/venues') == 'venues'
+  lru.set('page:/shows', 'shows')
+  assert lru.get('page:/artists') is None
+  assert lru.get('page:/venues') == 'venues'
+  assert lru.get('page:/shows') == 'shows'
+  stats = lru.stats()
+  assert (stats['entries'], stats['hits'], stats['misses'], stats['evictions']) == (2, 3, 1, 1)
+
+
+def test_lru_cache_expires_entries_after_their_ttl(monkeypatch):
+  clock = Clock()
+  monkeypatch.setattr(cache, 'time', clock)
+  lru = LRUCache(max_entries=8, default_ttl=5)
+  lru.set('page:/venues', 'venues')
+  lru.set('page:/shows', 'shows', ttl=10)
+  clock.now = 5
+  assert lru.get('page:/venues') == 'venues'
+  clock.now = 6
+  assert lru.get('page:/venues') is None
+  assert lru.get('page:/shows') == 'shows'
+  clock.now = 11
+  assert lru.get('page:/shows') is None
+  assert (len(lru), lru.expirations) == (0, 2)
+
+
+def test_lru_cache_invalidates_the_entries_of_a_tag():
+  lru = LRUCache(max_entries=8, default_ttl=60)
+  lru.set('page:/venues/1', 'venue 1', tags=['venue:1', 'show-artist:1'])
+  lru.set('page:/venues/2', 'venue 2', tags=['venue:2'])
+  lru.set('page:/shows', 'shows', tags=['shows', 'show-artist:1'])
+  assert lru.invalidate('show-artist:1', 'venue:3') == 2
+  assert lru.get('page:/venues/2') == 'venue 2'
+  assert lru.get('page:/venues/1') is None and lru.get('page:/shows') is None
+  # set again without the tag, the entry is no longer evicted by it
+  lru.set('page:/venues/2', 'venue 2', tags=['venue:1'])
+  assert lru.invalidate('venue:2') == 0
+  assert lru.tags == {'venue:1': {'page:/venues/2'}}
+
+
+TEMPLATES = {
+  'list.html': '{% for row in rows %}{% cache row.id, row.version %}<{{ row.id }}:{{ row.name }}>{% endcache %}{% endfor %}',
+  # the same key in another template renders and caches its own markup
+  'other.html': '{% for row in rows %}{% cache row.id, row.version %}[{{ row.name }}]{% endcache %}{% endfor %}',
+}
+
+
+def test_fragment_cache_renders_each_version_once():
+  environment = Environment(loader=DictLoader(TEMPLATES), extensions=[FragmentCacheExtension])
+  environment.fragment_cache = LRUCache(max_entries=10, default_ttl=3600)
+  rows = [{'id': 1, 'version': 0, 'name': 'The Musical Hop'}, {'id': 2, 'version': 0, 'name': 'Park Square'}]
+  assert environment.get_template('list.html').render(rows=rows) == '<1:The Musical Hop><2:Park Square>'
+  assert environment.get_template('other.html').render(rows=rows) == '[The Musical Hop][Park Square]'
+  # an edit comes with a new version, as updated_at does
+  rows[0] = {'id': 1, 'version': 1, 'name': 'The Dueling Pianos Bar'}
+  assert environment.get_template('list.html').render(rows=rows[::-1]) == '<2:Park Square><1:The Dueling Pianos Bar>'
+  assert (environment.fragment_cache.hits, environment.fragment_cache.misses) == (1, 5)
+
+
+VENUE_FORM = {'name': 'The Musical Hop', 'city': 'San Francisco', 'state': 'CA', 'address': '1015 Folsom Street',
+              'phone': '123-123-1234', 'image_link': '', 'facebook_link': ''}
+
+
+def cached_pages(client):
+  return client.get('/cache/stats').json['entries']
+
+
+def test_venue_edit_evicts_the_pages_showing_the_venue(app, client, seed):
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA'), ('Park Square Live', 'Chicago', 'IL')])
+  for path in ('/venues', '/venues/1', '/venues/2'):
+    assert client.get(path).status_code == 200
+  assert cached_pages(client) == 3
+  assert 'The Musical Hop' in client.get('/venues').get_data(as_text=True)
+  assert client.get('/cache/stats').json['hits'] == 1
+  client.post('/venues/1/edit', data=dict(VENUE_FORM, name='The Dueling Pianos Bar'))
+  # the venue page and the /venues page listing its area; venue 2 stays
+  assert cached_pages(client) == 1
+  assert 'The Dueling Pianos Bar' in client.get('/venues').get_data(as_text=True)
+  assert 'The Dueling Pianos Bar' in client.get('/venues/1').get_data(as_text=True)
+
+
+def test_new_show_evicts_the_show_pages_of_its_artist(app, client, seed):
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')], artists=['Guns N Petals'],
+       shows=[(0, 0, 3)])
+  for path in ('/shows', '/venues/1', '/artists/1'):
+    client.get(path)
+  assert cached_pages(client) == 3
+  response = client.post('/shows/create', data={'artist_id': '1', 'venue_id': '1', 'start_time': '2031-05-01 20:00'})
+  assert 'successfully listed' in response.get_data(as_text=True)
+  assert cached_pages(client) == 0
+  assert client.get('/artists/1').get_data(as_text=True).count('The Musical Hop') == 2
+
+
+def test_pages_written_by_another_process_are_rendered_again(app, client, seed):
+  from app import Venue, db
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')])
+  assert 'The Musical Hop' in client.get('/venues/1').get_data(as_text=True)
+  # no invalidation reaches this process, but updated_at changes the etag
+  db.session.query(Venue).filter(Venue.id == 1).update({Venue.name: 'The Dueling Pianos Bar'})
+  db.session.commit()
+  assert 'The Dueling Pianos Bar' in client.get('/venues/1').get_data(as_text=True)
+
+
+def test_unchanged_pages_are_answered_304(app, client, seed):
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')], artists=['Guns N Petals'])
+  for path in ('/venues/1', '/venues', '/shows', '/api/v1/venues/1'):
+    response = client.get(path)
+    assert response.status_code == 200 and response.cache_control.no_cache
+    etag, _ = response.get_etag()
+    assert client.get(path, headers={'If-None-Match': '"{}"'.format(etag)}).status_code == 304
+  venue = client.get('/venues/1')
+  etag = venue.get_etag()[0]
+  again = client.get('/venues/1', headers={'If-Modified-Since': venue.headers['Last-Modified']})
+  assert again.status_code == 304
+  client.post('/shows/create', data={'artist_id': '1', 'venue_id': '1', 'start_time': '2031-05-01 20:00'})
+  changed = client.get('/venues/1', headers={'If-None-Match': '"{}"'.format(etag)})
+  assert changed.status_code == 200 and changed.get_etag()[0] != etag
+  assert client.get('/venues/9', headers={'If-None-Match': '"{}"'.format(etag)}).status_code == 404
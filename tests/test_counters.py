@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+from app import Artist, Show, Venue, db
+
+
+def book(client, start_time):
+  response = client.post('/shows/create', data={'artist_id': '1', 'venue_id': '1', 'start_time': start_time})
+  assert 'successfully listed' in response.get_data(as_text=True)
+
+
+def counts(client, kind):
+  row = client.get('/api/v1/{}/1?fields=upcoming_shows_count,past_shows_count,upcoming_shows,past_shows'
+                   .format(kind)).json['data']
+  return (row['upcoming_shows_count'], row['past_shows_count'],
+          [show['id'] for show in row['upcoming_shows']], [show['id'] for show in row['past_shows']])
+
+
+def test_shows_are_counted_as_they_are_listed_and_deleted(app, client, seed):
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')], artists=['Guns N Petals'])
+  book(client, '2031-05-01 20:00')
+  book(client, '2031-05-02 20:00')
+  book(client, '2019-05-01 20:00')
+  assert counts(client, 'venues') == counts(client, 'artists') == (2, 1, [1, 2], [3])
+  client.delete('/shows/2')
+  assert counts(client, 'venues') == counts(client, 'artists') == (1, 1, [1], [3])
+
+
+def test_rollover_moves_begun_shows_to_past(app, client, seed):
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')], artists=['Guns N Petals'])
+  book(client, '2031-05-01 20:00')
+  book(client, '2031-05-02 20:00')
+  # time passes: show 1 begins
+  db.session.query(Show).filter(Show.id == 1).update({Show.start_time: datetime.now() - timedelta(minutes=5)})
+  db.session.commit()
+  runner = app.test_cli_runner()
+  assert 'counters drifted, 1 shows due for rollover' in runner.invoke(args=['counters', 'verify']).output
+  assert counts(client, 'venues') == (2, 0, [1, 2], [])
+  assert runner.invoke(args=['counters', 'rollover']).output == '1 shows moved to past\n'
+  assert counts(client, 'venues') == counts(client, 'artists') == (1, 1, [2], [1])
+  assert runner.invoke(args=['counters', 'rollover']).output == '0 shows moved to past\n'
+  assert runner.invoke(args=['counters', 'verify']).output == '0 counters drifted, 0 shows due for rollover\n'
+
+
+def test_verify_reports_and_fixes_drift(app, client, seed):
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA'), ('Park Square Live', 'Chicago', 'IL')],
+       artists=['Guns N Petals'])
+  book(client, '2031-05-01 20:00')
+  db.session.query(Venue).filter(Venue.id == 2).update({Venue.upcoming_shows_count: 4})
+  db.session.query(Artist).update({Artist.past_shows_count: 1})
+  db.session.commit()
+  runner = app.test_cli_runner()
+  output = runner.invoke(args=['counters', 'verify']).output
+  assert output.splitlines() == [
+    'Venue 2: upcoming 0 (counted 4), past 0 (counted 0), total 0 (counted 0)',
+    'Artist 1: upcoming 1 (counted 1), past 0 (counted 1), total 1 (counted 1)',
+    '2 counters drifted, 0 shows due for rollover',
+  ]
+  assert runner.invoke(args=['counters', 'verify', '--fix']).output.endswith('2 counters drifted, fixed, 0 shows due for rollover\n')
+  assert runner.invoke(args=['counters', 'verify']).output == '0 counters drifted, 0 shows due for rollover\n'
+  assert counts(client, 'artists')[:2] == (1, 0)
+
+
+def test_pages_change_when_the_rollover_moves_their_shows(app, client, seed):
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')], artists=['Guns N Petals'])
+  book(client, '2031-05-01 20:00')
+  paths = ('/venues/1', '/artists/1', '/venues', '/shows', '/api/v1/venues/1?fields=upcoming_shows')
+  etags = {path: client.get(path).get_etag()[0] for path in paths}
+  # show 1 begins: the pages still list it as upcoming, like the counters;
+  # /shows only changes here as moving the show bumped its updated_at
+  db.session.query(Show).filter(Show.id == 1).update({Show.start_time: datetime.now() - timedelta(minutes=5)})
+  db.session.commit()
+  for path in paths:
+    if path != '/shows':
+      assert client.get(path, headers={'If-None-Match': '"{}"'.format(etags[path])}).status_code == 304
+  etags['/shows'] = client.get('/shows').get_etag()[0]
+  assert 'Guns N Petals' in client.get('/shows').get_data(as_text=True)
+  app.test_cli_runner().invoke(args=['counters', 'rollover'])
+  for path in paths:
+    assert client.get(path, headers={'If-None-Match': '"{}"'.format(etags[path])}).status_code == 200
+  assert 'Guns N Petals' not in client.get('/shows').get_data(as_text=True)
+  assert counts(client, 'venues') == (0, 1, [], [1])
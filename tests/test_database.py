@@ -0,0 +1,60 @@
+import pytest
+import sqlalchemy as sa
+
+from app import db
+
+VENUE_FORM = {'name': 'The Dueling Pianos Bar', 'city': 'New York', 'state': 'NY', 'address': '335 Delancey Street',
+              'phone': '914-003-1132', 'image_link': '', 'facebook_link': ''}
+
+
+@pytest.fixture
+def settings(tmp_path):
+  return {'SQLALCHEMY_DATABASE_REPLICA_URI': 'sqlite:///{}'.format(tmp_path / 'replica.db')}
+
+
+@pytest.fixture
+def replica(app):
+  # an empty replica, as one that has not caught up with the primary yet
+  db.metadata.create_all(db.engines['replica'])
+
+
+def venue_names(client):
+  return [venue['name'] for venue in client.get('/api/v1/venues?fields=name').json['data']]
+
+
+def test_reads_go_to_the_replica_and_writes_to_the_primary(app, replica, seed):
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')])
+  browser, other = app.test_client(), app.test_client()
+  assert venue_names(browser) == []
+  response = browser.post('/venues/create', data=VENUE_FORM)
+  assert 'successfully listed' in response.get_data(as_text=True)
+  # the browser that wrote reads its write back from the primary, others
+  # keep reading the replica
+  assert venue_names(browser) == ['The Musical Hop', 'The Dueling Pianos Bar']
+  assert venue_names(other) == []
+  with browser.session_transaction() as session:
+    session['wrote_at'] -= app.config['DB_READ_YOUR_WRITES'] + 1
+  assert venue_names(browser) == []
+  assert set(browser.get('/db/stats').json) == {'primary', 'replica'}
+
+
+def test_replica_pages_are_not_cached_right_after_a_write(app, replica, seed):
+  browser, other = app.test_client(), app.test_client()
+  browser.post('/venues/create', data=VENUE_FORM)
+  assert other.get('/artists').status_code == 200
+  assert other.get('/cache/stats').json['entries'] == 0
+  assert browser.get('/artists').status_code == 200
+  assert browser.get('/cache/stats').json['entries'] == 1
+
+
+SLOW = sa.text('WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 3000000) SELECT count(*) FROM n')
+
+
+@pytest.mark.parametrize('settings', [{'DB_STATEMENT_TIMEOUT_MS': 20}])
+def test_statement_timeout_applies_to_requests_only(app):
+  with app.test_request_context('/'):
+    with pytest.raises(sa.exc.OperationalError, match='interrupted'):
+      db.session.execute(SLOW)
+    db.session.rollback()
+  # the flask commands, like the rollover, run without a limit
+  assert db.session.execute(SLOW).scalar() == 3000000
@@ -0,0 +1,49 @@
+import random
+import re
+
+import pytest
+
+from exporter import _ics_line, _ics_text
+
+
+@pytest.mark.parametrize('line, folded', [
+  ('', '\r\n'),
+  ('a' * 75, 'a' * 75 + '\r\n'),
+  ('a' * 76, 'a' * 75 + '\r\n a\r\n'),
+  ('a' * 149, 'a' * 75 + '\r\n ' + 'a' * 74 + '\r\n'),
+  ('a' * 150, 'a' * 75 + '\r\n ' + 'a' * 74 + '\r\n a\r\n'),
+  # 2 octets each: 37 fill 74 octets, the 38th would make 76
+  ('é' * 40, 'é' * 37 + '\r\n ' + 'é' * 3 + '\r\n'),
+  # 4 octets each after one: 1 + 18 * 4 = 73, 19 would make 77
+  ('x' + '\U0001f3b8' * 20, 'x' + '\U0001f3b8' * 18 + '\r\n ' + '\U0001f3b8' * 2 + '\r\n'),
+  # 3 octets each after 74 ASCII: the fold backs off to before it
+  ('a' * 74 + '中文', 'a' * 74 + '\r\n 中文\r\n'),
+])
+def test_ics_line_folds_at_75_octets(line, folded):
+  assert _ics_line(line) == folded
+
+
+def test_ics_line_never_splits_a_character():
+  rng = random.Random(23)
+  alphabet = 'abc ;,' + 'é' + '中' + '\U0001f3b8'
+  for step in range(500):
+    line = ''.join(rng.choice(alphabet) for _ in range(rng.randint(70, 300)))
+    folded = _ics_line(line)
+    assert folded.endswith('\r\n')
+    physical = folded[:-2].split('\r\n')
+    for i, part in enumerate(physical):
+      octets = part.encode('utf-8')
+      assert len(octets) <= 75
+      assert i == 0 or part.startswith(' ')
+      if i < len(physical) - 1:
+        # a line is only folded when the next character does not fit
+        assert len(octets) + len(physical[i + 1][1].encode('utf-8')) > 75
+    assert ''.join([physical[0]] + [part[1:] for part in physical[1:]]) == line
+
+
+def test_ics_text_escapes_separators_and_line_breaks():
+  assert _ics_text('Rock, Pop; Jazz\\Blues\r\nLive\n') == 'Rock\\, Pop\\; Jazz\\\\Blues\\nLive\\n'
+  assert _ics_text(None) == ''
+  unescape = lambda text: re.sub(r'\\(.)', lambda match: '\n' if match.group(1) == 'n' else match.group(1), text)
+  for value in ['a;b,c', '\\;', ';;\\\\,', 'x\ny']:
+    assert unescape(_ics_text(value)) == value
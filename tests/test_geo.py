@@ -0,0 +1,100 @@
+import random
+import threading
+
+import pytest
+
+from geo import CITIES, GridIndex, bounding_box, distance_km, geocode
+
+
+def brute_nearest(points, latitude, longitude, radius_km, limit):
+  found = sorted((distance_km(latitude, longitude, *point), id) for id, point in points.items())
+  return [(distance, id) for distance, id in found if distance <= radius_km][:limit]
+
+
+def random_point(rng):
+  # city centres shared by many ids, and points anywhere, the poles and the
+  # antimeridian included
+  if rng.random() < 0.5:
+    city = rng.choice(CITIES)
+    return city[2], city[3]
+  return rng.choice([rng.uniform(-90, 90), rng.uniform(85, 90), rng.uniform(-90, -85)]), \
+    rng.choice([rng.uniform(-180, 180), rng.uniform(175, 180), rng.uniform(-180, -175)])
+
+
+@pytest.mark.parametrize('cell_degrees', [0.05, 1, 7.5, 45])
+def test_grid_index_matches_brute_force(cell_degrees):
+  rng = random.Random(24)
+  points = {id: random_point(rng) for id in range(1, 300)}
+  index = GridIndex(cell_degrees)
+  index.build([(id, latitude, longitude) for id, (latitude, longitude) in points.items()] + [(999, None, None)])
+  for step in range(1500):
+    action = rng.random()
+    id = rng.randint(1, 400)
+    if action < 0.2:
+      points[id] = random_point(rng)
+      index.add(id, *points[id])
+    elif action < 0.3:
+      points.pop(id, None)
+      index.remove(id)
+    else:
+      latitude, longitude = random_point(rng) if rng.random() < 0.7 else (rng.uniform(-90, 90), rng.uniform(-180, 180))
+      radius = rng.choice([1, 25, 300, 2000, 20000])
+      limit = rng.choice([1, 5, 50])
+      assert index.nearest(latitude, longitude, radius, limit) == \
+        brute_nearest(points, latitude, longitude, radius, limit)
+    assert len(index) == len(points)
+
+
+@pytest.mark.parametrize('cell_degrees', [0.05, 1, 7.5, 45])
+def test_grid_index_reach_is_a_lower_bound(cell_degrees):
+  rng = random.Random(26)
+  index = GridIndex(cell_degrees)
+  for step in range(3000):
+    point = random_point(rng)
+    latitude, longitude = random_point(rng)
+    assert index._reach(index._cell(*point), latitude, longitude) <= distance_km(latitude, longitude, *point)
+
+
+def test_bounding_box_holds_the_circle():
+  rng = random.Random(25)
+  for step in range(2000):
+    latitude, longitude = rng.uniform(-89, 89), rng.uniform(-180, 180)
+    radius = rng.choice([1, 50, 500, 3000])
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius)
+    other_lat, other_lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+    if distance_km(latitude, longitude, other_lat, other_lon) <= radius:
+      assert min_lat <= other_lat <= max_lat
+      # longitudes past +-180 wrap around
+      assert any(min_lon <= other_lon + turn <= max_lon for turn in (-360, 0, 360))
+
+
+def test_geocode():
+  assert geocode('st. louis', 'mo') == (38.6270, -90.1994)
+  assert geocode('Portland', 'ME') != geocode('Portland', 'OR')
+  assert geocode('Atlantis', 'XX') == (None, None)
+
+
+def nearby(client, **args):
+  return [venue['name'] for venue in client.get('/venues/nearby', query_string=args).json['data']]
+
+
+def test_nearby_sees_writes_of_both_processes(app, client, seed, monkeypatch):
+  import app as fyyur
+  from app import Venue, db
+  # rebuilds wait for the test to let them run
+  release, rebuild = threading.Event(), fyyur.rebuild_index
+  monkeypatch.setattr(fyyur, 'rebuild_index', lambda *args: release.wait(10) and rebuild(*args))
+  ids = seed(venues=[('The Musical Hop', 'San Francisco', 'CA')]).venues
+  assert nearby(client, lat=40.7128, lon=-74.006) == []
+  client.post('/venues/create', data={'name': 'The Dueling Pianos Bar', 'city': 'New York', 'state': 'NY',
+                                      'address': '335 Delancey Street', 'phone': '914-003-1132',
+                                      'image_link': '', 'facebook_link': ''})
+  assert nearby(client, lat=40.7128, lon=-74.006) == ['The Dueling Pianos Bar']
+  assert fyyur.venue_locations not in fyyur.index_rebuilds
+  # located by the flask geocode command
+  db.session.query(Venue).filter(Venue.id == ids[0]).update({Venue.latitude: 37.7749, Venue.longitude: -122.4194})
+  db.session.commit()
+  assert nearby(client, lat=37.77, lon=-122.42) == []
+  release.set()
+  fyyur.index_rebuilds[fyyur.venue_locations].join(10)
+  assert nearby(client, lat=37.77, lon=-122.42) == ['The Musical Hop']
@@ -0,0 +1,52 @@
+import json
+
+
+def write(path, text):
+  path.write_text(text, encoding='utf-8')
+  return str(path)
+
+
+def test_import_loads_valid_rows_and_writes_rejects(app, client, tmp_path):
+  runner = app.test_cli_runner()
+  venues = write(tmp_path / 'venues.csv', (
+    'name,city,state,address,phone,image_link,facebook_link\n'
+    'The Musical Hop,San Francisco,CA,1015 Folsom Street,123-123-1234,,https://www.facebook.com/TheMusicalHop\n'
+    'Nowhere,Atlantis,ZZ,1 Sea Floor,,,https://www.facebook.com/Nowhere\n'
+    'Park Square Live,San Francisco,CA,34 Whiskey Moore Ave,,,https://www.facebook.com/ParkSquareLive\n'))
+  rejects = tmp_path / 'rejects.ndjson'
+  output = runner.invoke(args=['import', 'venues', venues, '--rejects', str(rejects)]).output
+  assert 'done: 2 inserted, 1 rejected' in output
+  rejected = [json.loads(line) for line in rejects.read_text().splitlines()]
+  assert [(row['line'], row['row']['name'], list(row['errors'])) for row in rejected] == [(2, 'Nowhere', ['state'])]
+
+  artists = write(tmp_path / 'artists.ndjson', ''.join(json.dumps(row) + '\n' for row in (
+    {'name': 'Guns N Petals', 'city': 'San Francisco', 'state': 'CA', 'genres': ['Rock n Roll'],
+     'facebook_link': 'https://www.facebook.com/GunsNPetals'},
+    {'name': 'Matt Quevedo', 'city': 'New York', 'state': 'NY', 'genres': ['Jazz'],
+     'facebook_link': 'https://www.facebook.com/MattQuevedo'},
+  )))
+  assert 'done: 2 inserted, 0 rejected' in runner.invoke(args=['import', 'artists', artists]).output
+  assert [artist['name'] for artist in client.get('/api/v1/artists?genre=Jazz').json['data']] == ['Matt Quevedo']
+
+  shows = write(tmp_path / 'shows.csv', (
+    'artist,venue,start_time,duration\n'
+    'Guns N Petals,The Musical Hop,2031-05-01 20:00:00,\n'
+    'Matt Quevedo,The Musical Hop,2031-05-01 21:00:00,\n'
+    'Matt Quevedo,Park Square Live,2031-05-01 21:00:00,90\n'
+    'Nobody,Park Square Live,2031-06-01 21:00:00,\n'))
+  output = runner.invoke(args=['import', 'shows', shows, '--batch-size', '2', '--rejects', str(rejects)]).output
+  assert 'done: 2 inserted, 2 rejected' in output
+  rejected = [json.loads(line) for line in rejects.read_text().splitlines()]
+  assert [(row['line'], row['errors']) for row in rejected] == [
+    (2, {'start_time': ['The venue is already booked at that time by an earlier row.']}),
+    (4, {'artist_id': ['Unknown or ambiguous artist.']}),
+  ]
+  shows = client.get('/api/v1/shows?fields=artist_name,venue_name,end_time').json['data']
+  assert shows == [
+    {'artist_name': 'Guns N Petals', 'venue_name': 'The Musical Hop', 'end_time': '2031-05-01T22:00:00'},
+    {'artist_name': 'Matt Quevedo', 'venue_name': 'Park Square Live', 'end_time': '2031-05-01T22:30:00'},
+  ]
+  assert runner.invoke(args=['counters', 'verify']).output == '0 counters drifted, 0 shows due for rollover\n'
+  # imported shows are booked: the form sees them too
+  response = client.post('/shows/create', data={'artist_id': '2', 'venue_id': '1', 'start_time': '2031-05-01 21:00'})
+  assert 'already booked' in response.get_data(as_text=True)
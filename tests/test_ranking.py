@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+import ranking
+from ranking import TopN
+
+
+def feed_of(counts, size):
+  # a TopN over {id: count} ranked by (count, id), as the home page feeds
+  # rank, and the list of the limits it loaded with
+  loads = []
+  def load(limit):
+    loads.append(limit)
+    return sorted((((count, id), id, {'id': id}) for id, count in counts.items()), reverse=True)[:limit]
+  return TopN(load, size=size, ttl=10 ** 9), loads
+
+
+def ids(feed):
+  return [data['id'] for data in feed.top()]
+
+
+def test_top_n_follows_puts_without_loading():
+  counts = {id: id for id in range(1, 11)}
+  feed, loads = feed_of(counts, size=2)
+  assert ids(feed) == [10, 9]
+  # 4 rows kept, 6 at the floor
+  counts[3] = 12
+  feed.put(3, (12, 3), {'id': 3})
+  assert ids(feed) == [3, 10]
+  counts[10] = 1
+  feed.put(10, (1, 10), {'id': 10})
+  assert ids(feed) == [3, 9]
+  feed.update(9, {'name': 'renamed'})
+  assert feed.top()[1] == {'id': 9, 'name': 'renamed'}
+  assert loads == [5]
+
+
+def test_top_n_loads_again_when_removals_leave_it_short():
+  counts = {id: id for id in range(1, 11)}
+  feed, loads = feed_of(counts, size=2)
+  feed.top()
+  for id in (10, 9, 8):
+    del counts[id]
+    feed.remove(id)
+  assert ids(feed) == [7, 6]
+  assert loads == [5, 5]
+  # with nothing below the floor it keeps what it has
+  small, loads = feed_of({1: 1, 2: 2}, size=2)
+  small.top()
+  small.remove(2)
+  assert ids(small) == [1]
+  assert loads == [5]
+
+
+def test_top_n_reloads_after_its_ttl(monkeypatch):
+  now = [0.0]
+  monkeypatch.setattr(ranking, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+  rows = [((3, 1), 1, 'a')]
+  feed = TopN(lambda limit: rows[:limit], size=2, ttl=60)
+  assert feed.top() == ['a']
+  # written by another process
+  rows.insert(0, ((5, 2), 2, 'b'))
+  now[0] += 30
+  assert feed.top() == ['a']
+  now[0] += 31
+  assert feed.top() == ['b', 'a']
+
+
+VENUE_FORM = {'name': 'The Dueling Pianos Bar', 'city': 'New York', 'state': 'NY', 'address': '335 Delancey Street',
+              'phone': '914-003-1132', 'image_link': '', 'facebook_link': ''}
+
+
+def test_home_page_lists_new_venues_and_busy_venues(app, client, seed):
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')], artists=['Guns N Petals'])
+  home = client.get('/').get_data(as_text=True)
+  assert 'The Musical Hop' in home and 'Guns N Petals' in home
+  client.post('/venues/create', data=VENUE_FORM)
+  client.post('/shows/create', data={'artist_id': '1', 'venue_id': '2', 'start_time': '2031-05-01 20:00'})
+  home = client.get('/').get_data(as_text=True)
+  # the busiest venues, then the new ones
+  assert home.index('The Dueling Pianos Bar') < home.rindex('The Dueling Pianos Bar') < home.index('The Musical Hop')
+  client.delete('/venues/2')
+  assert 'The Dueling Pianos Bar' not in client.get('/').get_data(as_text=True)
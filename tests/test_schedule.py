@@ -0,0 +1,166 @@
+from schedule import IntervalTree, Schedules, overlaps
+
+
+def check_max_end(node):
+  # the latest end of the subtree, asserting every node holds it
+  if node is None:
+    return float('-inf')
+  latest = max(node.end, check_max_end(node.left), check_max_end(node.right))
+  assert node.max_end == latest
+  return latest
+
+
+def test_interval_tree_finds_overlapping_intervals():
+  tree = IntervalTree()
+  tree.add(10, 20, 'a')
+  tree.add(20, 30, 'b')
+  tree.add(40, 50, 'c')
+  assert tree.overlap(15, 16) == 'a'
+  assert tree.overlap(19, 21) in ('a', 'b')
+  # intervals are half-open: back to back bookings do not overlap
+  assert tree.overlap(30, 40) is None
+  assert tree.overlap(0, 10) is None
+  assert tree.overlap(49, 60) == 'c'
+  tree.remove('b')
+  assert tree.overlap(20, 30) is None
+  # adding a key again moves it
+  tree.add(60, 70, 'a')
+  assert tree.overlap(15, 16) is None
+  assert tree.overlap(65, 66) == 'a'
+  assert len(tree) == 2
+  check_max_end(tree.root)
+
+
+def test_interval_tree_finds_a_long_interval_under_short_ones():
+  tree = IntervalTree()
+  # show 100 spans a day of one hour shows, then the shows are cancelled
+  tree.add(0, 24, 100)
+  for hour in range(24):
+    tree.add(hour, hour + 1, hour)
+  for hour in range(24):
+    tree.remove(hour)
+  assert tree.overlap(23, 24) == 100
+  assert tree.overlap(24, 25) is None
+  check_max_end(tree.root)
+
+
+def test_overlaps_names_the_earlier_show_ending_last():
+  # (id, venue, start, end) in venue and start order
+  rows = [
+    (1, 1, 0, 100),
+    (2, 1, 10, 20),
+    (3, 1, 50, 60),
+    (4, 1, 100, 110),
+    (5, 1, 105, 120),
+    (6, 2, 0, 10),
+    (7, 2, 10, 20),
+  ]
+  assert list(overlaps(rows)) == [(rows[1], 1, 100), (rows[2], 1, 100), (rows[4], 4, 110)]
+
+
+def test_schedules_load_a_venue_again_when_its_version_changes():
+  # the shows table of another process: venue -> {show id: (start, end)}
+  shows = {1: {1: (10, 20)}, 2: {}}
+  loads = []
+  def load(venue):
+    loads.append(venue)
+    return [(start, end, id) for id, (start, end) in shows[venue].items()]
+  schedules = Schedules(load, lambda venue: len(shows[venue]))
+  assert schedules.conflict(1, 15, 16) == 1
+  assert schedules.conflict(1, 20, 30) is None
+  assert schedules.conflict(2, 15, 16) is None
+  assert loads == [1, 2]
+  # written elsewhere, without telling the schedules
+  shows[1][2] = (20, 30)
+  assert schedules.conflict(1, 25, 26) == 2
+  assert schedules.conflict(2, 25, 26) is None
+  assert loads == [1, 2, 1]
+  # booked and cancelled here, with the versions the writes left
+  shows[1][3] = (30, 40)
+  schedules.booked(1, 30, 40, 3, 3)
+  del shows[1][1]
+  schedules.cancelled(1, 1, 2)
+  assert schedules.conflict(1, 35, 36) == 3
+  assert schedules.conflict(1, 15, 16) is None
+  assert loads == [1, 2, 1]
+
+
+def test_schedules_book_keeps_pending_rows_until_the_shows_change():
+  shows = {}
+  schedules = Schedules(lambda venue: [(start, end, id) for id, (start, end) in shows.items()],
+                        lambda venue: len(shows))
+  assert schedules.book(1, 10, 20, -1) is None
+  assert schedules.book(1, 15, 25, -2) == -1
+  assert schedules.book(1, 20, 30, -3) is None
+  # the rows are inserted: the next check loads them under their ids
+  shows.update({7: (10, 20), 8: (20, 30)})
+  assert schedules.conflict(1, 12, 13) == 7
+  assert schedules.conflict(1, 30, 40) is None
+
+
+def book(client, venue_id, start_time, duration=''):
+  response = client.post('/shows/create', data={'artist_id': '1', 'venue_id': str(venue_id),
+                                                 'start_time': start_time, 'duration': duration})
+  body = response.get_data(as_text=True)
+  if 'successfully listed' in body:
+    return 'listed'
+  if 'already booked' in body:
+    return 'booked'
+  return 'error' if 'An error occurred' in body else body
+
+
+def test_bookings_of_this_process_load_the_venue_once(app, client, seed, monkeypatch):
+  import app as fyyur
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')], artists=['Guns N Petals'])
+  loads = []
+  load = fyyur.venue_schedules.load
+  monkeypatch.setattr(fyyur.venue_schedules, 'load', lambda venue_id: loads.append(venue_id) or load(venue_id))
+  assert book(client, 1, '2031-05-01 20:00') == 'listed'
+  assert book(client, 1, '2031-05-01 21:00') == 'booked'
+  assert book(client, 1, '2031-05-01 22:00', '30') == 'listed'
+  assert book(client, 1, '2031-05-01 22:15') == 'booked'
+  client.delete('/shows/1')
+  assert book(client, 1, '2031-05-01 20:00', '60') == 'listed'
+  assert loads == [1]
+
+
+def test_bookings_of_other_processes_are_checked(app, client, seed):
+  from app import Show, Venue, count_shows, db
+  from datetime import datetime
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')], artists=['Guns N Petals'])
+  assert book(client, 1, '2031-05-01 20:00') == 'listed'
+  # another process books 22:00 and later cancels 20:00, through count_shows
+  # like every write of the app
+  db.session.add(Show(artist_id=1, venue_id=1, start_time=datetime(2031, 5, 1, 22), end_time=datetime(2031, 5, 2)))
+  db.session.flush()
+  count_shows(1, Show.start_time == datetime(2031, 5, 1, 22))
+  db.session.commit()
+  assert book(client, 1, '2031-05-01 23:00') == 'booked'
+  count_shows(-1, Show.id == 1)
+  db.session.query(Show).filter(Show.id == 1).delete()
+  db.session.commit()
+  assert book(client, 1, '2031-05-01 20:00') == 'listed'
+
+
+def test_a_booking_made_elsewhere_after_the_check_is_caught(app, client, seed, monkeypatch):
+  import app as fyyur
+  from app import Show, count_shows, db
+  from datetime import datetime
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')], artists=['Guns N Petals'])
+  check = fyyur.booking_conflict
+  def racing_check(venue_id, start_time, end_time):
+    conflict = check(venue_id, start_time, end_time)
+    if not racing_check.raced:
+      racing_check.raced = True
+      # another process takes the slot between this check and the insert
+      with app.app_context():
+        other = db.session
+        other.add(Show(artist_id=1, venue_id=1, start_time=datetime(2031, 5, 1, 20), end_time=datetime(2031, 5, 1, 22)))
+        other.flush()
+        count_shows(1, Show.venue_id == 1)
+        other.commit()
+    return conflict
+  racing_check.raced = False
+  monkeypatch.setattr(fyyur, 'booking_conflict', racing_check)
+  assert book(client, 1, '2031-05-01 21:00') == 'booked'
+  assert db.session.query(Show).count() == 1
@@ -0,0 +1,83 @@
+import threading
+
+from suggest import PrefixIndex, normalize
+
+
+def test_normalize_keeps_lower_case_words():
+  assert normalize('The Musical Hop!') == 'the musical hop'
+  assert normalize('  St. Café  ') == 'st café'
+  assert normalize(None) == ''
+
+
+def test_prefix_index_finds_names_by_their_first_then_later_words():
+  index = PrefixIndex(['venue', 'artist'])
+  index.build([('venue', 1, 'The Musical Hop'), ('venue', 2, 'Park Square Live Music & Coffee'),
+               ('artist', 1, 'Guns N Petals'), ('artist', 2, 'The Wild Sax Band'), ('artist', 3, 'Musicland')])
+  assert index.search('the') == [('venue', 1, 'The Musical Hop'), ('artist', 2, 'The Wild Sax Band')]
+  # full names first, then names by a later word, each in key order
+  assert index.search('mus') == [('artist', 3, 'Musicland'), ('venue', 2, 'Park Square Live Music & Coffee'),
+                                 ('venue', 1, 'The Musical Hop')]
+  assert index.search('THE MUS') == [('venue', 1, 'The Musical Hop')]
+  assert index.search('the mus', limit=0) == []
+  assert index.search('p', limit=1) == [('venue', 2, 'Park Square Live Music & Coffee')]
+  assert index.search('') == index.search('!') == []
+
+
+def test_prefix_index_lists_equal_names_in_id_order():
+  index = PrefixIndex(['venue', 'artist'])
+  index.build([('venue', 3, 'Jazz!'), ('artist', 1, 'jazz')])
+  index.add('venue', 2, 'JAZZ')
+  index.add('artist', 4, 'Hot Jazz')
+  assert index.search('jazz') == [('artist', 1, 'jazz'), ('venue', 2, 'JAZZ'), ('venue', 3, 'Jazz!'),
+                                  ('artist', 4, 'Hot Jazz')]
+  # renamed and removed rows leave no keys behind
+  index.add('venue', 2, 'Blues')
+  index.remove('venue', 3)
+  index.remove('venue', 9)
+  assert index.search('jazz') == [('artist', 1, 'jazz'), ('artist', 4, 'Hot Jazz')]
+  assert index.search('blu') == [('venue', 2, 'Blues')]
+  assert len(index) == 3
+
+
+def test_prefix_index_ignores_writes_before_build():
+  index = PrefixIndex(['venue'])
+  index.add('venue', 1, 'The Musical Hop')
+  index.remove('venue', 2)
+  assert index.search('hop') == []
+  index.build([('venue', 1, 'The Musical Hop')])
+  assert index.search('hop') == [('venue', 1, 'The Musical Hop')]
+
+
+VENUE_FORM = {'name': 'The Dueling Pianos Bar', 'city': 'New York', 'state': 'NY', 'address': '335 Delancey Street',
+              'phone': '914-003-1132', 'image_link': '', 'facebook_link': ''}
+
+
+def suggested(client, q):
+  return [match['name'] for match in client.get('/search/suggest', query_string={'q': q}).json]
+
+
+def test_suggest_sees_writes_of_this_process_without_a_rebuild(app, client, seed):
+  import app as fyyur
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')], artists=['Guns N Petals'])
+  assert suggested(client, 'hop') == ['The Musical Hop']
+  client.post('/venues/create', data=VENUE_FORM)
+  assert suggested(client, 'dueling') == ['The Dueling Pianos Bar']
+  client.post('/venues/create', data=dict(VENUE_FORM, name='Park Square Live'))
+  assert suggested(client, 'park') == ['Park Square Live']
+  # the handlers took the versions their writes left
+  assert fyyur.name_index not in fyyur.index_rebuilds
+
+
+def test_suggest_rebuilds_for_writes_of_other_processes_off_the_request(app, client, seed, monkeypatch):
+  import app as fyyur
+  # rebuilds wait for the test to let them run
+  release, rebuild = threading.Event(), fyyur.rebuild_index
+  monkeypatch.setattr(fyyur, 'rebuild_index', lambda *args: release.wait(10) and rebuild(*args))
+  seed(venues=[('The Musical Hop', 'San Francisco', 'CA')])
+  assert suggested(client, 'hop') == ['The Musical Hop']
+  seed(artists=['Matt Quevedo'])
+  # served from the index as it was, while a thread rebuilds it
+  assert suggested(client, 'matt') == []
+  release.set()
+  fyyur.index_rebuilds[fyyur.name_index].join(10)
+  assert suggested(client, 'matt') == ['Matt Quevedo']